@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Checks that the features of lines computed in memory by classify_server (prepare.online_features) are the same as
+# the ones prepared by the scripts of the pipeline on a synthetic code base: bag of words and manual features merged
+# by merge_inputs, the block features of a configuration file (each one computed from the features merged with
+# the previous ones, as in pipeline.json) and the context of lines (add_seq_context)
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# the logger of pyccflex is set up by pipeline_benchmark
+from pipeline_benchmark import MANUAL_FEATURE_EXTRACTORS, logger, prepare_scale, root_dir, script_env
+
+sys.path.insert(0, root_dir)
+from ccflex import COMMANDS_SEPARATOR
+from ccflex.classify_server import bag_of_words_extractor
+from common.configuration import ConfigurationHandler
+from common.incremental import NON_FEATURE_COLUMNS
+from common.storage import read_features, existing_features_file_path
+from prepare.block_features import file_names_of
+from prepare.feature_extractors import manual_features_extractors
+from prepare.online_features import OnlineFeaturesBuilder
+
+MIN_NGRAM = 1
+MAX_NGRAM = 3
+
+
+def pipeline_commands(block_features, prev_cases, next_cases):
+    """Returns the commands (lists of a name and arguments) preparing the features of the classified lines."""
+    commands = [["create_workspace"],
+                ["copy_builtin_training_file", "base-cpp-vocabulary.csv"],
+                ["lines2csv", "train"],
+                ["lines2csv", "classify"],
+                ["vocabulary_extractor", "train-lines.csv", "cpp-vocabulary.csv", "--skip_generating_base_vocabulary",
+                 "--top_words_threshold", "200", "--token_signature_for_missing", "--min_ngrams", str(MIN_NGRAM),
+                 "--max_ngrams", str(MAX_NGRAM)],
+                ["predefined_manual_features", "classify", "--extractors"] + MANUAL_FEATURE_EXTRACTORS +
+                ["--add_contents"],
+                ["bag_of_words", "classify", "cpp-vocabulary.csv", "--min_ngrams", str(MIN_NGRAM), "--max_ngrams",
+                 str(MAX_NGRAM), "--token_signature_for_missing", "--add_contents"],
+                ["merge_inputs", "--input_files", "classify-bag-of-words.csv", "classify-manual.csv",
+                 "--output_file", "classify-features-0.csv", "--add_contents"]]
+    for i, block_feature in enumerate(block_features):
+        block_file = "classify-{}.csv".format(block_feature['name'])
+        forbidding_features = block_feature.get('forbidding_features', [])
+        commands.append(["extract_block_features_from_features", "classify-features-{}.csv".format(i), block_file,
+                         block_feature['name'], "--feature_start"] + block_feature['feature_start'] +
+                        ["--feature_end"] + block_feature['feature_end'] + ["--add_contents"] +
+                        (["--forbidding_features"] + forbidding_features if len(forbidding_features) > 0 else []))
+        commands.append(["merge_inputs", "--input_files", "classify-features-{}.csv".format(i), block_file,
+                         "--output_file", "classify-features-{}.csv".format(i + 1), "--add_contents"])
+    commands.append(["add_seq_context", "classify-features-{}.csv".format(len(block_features)),
+                     "classify-context.csv", "--prev_cases", str(prev_cases), "--next_cases", str(next_cases),
+                     "--add_contents"])
+    return commands
+
+
+def run_pipeline_commands(scale_dir, commands, log_file):
+    """Runs the commands chained in one ccflex process."""
+    args = [sys.executable, os.path.join(root_dir, "bin", "ccflex")]
+    for i, command in enumerate(commands):
+        args.extend(([COMMANDS_SEPARATOR] if i > 0 else []) + command)
+    returncode = subprocess.call(args, cwd=scale_dir, env=script_env(), stdout=log_file, stderr=subprocess.STDOUT)
+    if returncode != 0:
+        raise Exception("The pipeline failed (see {})".format(log_file.name))
+
+
+def online_features_builder(scale_dir, block_features, prev_cases, next_cases):
+    """Returns the features builder configured the same way as by classify_server."""
+    separator = ConfigurationHandler(os.path.join(scale_dir, "files_format.json")).get("csv_sep", ",")
+    processing_dir = os.path.join(scale_dir, "workspace", "processing")
+    extractors = [bag_of_words_extractor(os.path.join(processing_dir, "cpp-vocabulary.csv"),
+                                         os.path.join(processing_dir, "base-cpp-vocabulary.csv"), separator,
+                                         MIN_NGRAM, MAX_NGRAM, True)]
+    extractors.extend(manual_features_extractors(MANUAL_FEATURE_EXTRACTORS,
+                                                 ConfigurationHandler(os.path.join(scale_dir,
+                                                                                   "manual_features.json"))))
+    return OnlineFeaturesBuilder(extractors, block_features=block_features, prev_cases=prev_cases,
+                                 next_cases=next_cases)
+
+
+def compare_features(scale_dir, features_builder):
+    """
+    Returns the number of lines, the numbers of lines with different values of the columns which differ
+    (a dictionary) and the number of lines with any different value.
+    """
+    separator = ConfigurationHandler(os.path.join(scale_dir, "files_format.json")).get("csv_sep", ",")
+    processing_dir = os.path.join(scale_dir, "workspace", "processing")
+    lines_df = read_features(os.path.join(processing_dir, "classify-lines.csv"), sep=separator,
+                             columns=['id', 'contents'], dtype={'id': str, 'contents': str}, keep_default_na=False)
+    expected_df = read_features(existing_features_file_path(os.path.join(processing_dir, "classify-context.csv")),
+                                sep=separator, dtype={'id': str}, keep_default_na=False)
+    if lines_df['id'].tolist() != expected_df['id'].tolist():
+        raise Exception("The lines of the features file differ from the lines of classify-lines.csv")
+
+    columns = [x for x in expected_df.columns if x not in NON_FEATURE_COLUMNS]
+    missing = features_builder.missing_columns(columns)
+    if len(missing) > 0:
+        raise Exception("The features builder doesn't have the columns: {}".format(", ".join(missing[:5])))
+    actual = features_builder.features(lines_df['contents'].tolist(), file_names_of(lines_df['id']),
+                                       columns).to_numpy()
+    expected = expected_df[columns].to_numpy(dtype=np.float64)
+    different = ~np.isclose(actual, expected)
+    return len(lines_df), dict((column, int(count)) for column, count in zip(columns, different.sum(axis=0))
+                               if count > 0), int(different.any(axis=1).sum())
+
+
+if __name__ == '__main__':
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--block_features_config", help="Path to a json file with the list of block features "
+                                                        "(the \"block_features\" key, see classify_server)",
+                        type=str, required=False, default=os.path.join(root_dir, "block_features.json"))
+    parser.add_argument("--scale", help="Number of lines of the generated code bases",
+                        type=int, required=False, default=10 ** 3)
+    parser.add_argument("--prev_cases", help="The number of preceding cases (see add_seq_context)",
+                        default=1, type=int)
+    parser.add_argument("--next_cases", help="The number of proceeding cases (see add_seq_context)",
+                        default=1, type=int)
+    parser.add_argument("--work_dir", help="A folder for the code bases and the workspace (by default a temporary "
+                                           "folder removed at the end)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--seed", help="The seed of the generator of code bases",
+                        type=int, required=False, default=0)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+
+    block_features = ConfigurationHandler(args['block_features_config']).get("block_features", [])
+    prev_cases = args['prev_cases']
+    next_cases = args['next_cases']
+
+    work_dir = args['work_dir']
+    temporary_work_dir = work_dir is None
+    if temporary_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="pyccflex-check-")
+    elif os.path.exists(work_dir):
+        logger.error("The folder {} already exists".format(work_dir))
+        exit(1)
+    else:
+        os.makedirs(work_dir)
+
+    try:
+        scale_dir = os.path.join(work_dir, "pipeline")
+        prepare_scale(scale_dir, args['scale'], args['seed'])
+        with open(os.path.join(work_dir, "check.log"), "w") as log_file:
+            logger.info(">>> Preparing the features by the scripts of the pipeline")
+            run_pipeline_commands(scale_dir, pipeline_commands(block_features, prev_cases, next_cases), log_file)
+
+        logger.info(">>> Computing the features in memory")
+        features_builder = online_features_builder(scale_dir, block_features, prev_cases, next_cases)
+        no_lines, different_columns, no_different_lines = compare_features(scale_dir, features_builder)
+    finally:
+        if temporary_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for column, count in sorted(different_columns.items(), key=lambda x: -x[1])[:20]:
+        logger.info(">>> {:<45} {:>9} lines differ".format(column, count))
+    logger.info(">>> The same features of {}/{} lines".format(no_lines - no_different_lines, no_lines))
+    if no_different_lines > 0:
+        exit(1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Compares the throughput (lines/sec) of the separate pattern extractors and the compiled one
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.configuration import ConfigurationHandler
+from common.storage import read_features
+from prepare.feature_extractors import SubstringCountingFeatureExtraction, WholeWordCountingFeatureExtraction, \
+    TokenizedWholeWordCountingFeatureExtraction, RegexpCountingFeatureExtraction, CompiledPatternFeatureExtraction
+
+logger = logging.getLogger('pyccflex')
+logger.setLevel(logging.DEBUG)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def extract_all(extractors, lines):
+    result = []
+    for line in lines:
+        features = {}
+        for extractor in extractors:
+            features.update(extractor.extract(line))
+        result.append(features)
+    return result
+
+
+def measure(extractors, lines, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = extract_all(extractors, lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best, result
+
+
+if __name__ == '__main__':
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines_file", help="A lines csv file (e.g., produced by lines2csv)",
+                        type=str, required=False,
+                        default=os.path.join(root_dir, "data", "cpp-comments-train-lines.csv"))
+    parser.add_argument("--manual_features_config", help="Path to manual features configuration file",
+                        type=str, required=False, default=os.path.join(root_dir, "manual_features.json"))
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default=os.path.join(root_dir, "files_format.json"))
+    parser.add_argument("--min_lines", help="The lines are repeated until there is at least this number of them",
+                        type=int, required=False, default=10 ** 4)
+    parser.add_argument("--repeat", help="How many times to repeat the measurement (the best time is reported)",
+                        type=int, required=False, default=3)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+
+    manual_features_config = ConfigurationHandler(args['manual_features_config'])
+    files_format_config = ConfigurationHandler(args['files_format_config'])
+    separator = files_format_config.get("csv_sep", ",")
+
+    lines = read_features(args['lines_file'], sep=separator, columns=['contents'], dtype={'contents': str},
+                          keep_default_na=False)['contents'].tolist()
+    if len(lines) == 0:
+        logger.error("No lines in the file {}".format(args['lines_file']))
+        exit(1)
+    while len(lines) < args['min_lines']:
+        lines = lines + lines
+
+    string_features = manual_features_config.get('manual_string_counting_features', [])
+    whole_word_features = manual_features_config.get('manual_whole_word_counting_features', [])
+    regexp_features = manual_features_config.get('regexp_counting_features', [])
+
+    legacy_extractors = [SubstringCountingFeatureExtraction(string_features),
+                         WholeWordCountingFeatureExtraction(whole_word_features),
+                         TokenizedWholeWordCountingFeatureExtraction(whole_word_features),
+                         RegexpCountingFeatureExtraction(regexp_features)]
+    compiled_extractors = [CompiledPatternFeatureExtraction(string_features, whole_word_features,
+                                                            whole_word_features, regexp_features)]
+
+    logger.info(">>> Measuring {} lines".format(len(lines)))
+    legacy_speed, legacy_result = measure(legacy_extractors, lines, args['repeat'])
+    compiled_speed, compiled_result = measure(compiled_extractors, lines, args['repeat'])
+
+    if legacy_result != compiled_result:
+        logger.error("The compiled extractor returned different counts than the separate extractors")
+        exit(1)
+
+    logger.info(">>> Separate extractors: {:.0f} lines/sec".format(legacy_speed))
+    logger.info(">>> Compiled extractor: {:.0f} lines/sec".format(compiled_speed))
+    logger.info(">>> Speedup: {:.2f}x".format(compiled_speed / legacy_speed))
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+# Times the stages of the pipeline on synthetic code bases of several sizes and appends the results (time, throughput
+# and peak memory of each stage) to a csv file, so they can be compared between commits (the scripts of another
+# checkout can be measured with --root_dir; options and scripts it doesn't have are skipped)
+
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import re
+
+import pandas as pd
+
+from synthetic_corpus import generate_corpus
+
+logger = logging.getLogger('pyccflex')
+logger.setLevel(logging.DEBUG)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+
+root_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+CONFIG_FILES = ["classes.json", "files_format.json", "manual_features.json"]
+# the model is trained with a fixed random state, so the time of training doesn't vary between runs
+CLASSIFIERS_OPTIONS = {"CART": {"criterion": "gini", "max_depth": 5, "class_weight": "balanced", "random_state": 0}}
+MANUAL_FEATURE_EXTRACTORS = ["PatternSubstringExctractor", "PatternWordExtractor", "WholeLineCommentFeatureExtraction",
+                             "NoWordsExtractor", "NoCharsExtractor"]
+
+# (name, script, arguments, code bases whose lines are processed); the stages needed by the measured ones are run
+# as well, all of them are recorded
+STAGES = [("create_workspace", "create_workspace", [], []),
+          ("copy_builtin_training_file", "copy_builtin_training_file", ["base-cpp-vocabulary.csv"], []),
+          ("lines2csv-train", "lines2csv", ["train"], ["train"]),
+          ("lines2csv-classify", "lines2csv", ["classify"], ["classify"]),
+          ("tokenize_lines-train", "tokenize_lines", ["train-lines.csv"], ["train"]),
+          ("tokenize_lines-classify", "tokenize_lines", ["classify-lines.csv"], ["classify"]),
+          ("vocabulary_extractor", "vocabulary_extractor",
+           ["train-lines.csv", "cpp-vocabulary.csv", "--skip_generating_base_vocabulary", "--top_words_threshold",
+            "200", "--token_signature_for_missing", "--min_ngrams", "1", "--max_ngrams", "2"], ["train"])]
+for location, add_decision_class in [("train", ["--add_decision_class"]), ("classify", [])]:
+    STAGES.extend([
+        ("predefined_manual_features-" + location, "predefined_manual_features",
+         [location, "--extractors"] + MANUAL_FEATURE_EXTRACTORS + add_decision_class + ["--add_contents"], [location]),
+        ("bag_of_words-" + location, "bag_of_words",
+         [location, "cpp-vocabulary.csv", "--min_ngrams", "1", "--max_ngrams", "2", "--token_signature_for_missing",
+          "--chunk_size", "10000", "--add_contents"] + add_decision_class, [location]),
+        ("merge_inputs-" + location, "merge_inputs",
+         ["--input_files", location + "-bag-of-words.csv", location + "-manual.csv", "--output_file",
+          location + "-features-base.csv", "--add_contents"] + add_decision_class, [location]),
+        ("extract_block_features_from_features-" + location, "extract_block_features_from_features",
+         [location + "-features-base.csv", location + "-comments.csv", "block_comment", "--feature_start", "/ *",
+          "--feature_end", "* /", "--add_contents"], [location]),
+        ("merge_inputs-comments-" + location, "merge_inputs",
+         ["--input_files", location + "-features-base.csv", location + "-comments.csv", "--output_file",
+          location + "-features.csv", "--add_contents"] + add_decision_class, [location]),
+        ("add_seq_context-" + location, "add_seq_context",
+         [location + "-features.csv", location + "-context.csv", "--prev_cases", "1", "--next_cases", "1",
+          "--add_contents"] + add_decision_class, [location])])
+STAGES.extend([("classify", "classify", ["train-context.csv", "classify-context.csv", "--classifier", "CART",
+                                         "--chunk_size", "20000"], ["train", "classify"]),
+               ("lines_oracle", "lines_oracle", ["classify-features.csv", "classify-output-oracle.csv", "--oracle",
+                                                 "define", "--add_contents"], ["classify"])])
+
+MEASURED_SCRIPTS = ["lines2csv", "tokenize_lines", "vocabulary_extractor", "bag_of_words",
+                    "predefined_manual_features", "add_seq_context", "merge_inputs", "classify", "lines_oracle"]
+
+RESULTS_COLUMNS = ["commit", "timestamp", "host", "python", "scale", "stage", "script", "lines", "seconds",
+                   "cpu_seconds", "peak_rss_mb", "lines_per_second", "rows_in", "rows_out", "output_bytes",
+                   "workers"]
+
+# the generated files are small, so even the smallest code bases have enough files to be processed in parallel
+LINES_PER_FILE = 50
+
+OPTION_RE = re.compile(r"(?<![\w-])--[a-z][a-z0-9_]*")
+
+_supported_options = {}
+
+
+def current_commit():
+    """Returns the hash of the checked out commit (with the suffix -dirty if there are changes) or unknown."""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root_dir,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root_dir,
+                                          stderr=subprocess.DEVNULL, text=True).strip()
+        return commit + "-dirty" if len(changes) > 0 else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def script_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = root_dir + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def supported_options(script):
+    """Returns the options of a script of the measured checkout (read from its --help) or None if it doesn't exist."""
+    if script not in _supported_options:
+        script_path = os.path.join(root_dir, "bin", script)
+        options = None
+        if os.path.isfile(script_path):
+            process = subprocess.run([sys.executable, script_path, "--help"], env=script_env(),
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            options = set(OPTION_RE.findall(process.stdout))
+        _supported_options[script] = options
+    return _supported_options[script]
+
+
+def stage_args(script, args, workers):
+    """
+    Returns the arguments of a stage without the options the script of the measured checkout doesn't have
+    (with their values), so earlier commits can be measured as well; --workers is added if the script has it.
+    """
+    options = supported_options(script)
+    result = []
+    skipped = False
+    for arg in args:
+        if arg.startswith("--"):
+            skipped = arg not in options
+            if skipped:
+                logger.warning(">>> The option {} is not supported by {} and is skipped".format(arg, script))
+        if not skipped:
+            result.append(arg)
+    if workers > 1 and "--workers" in options:
+        result.extend(["--workers", str(workers)])
+    return result
+
+
+def prepare_scale(scale_dir, scale, seed, lines_per_file=LINES_PER_FILE):
+    """Generates the training and classified code bases and the configuration files; returns the numbers of lines."""
+    os.makedirs(scale_dir)
+    no_lines = {}
+    for location, location_seed in [("train", seed), ("classify", seed + 1)]:
+        no_files, no_lines[location] = generate_corpus(os.path.join(scale_dir, "code", location), scale,
+                                                       seed=location_seed, mean_lines_per_file=lines_per_file)
+        logger.info(">>> Generated {} lines in {} files of the {} code base".format(no_lines[location], no_files,
+                                                                                   location))
+    for config_file in CONFIG_FILES:
+        shutil.copy(os.path.join(root_dir, config_file), os.path.join(scale_dir, config_file))
+    with open(os.path.join(scale_dir, "classifiers_options.json"), "w") as options_file:
+        json.dump(CLASSIFIERS_OPTIONS, options_file, indent=2)
+    locations = {"workspace_dir": {"path": os.path.join(scale_dir, "workspace"), "erase": True}}
+    for location in ["train", "classify"]:
+        code_dir = os.path.join(scale_dir, "code", location)
+        locations[location] = {"baseline_dir": code_dir,
+                               "locations": [{"path": code_dir, "include": [".+[.]cpp$", ".+[.]c$", ".+[.]h$"],
+                                              "exclude": []}]}
+    with open(os.path.join(scale_dir, "locations.json"), "w") as locations_file:
+        json.dump(locations, locations_file, indent=2)
+    return no_lines
+
+
+def run_stage(scale_dir, script, args, log_file):
+    """
+    Runs a script in a separate process (so its memory is measured separately) with the instrumentation enabled.
+    Returns the wall time, CPU time, peak RSS (MB) and the instrumentation record of the run (None if missing).
+    """
+    env = script_env()
+    env["PYCCFLEX_INSTRUMENTATION"] = "1"
+    report_file_path = os.path.join(scale_dir, "workspace", "reports", "instrumentation.json")
+    no_records = len(_read_records(report_file_path))
+
+    start = time.time()
+    process = subprocess.Popen([sys.executable, os.path.join(root_dir, "bin", script)] + args, cwd=scale_dir,
+                               env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    # the resource usage of this process only (resource.RUSAGE_CHILDREN would give the maximum of all of them)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise Exception("The script {} exited with the code {} (see {})".format(script, process.returncode,
+                                                                               log_file.name))
+    records = _read_records(report_file_path)
+    return seconds, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 2 ** 10, \
+        records[no_records] if len(records) > no_records else None
+
+
+def _read_records(report_file_path):
+    if not os.path.isfile(report_file_path):
+        return []
+    with open(report_file_path) as report_file:
+        return json.load(report_file)
+
+
+def benchmark_scale(scale_dir, scale, seed, lines_per_file, workers, stages, run_info):
+    """Runs all stages for the code bases of the given size; returns the rows of results of the measured stages."""
+    no_lines = prepare_scale(scale_dir, scale, seed, lines_per_file)
+    results = []
+    with open(os.path.join(scale_dir, "benchmark.log"), "w") as log_file:
+        for name, script, args, locations in STAGES:
+            if supported_options(script) is None:
+                logger.warning(">>> The script {} doesn't exist, the stage {} is skipped".format(script, name))
+                continue
+            seconds, cpu_seconds, peak_rss_mb, record = run_stage(scale_dir, script,
+                                                                  stage_args(script, args, workers), log_file)
+            lines = sum(no_lines[location] for location in locations)
+            logger.info(">>> {:<45} {:>9.2f}s {:>12.0f} lines/s {:>9.1f} MB".format(
+                name, seconds, lines / seconds if lines > 0 else 0, peak_rss_mb))
+            if script not in stages:
+                continue
+            results.append(dict(run_info, scale=scale, stage=name, script=script, lines=lines, seconds=seconds,
+                                cpu_seconds=cpu_seconds, peak_rss_mb=peak_rss_mb,
+                                lines_per_second=lines / seconds if lines > 0 else None,
+                                rows_in=None if record is None else record['rows_in'],
+                                rows_out=None if record is None else record['rows_out'],
+                                output_bytes=None if record is None else record['output_bytes'],
+                                workers=workers))
+    return results
+
+
+def save_results(results, results_file_path):
+    new_file = not os.path.isfile(results_file_path)
+    if not new_file and list(pd.read_csv(results_file_path, nrows=0).columns) != RESULTS_COLUMNS:
+        # the results saved by an earlier version of the benchmark get the new columns
+        pd.read_csv(results_file_path).reindex(columns=RESULTS_COLUMNS).to_csv(results_file_path, index=False)
+    with open(results_file_path, "a", newline='', encoding="utf-8") as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=RESULTS_COLUMNS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(results)
+
+
+def compare_results(results_file_path, commit, baseline_commit):
+    """Prints the times of stages of the commit relative to the baseline commit (the latest runs of both)."""
+    results = pd.read_csv(results_file_path)
+    latest = results.groupby(["commit", "scale", "stage"], sort=False).last().reset_index()
+    current = latest[latest.commit == commit].set_index(["scale", "stage"])
+    baseline = latest[latest.commit == baseline_commit].set_index(["scale", "stage"])
+    if len(baseline) == 0:
+        logger.error("No results of the commit {} in {}".format(baseline_commit, results_file_path))
+        return
+    comparison = pd.DataFrame({"baseline_seconds": baseline.seconds, "seconds": current.seconds,
+                               "speedup": baseline.seconds / current.seconds,
+                               "baseline_peak_rss_mb": baseline.peak_rss_mb,
+                               "peak_rss_mb": current.peak_rss_mb}).dropna()
+    print(comparison.to_string(float_format="%.2f"))
+
+
+if __name__ == '__main__':
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", help="Numbers of lines of the generated code bases (from 1k to 10M)",
+                        type=int, nargs='+', required=False, default=[10 ** 3, 10 ** 4, 10 ** 5])
+    parser.add_argument("--stages", help="Scripts whose stages are recorded (the stages they need are run anyway)",
+                        type=str, nargs='+', choices=MEASURED_SCRIPTS, required=False, default=MEASURED_SCRIPTS)
+    parser.add_argument("--results_file", help="A csv file the results are appended to",
+                        type=str, required=False, default="./pipeline-benchmark.csv")
+    parser.add_argument("--work_dir", help="A folder for the code bases and workspaces (by default a temporary "
+                                           "folder removed at the end)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--seed", help="The seed of the generator of code bases",
+                        type=int, required=False, default=0)
+    parser.add_argument("--lines_per_file", help="The mean number of lines of generated files",
+                        type=int, required=False, default=LINES_PER_FILE)
+    parser.add_argument("--workers", help="Number of processes used by the stages having the --workers option",
+                        type=int, required=False, default=1)
+    parser.add_argument("--root_dir", help="The checkout of pyccflex whose scripts are measured (by default the one "
+                                           "containing this benchmark), e.g., a git worktree of an earlier commit",
+                        type=str, required=False, default=None)
+    parser.add_argument("--compare_with", help="A commit whose results (from the results file) are compared "
+                                               "with the results of this run",
+                        type=str, required=False, default=None)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+    if args['root_dir'] is not None:
+        root_dir = os.path.abspath(args['root_dir'])
+
+    work_dir = args['work_dir']
+    temporary_work_dir = work_dir is None
+    if temporary_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="pyccflex-benchmark-")
+    elif os.path.exists(work_dir):
+        logger.error("The folder {} already exists".format(work_dir))
+        exit(1)
+
+    run_info = {"commit": current_commit(),
+                "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+                "host": platform.node(),
+                "python": platform.python_version()}
+    try:
+        for scale in args['scales']:
+            logger.info(">>> Benchmarking code bases of {} lines".format(scale))
+            results = benchmark_scale(os.path.join(work_dir, "scale-{}".format(scale)), scale, args['seed'],
+                                      args['lines_per_file'], args['workers'], args['stages'], run_info)
+            # results are saved after each scale, so they are kept if a larger one runs out of memory
+            save_results(results, args['results_file'])
+    finally:
+        if temporary_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    logger.info(">>> Results saved to the file {}".format(args['results_file']))
+    if args['compare_with'] is not None:
+        compare_results(args['results_file'], run_info['commit'], args['compare_with'])
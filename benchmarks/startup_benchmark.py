@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Compares the time of running commands as separate scripts (a python process each, importing its libraries and
+# reading configuration files again) with running them chained in a single ccflex process: the start-up of each
+# command (--help) and the stages of the pipeline on a small synthetic code base. With --baseline_root_dir the
+# start-up of the separate scripts is compared with the scripts of another checkout (e.g., of an earlier commit)
+# and the benchmark fails if any of them got slower
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# the logger of pyccflex is set up by pipeline_benchmark
+from pipeline_benchmark import STAGES, logger, prepare_scale, root_dir
+
+sys.path.insert(0, root_dir)
+from ccflex import COMMANDS, COMMANDS_SEPARATOR
+
+# a slowdown of a script against the baseline smaller than this is within the noise of starting a process
+NOISE_SECONDS = 0.05
+
+
+def run(args, cwd, log_file, root=root_dir):
+    """Runs python with the arguments (modules of the root checkout); returns the wall time or None if it failed."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+    start = time.time()
+    returncode = subprocess.call([sys.executable] + args, cwd=cwd, env=env, stdout=log_file,
+                                 stderr=subprocess.STDOUT)
+    seconds = time.time() - start
+    return seconds if returncode == 0 else None
+
+
+def chained(commands):
+    """Returns the arguments of ccflex running the commands (lists of a name and arguments) one after another."""
+    args = [os.path.join(root_dir, "bin", "ccflex")]
+    for i, command in enumerate(commands):
+        args.extend(([COMMANDS_SEPARATOR] if i > 0 else []) + command)
+    return args
+
+
+def benchmark_startup(work_dir, commands, log_file):
+    """Returns the times of printing help of the commands: by separate scripts (a dictionary) and by one process."""
+    separate = {}
+    for command in commands:
+        seconds = run([os.path.join(root_dir, "bin", command), "--help"], work_dir, log_file)
+        if seconds is None:
+            logger.warning(">>> The command {} failed (missing dependencies?) and is skipped".format(command))
+            continue
+        separate[command] = seconds
+        logger.info(">>> {:<45} {:>9.2f}s".format(command, seconds))
+    single = run(chained([[command, "--help"] for command in separate]), work_dir, log_file)
+    return separate, single
+
+
+def compare_startup(work_dir, commands, baseline_root_dir, repeat, log_file):
+    """
+    Returns the times of printing help of the commands as separate scripts of this checkout and of the baseline one
+    (dictionaries, the best of repeat runs; the commands missing or failing in any of the checkouts are skipped).
+    """
+    current = {}
+    baseline = {}
+    for command in commands:
+        times = {root_dir: [], baseline_root_dir: []}
+        # the runs of both checkouts are interleaved, so a change of the load of the machine affects both of them
+        for i in range(repeat):
+            for root in times:
+                script_path = os.path.join(root, "bin", command)
+                if os.path.isfile(script_path):
+                    times[root].append(run([script_path, "--help"], work_dir, log_file, root=root))
+        if any(len(x) == 0 or None in x for x in times.values()):
+            logger.warning(">>> The command {} is missing or failed in one of the checkouts and is skipped".format(
+                command))
+            continue
+        current[command] = min(times[root_dir])
+        baseline[command] = min(times[baseline_root_dir])
+        logger.info(">>> {:<45} {:>9.2f}s {:>9.2f}s (baseline)".format(command, current[command],
+                                                                      baseline[command]))
+    return current, baseline
+
+
+def benchmark_pipeline(scale_dir, scale, seed, log_file):
+    """Returns the times of running the stages of the pipeline: by separate scripts (a list) and by one process."""
+    prepare_scale(scale_dir, scale, seed)
+    separate = []
+    for name, script, args, locations in STAGES:
+        seconds = run([os.path.join(root_dir, "bin", script)] + args, scale_dir, log_file)
+        if seconds is None:
+            raise Exception("The stage {} failed (see {})".format(name, log_file.name))
+        separate.append(seconds)
+        logger.info(">>> {:<45} {:>9.2f}s".format(name, seconds))
+    # the workspace is erased by create_workspace, the first stage
+    single = run(chained([[script] + args for name, script, args, locations in STAGES]), scale_dir, log_file)
+    if single is None:
+        raise Exception("The chained stages failed (see {})".format(log_file.name))
+    return separate, single
+
+
+if __name__ == '__main__':
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", help="Commands whose start-up is measured",
+                        type=str, nargs='+', choices=COMMANDS, required=False, default=COMMANDS)
+    parser.add_argument("--scale", help="Number of lines of the generated code bases the pipeline is run on "
+                                        "(0 - the pipeline is not run)",
+                        type=int, required=False, default=10 ** 3)
+    parser.add_argument("--work_dir", help="A folder for the code bases and workspaces (by default a temporary "
+                                           "folder removed at the end)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--seed", help="The seed of the generator of code bases",
+                        type=int, required=False, default=0)
+    parser.add_argument("--baseline_root_dir", help="A checkout of the baseline (e.g., made by git worktree add) "
+                                                    "whose scripts are compared with the ones of this checkout",
+                        type=str, required=False, default=None)
+    parser.add_argument("--repeat", help="The number of runs of each script compared with the baseline (the best "
+                                         "time is compared)",
+                        type=int, required=False, default=5)
+    parser.add_argument("--max_regression", help="The maximum slowdown of a script against the baseline, e.g., "
+                                                 "0.1 - 10%%",
+                        type=float, required=False, default=0.1)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+
+    work_dir = args['work_dir']
+    temporary_work_dir = work_dir is None
+    if temporary_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="pyccflex-benchmark-")
+    elif os.path.exists(work_dir):
+        logger.error("The folder {} already exists".format(work_dir))
+        exit(1)
+    else:
+        os.makedirs(work_dir)
+
+    regressions = []
+    try:
+        with open(os.path.join(work_dir, "benchmark.log"), "w") as log_file:
+            if args['baseline_root_dir'] is not None:
+                logger.info(">>> Start-up of separate scripts (--help) compared with {}".format(
+                    args['baseline_root_dir']))
+                current, baseline = compare_startup(work_dir, args['commands'],
+                                                    os.path.abspath(args['baseline_root_dir']), args['repeat'],
+                                                    log_file)
+                regressions = [x for x in current
+                               if current[x] > baseline[x] * (1 + args['max_regression']) + NOISE_SECONDS]
+                logger.info(">>> {} commands: {:.2f}s, {:.2f}s in the baseline".format(
+                    len(current), sum(current.values()), sum(baseline.values())))
+
+            logger.info(">>> Start-up of commands (--help)")
+            separate, single = benchmark_startup(work_dir, args['commands'], log_file)
+            logger.info(">>> {} commands: {:.2f}s as separate scripts, {:.2f}s in one ccflex process".format(
+                len(separate), sum(separate.values()), single))
+
+            if args['scale'] > 0:
+                logger.info(">>> Stages of the pipeline on code bases of {} lines".format(args['scale']))
+                separate_stages, single_stages = benchmark_pipeline(os.path.join(work_dir, "pipeline"),
+                                                                    args['scale'], args['seed'], log_file)
+                logger.info(">>> {} stages: {:.2f}s as separate scripts, {:.2f}s in one ccflex process".format(
+                    len(separate_stages), sum(separate_stages), single_stages))
+    finally:
+        if temporary_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if len(regressions) > 0:
+        logger.error(">>> The start-up of the commands is slower than in the baseline: {}".format(
+            ", ".join(regressions)))
+        exit(1)
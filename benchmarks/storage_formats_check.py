@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Checks that the pipeline gives the same results whatever the storage format of features files is: the stages of
+# pipeline_benchmark (up to classify and lines_oracle) and lines_oracle with several oracles in worker processes are
+# run on the same synthetic code base with each format and their results files are compared with the ones of csv
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# the logger of pyccflex is set up by pipeline_benchmark
+from pipeline_benchmark import STAGES, logger, prepare_scale, root_dir
+from startup_benchmark import chained, run
+
+sys.path.insert(0, root_dir)
+from common.storage import STORAGE_FORMATS
+
+# the multi-oracle pass of lines_oracle (in worker processes, a file per oracle)
+ORACLES_COMMAND = ["lines_oracle", "classify-features.csv", "classify-output-oracles.csv", "--oracle", "define",
+                   "enum_class", "one_statement_in_line", "len_max_120chars", "--add_contents", "--workers", "2",
+                   "--files_per_chunk", "5"]
+
+
+def run_with_format(scale_dir, scale, seed, storage_format, log_file):
+    """Runs the stages on a code base with the features files stored in the format; returns the results folder."""
+    prepare_scale(scale_dir, scale, seed)
+    files_format_path = os.path.join(scale_dir, "files_format.json")
+    with open(files_format_path) as files_format_file:
+        files_format = json.load(files_format_file)
+    files_format["storage_format"] = storage_format
+    with open(files_format_path, "w") as files_format_file:
+        json.dump(files_format, files_format_file, indent=2)
+
+    commands = [[script] + args for name, script, args, locations in STAGES] + [ORACLES_COMMAND]
+    if run(chained(commands), scale_dir, log_file) is None:
+        raise Exception("The stages failed for the {} format (see {})".format(storage_format, log_file.name))
+    return os.path.join(scale_dir, "workspace", "results")
+
+
+def different_files(expected_dir, actual_dir):
+    """Returns the names of files of the expected folder which are missing or different in the other one."""
+    result = []
+    for file_name in sorted(os.listdir(expected_dir)):
+        expected_path = os.path.join(expected_dir, file_name)
+        actual_path = os.path.join(actual_dir, file_name)
+        if os.path.isfile(expected_path) and (not os.path.isfile(actual_path) or
+                                              not filecmp.cmp(expected_path, actual_path, shallow=False)):
+            result.append(file_name)
+    return result
+
+
+if __name__ == '__main__':
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--formats", help="Storage formats compared with csv",
+                        type=str, nargs='+', choices=[x for x in STORAGE_FORMATS if x != "csv"], required=False,
+                        default=[x for x in STORAGE_FORMATS if x != "csv"])
+    parser.add_argument("--scale", help="Number of lines of the generated code bases",
+                        type=int, required=False, default=10 ** 3)
+    parser.add_argument("--work_dir", help="A folder for the code bases and workspaces (by default a temporary "
+                                           "folder removed at the end)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--seed", help="The seed of the generator of code bases",
+                        type=int, required=False, default=0)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+
+    work_dir = args['work_dir']
+    temporary_work_dir = work_dir is None
+    if temporary_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="pyccflex-check-")
+    elif os.path.exists(work_dir):
+        logger.error("The folder {} already exists".format(work_dir))
+        exit(1)
+    else:
+        os.makedirs(work_dir)
+
+    failed = []
+    try:
+        with open(os.path.join(work_dir, "check.log"), "w") as log_file:
+            results_dirs = {}
+            for storage_format in ["csv"] + args['formats']:
+                logger.info(">>> Running the stages with the {} format".format(storage_format))
+                results_dirs[storage_format] = run_with_format(os.path.join(work_dir, storage_format), args['scale'],
+                                                               args['seed'], storage_format, log_file)
+            for storage_format in args['formats']:
+                different = different_files(results_dirs["csv"], results_dirs[storage_format])
+                for file_name in different:
+                    logger.info(">>> {:<45} differs from csv".format(storage_format + "/" + file_name))
+                logger.info(">>> {}: {} results files the same as with csv".format(
+                    storage_format, len(os.listdir(results_dirs["csv"])) - len(different)))
+                if len(different) > 0:
+                    failed.append(storage_format)
+    finally:
+        if temporary_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if len(failed) > 0:
+        exit(1)
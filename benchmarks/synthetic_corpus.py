@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+# Generates a synthetic C/C++ code base of the given number of lines (deterministic for a given seed)
+
+import argparse
+import bisect
+import itertools
+import logging
+import math
+import os
+import random
+
+module_logger = logging.getLogger('pyccflex.benchmarks.synthetic_corpus')
+
+# the prefix of labeled lines (see classes.json)
+LABEL_PREFIX = "@"
+
+KEYWORD_TYPES = ["int", "unsigned int", "long", "double", "float", "char", "bool", "size_t", "void", "uint8_t",
+                 "uint32_t", "int64_t", "std::string", "std::vector<int>", "const char*", "auto"]
+SYLLABLES = ["get", "set", "data", "buf", "len", "count", "item", "node", "list", "map", "key", "val", "index",
+             "ptr", "tmp", "res", "msg", "cfg", "ctx", "num", "str", "size", "max", "min", "next", "prev", "head",
+             "tail", "init", "load", "save", "read", "write", "open", "close", "send", "recv", "handle", "parse",
+             "check", "update", "value", "name", "type", "state", "flag", "mode", "error", "status", "time"]
+OPERATORS = ["+", "-", "*", "/", "%", "&", "|", "^", "<<", ">>", "&&", "||", "==", "!=", "<", ">", "<=", ">="]
+COMMENT_WORDS = ["the", "a", "of", "to", "is", "in", "for", "this", "value", "buffer", "returns", "if", "not",
+                 "check", "when", "called", "before", "after", "TODO", "fix", "size", "list", "must", "be", "used",
+                 "by", "and", "or", "with", "error", "handling", "memory", "free", "allocated", "caller"]
+
+
+class SyntheticCodeGenerator(object):
+    """
+    Generates lines of C/C++ files: includes, defines, comments (line and block), enums, structures and functions
+    with nested blocks. Identifiers are drawn from a vocabulary with a Zipf-like distribution (a few names are very
+    frequent, most are rare) and the number of terms of expressions and arguments of calls are geometric, so
+    the lengths of lines and the frequencies of tokens resemble the ones of real code bases.
+    A fraction of lines calling functions is labeled with the prefix of the "count" class (with some noise).
+    """
+
+    def __init__(self, seed=0, vocabulary_size=5000, labeled_fraction=0.8, noise=0.05):
+        self.random = random.Random(seed)
+        self.labeled_fraction = labeled_fraction
+        self.noise = noise
+        self.identifiers = self._vocabulary(vocabulary_size)
+        # cumulative weights of the Zipf distribution (s = 1)
+        self.cumulative_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+        self.functions = [self._name(2, camel_case=True) for _ in range(max(vocabulary_size // 10, 1))]
+        self.constants = [self._name(2).upper() for _ in range(max(vocabulary_size // 20, 1))]
+
+    def _name(self, max_syllables, camel_case=False):
+        syllables = [self.random.choice(SYLLABLES) for _ in range(self.random.randint(1, max_syllables))]
+        if camel_case:
+            return syllables[0] + "".join(x.capitalize() for x in syllables[1:])
+        return "_".join(syllables)
+
+    def _vocabulary(self, size):
+        names = set()
+        while len(names) < size:
+            name = self._name(3, camel_case=self.random.random() < 0.5)
+            if self.random.random() < 0.1:
+                name += str(self.random.randint(0, 99))
+            names.add(name)
+        names = sorted(names)
+        self.random.shuffle(names)
+        return names
+
+    def _geometric(self, mean):
+        """Returns a number >= 1 with the geometric distribution of the given mean."""
+        p = 1.0 / mean
+        return 1 + int(math.log(1.0 - self.random.random()) / math.log(1.0 - p)) if p < 1 else 1
+
+    def identifier(self):
+        i = bisect.bisect_left(self.cumulative_weights, self.random.random() * self.cumulative_weights[-1])
+        return self.identifiers[min(i, len(self.identifiers) - 1)]
+
+    def operand(self):
+        r = self.random.random()
+        if r < 0.6:
+            return self.identifier()
+        if r < 0.75:
+            return str(self.random.randint(0, 1000))
+        if r < 0.85:
+            return self.random.choice(self.constants)
+        if r < 0.95:
+            return "{}->{}".format(self.identifier(), self.identifier())
+        return "{}[{}]".format(self.identifier(), self.identifier())
+
+    def expression(self, mean_terms=2.0):
+        terms = [self.operand() for _ in range(self._geometric(mean_terms))]
+        result = terms[0]
+        for term in terms[1:]:
+            result += " {} {}".format(self.random.choice(OPERATORS), term)
+        return result
+
+    def call(self):
+        arguments = ", ".join(self.expression(1.3) for _ in range(self._geometric(2.0) - 1))
+        return "{}({})".format(self.random.choice(self.functions), arguments)
+
+    def comment_text(self):
+        return " ".join(self.random.choice(COMMENT_WORDS) for _ in range(self._geometric(6.0)))
+
+    def _label(self, line, labeled):
+        if self.random.random() < self.noise:
+            labeled = not labeled
+        return LABEL_PREFIX + line if labeled else line
+
+    def statement(self, indent):
+        """Returns a single line statement; lines calling functions are labeled."""
+        r = self.random.random()
+        labeled = False
+        if r < 0.25:
+            line = "{} {} = {};".format(self.random.choice(KEYWORD_TYPES), self.identifier(), self.expression())
+        elif r < 0.5:
+            line = "{} = {};".format(self.identifier(), self.expression())
+        elif r < 0.75:
+            line = "{};".format(self.call())
+            labeled = self.random.random() < self.labeled_fraction
+        elif r < 0.85:
+            line = "{} = {};".format(self.identifier(), self.call())
+            labeled = self.random.random() < self.labeled_fraction
+        elif r < 0.92:
+            line = "return {};".format(self.expression(1.5))
+        else:
+            line = "{}++;".format(self.identifier())
+        if self.random.random() < 0.08:
+            line += "  // " + self.comment_text()
+        return self._label(indent + line, labeled)
+
+    def block(self, indent, depth, no_lines):
+        """Yields about no_lines lines of a body of a function (statements, comments and nested blocks)."""
+        produced = 0
+        while produced < no_lines:
+            r = self.random.random()
+            if r < 0.12:
+                lines = [""]
+            elif r < 0.2:
+                lines = [indent + "// " + self.comment_text()]
+            elif r < 0.3 and depth < 4:
+                keyword = self.random.choice(["if", "if", "while", "for"])
+                if keyword == "for":
+                    variable = self.identifier()
+                    header = "for (int {0} = 0; {0} < {1}; {0}++) {{".format(variable, self.operand())
+                else:
+                    header = "{} ({}) {{".format(keyword, self.expression(1.5))
+                lines = [indent + header]
+                lines.extend(self.block(indent + "    ", depth + 1, self._geometric(4.0)))
+                if keyword == "if" and self.random.random() < 0.3:
+                    lines.append(indent + "} else {")
+                    lines.extend(self.block(indent + "    ", depth + 1, self._geometric(3.0)))
+                lines.append(indent + "}")
+            else:
+                lines = [self.statement(indent)]
+            produced += len(lines)
+            for line in lines:
+                yield line
+
+    def block_comment(self, indent=""):
+        lines = [indent + "/*"]
+        lines.extend(indent + " * " + self.comment_text() for _ in range(self._geometric(3.0)))
+        lines.append(indent + " */")
+        return lines
+
+    def function(self):
+        arguments = ", ".join("{} {}".format(self.random.choice(KEYWORD_TYPES), self.identifier())
+                              for _ in range(self._geometric(2.0) - 1))
+        lines = []
+        if self.random.random() < 0.4:
+            lines.extend(self.block_comment())
+        lines.append("{} {}({}) {{".format(self.random.choice(KEYWORD_TYPES), self.random.choice(self.functions),
+                                           arguments))
+        lines.extend(self.block("    ", 1, self._geometric(15.0)))
+        lines.append("}")
+        lines.append("")
+        return lines
+
+    def enum(self):
+        lines = ["enum {} {{".format(self.identifier().capitalize())]
+        lines.extend("    {},".format(self.random.choice(self.constants)) for _ in range(self._geometric(4.0)))
+        lines.append("};")
+        lines.append("")
+        return lines
+
+    def structure(self):
+        lines = ["struct {} {{".format(self.identifier().capitalize())]
+        lines.extend("    {} {};".format(self.random.choice(KEYWORD_TYPES), self.identifier())
+                     for _ in range(self._geometric(4.0)))
+        lines.append("};")
+        lines.append("")
+        return lines
+
+    def file_lines(self, no_lines, header=False):
+        """Returns the lines of a file of about no_lines lines (a header file contains only declarations)."""
+        lines = self.block_comment()
+        lines.extend("#include <{}.h>".format(self.random.choice(SYLLABLES)) for _ in range(self._geometric(3.0)))
+        lines.append("")
+        lines.extend("#define {} {}".format(self.random.choice(self.constants), self.random.randint(0, 4096))
+                     for _ in range(self._geometric(2.0) - 1))
+        while len(lines) < no_lines:
+            r = self.random.random()
+            if r < 0.1:
+                lines.extend(self.enum())
+            elif r < 0.2 or header and r < 0.6:
+                lines.extend(self.structure())
+            elif header:
+                lines.append("{} {}({} {});".format(self.random.choice(KEYWORD_TYPES),
+                                                    self.random.choice(self.functions),
+                                                    self.random.choice(KEYWORD_TYPES), self.identifier()))
+            else:
+                lines.extend(self.function())
+        return lines
+
+    def file_size(self, mean_lines_per_file):
+        # sizes of files are log-normal (many small files, a few large ones)
+        sigma = 0.8
+        mu = math.log(mean_lines_per_file) - sigma ** 2 / 2
+        return max(5, int(self.random.lognormvariate(mu, sigma)))
+
+
+def generate_corpus(output_dir, no_lines, seed=0, mean_lines_per_file=300, files_per_dir=100,
+                    header_fraction=0.2, vocabulary_size=5000):
+    """
+    Writes files of a synthetic code base to the output_dir (subfolders of files_per_dir files), until there are
+    at least no_lines lines. Returns the number of files and lines written.
+    """
+    generator = SyntheticCodeGenerator(seed=seed, vocabulary_size=vocabulary_size)
+    no_files = 0
+    lines_written = 0
+    while lines_written < no_lines:
+        header = generator.random.random() < header_fraction
+        size = min(generator.file_size(mean_lines_per_file), no_lines - lines_written)
+        lines = generator.file_lines(size, header=header)
+        dir_path = os.path.join(output_dir, "module{:04d}".format(no_files // files_per_dir))
+        if no_files % files_per_dir == 0:
+            os.makedirs(dir_path, exist_ok=True)
+        file_name = "file{:06d}.{}".format(no_files, "h" if header else "cpp")
+        with open(os.path.join(dir_path, file_name), "w", encoding="utf-8") as code_file:
+            code_file.write("\n".join(lines) + "\n")
+        no_files += 1
+        lines_written += len(lines)
+    return no_files, lines_written
+
+
+if __name__ == '__main__':
+
+    logger = logging.getLogger('pyccflex')
+    logger.setLevel(logging.DEBUG)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    logger.addHandler(ch)
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_dir", help="A folder the code base is written to", type=str)
+    parser.add_argument("--lines", help="Number of lines of the code base",
+                        type=int, required=False, default=10 ** 4)
+    parser.add_argument("--seed", help="The seed of the random generator (the same seed gives the same code base)",
+                        type=int, required=False, default=0)
+    parser.add_argument("--mean_lines_per_file", help="The mean number of lines of a file",
+                        type=int, required=False, default=300)
+    parser.add_argument("--vocabulary_size", help="Number of distinct identifiers",
+                        type=int, required=False, default=5000)
+    args = vars(parser.parse_args())
+    logger.info("Run parameters: {}".format(str(args)))
+
+    no_files, no_lines = generate_corpus(args['output_dir'], args['lines'], seed=args['seed'],
+                                         mean_lines_per_file=args['mean_lines_per_file'],
+                                         vocabulary_size=args['vocabulary_size'])
+    logger.info(">>> Generated {} lines in {} files in {}".format(no_lines, no_files, args['output_dir']))
@@ -0,0 +1,137 @@
+"""
+The commands of pyccflex run by a single entry point (bin/ccflex, python -m ccflex):
+
+    ccflex <command> [arguments] [:: <command> [arguments] ...]
+
+Each command is a module of this package with the function main(argv) (the scripts in bin only call it). A module
+is imported when its command is run, so a command doesn't pay for importing the libraries of the other ones,
+and the commands chained with :: are run in one process - the libraries (pandas, sklearn) and the configuration
+files are loaded once for all of them.
+"""
+
+import importlib
+import logging
+import os
+import sys
+import time
+
+COMMANDS = ["active_learning", "add_seq_context", "apply_features_selection", "bag_of_words", "classify",
+            "classify_server", "convert_features", "copy_builtin_training_file", "copy_feature_file",
+            "create_workspace", "delete_processing_file", "evaluate_accuracy", "extract_block_features_from_class",
+            "extract_block_features_from_features", "find_similar", "generate_html", "lines2csv", "lines_oracle",
+            "merge_inputs", "merge_results", "predefined_manual_features", "remove_columns", "run_pipeline",
+            "sample_lines", "select_features", "tokenize_lines", "vocabulary_extractor"]
+
+COMMANDS_SEPARATOR = "::"
+
+USAGE = "usage: ccflex [--list] <command> [arguments] [{} <command> [arguments] ...]".format(COMMANDS_SEPARATOR)
+
+module_logger = logging.getLogger('pyccflex.ccflex')
+
+
+def command_module_path(command):
+    """Returns the path of the module of a command or None if it isn't a command of pyccflex."""
+    if command not in COMMANDS:
+        return None
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), command + ".py")
+
+
+def setup_logging():
+    """Logs the messages of pyccflex to the console (once, even if many commands are run)."""
+    logger = logging.getLogger('pyccflex')
+    if len(logger.handlers) == 0:
+        logger.setLevel(logging.DEBUG)
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        logger.addHandler(ch)
+
+
+def use_command_workspace(argv):
+    """
+    Reports the measurements to the workspace configured in the locations file of a command (the --locations_config
+    argument, ./locations.json by default), if the file exists.
+    """
+    from common.configuration import ConfigurationHandler
+    from common.instrumentation import use_workspace
+    from common.workspace import WorkspaceHandler
+    locations_file_path = "./locations.json"
+    for i, arg in enumerate(argv):
+        if arg == "--locations_config" and i + 1 < len(argv):
+            locations_file_path = argv[i + 1]
+        elif arg.startswith("--locations_config="):
+            locations_file_path = arg.split("=", 1)[1]
+    if not os.path.isfile(locations_file_path):
+        return
+    workspace_dir_path = ConfigurationHandler(locations_file_path).get("workspace_dir", {}).get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+    use_workspace(workspace_dir.reports_path, [workspace_dir.processing_path, workspace_dir.results_path,
+                                               workspace_dir.reports_path])
+
+
+def run_command(command, argv=None):
+    """
+    Runs a command with its arguments (the arguments of this process if argv is None) in this process.
+    sys.argv is set for the time of the command as if it was run from the command line. If the instrumentation
+    is enabled, the command is measured as a stage (unless it is a part of a stage measured already, e.g.,
+    by run_pipeline) and reported to the reports folder of its workspace.
+    """
+    if command not in COMMANDS:
+        raise Exception("Unknown command: {}".format(command))
+    from common.instrumentation import begin_stage, end_stage, measuring
+    argv = sys.argv[1:] if argv is None else list(argv)
+    setup_logging()
+    saved_argv = sys.argv
+    sys.argv = [command] + argv
+    profile = None if measuring() else begin_stage(command, argv)
+    if profile is not None:
+        use_command_workspace(argv)
+    try:
+        importlib.import_module("ccflex." + command).main(argv)
+    finally:
+        end_stage(profile)
+        sys.argv = saved_argv
+
+
+def split_commands(argv):
+    """Splits arguments into lists of arguments of commands (the first one is the name of a command)."""
+    commands = [[]]
+    for arg in argv:
+        if arg == COMMANDS_SEPARATOR:
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return [x for x in commands if len(x) > 0]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if len(argv) == 0 or argv[0] in ["-h", "--help"]:
+        print(USAGE)
+        print("\ncommands:\n  " + "\n  ".join(COMMANDS))
+        return 0 if len(argv) > 0 else 2
+    if argv[0] == "--list":
+        print("\n".join(COMMANDS))
+        return 0
+
+    # all commands are checked before the first one is run
+    commands = split_commands(argv)
+    unknown = [x[0] for x in commands if x[0] not in COMMANDS]
+    if len(unknown) > 0:
+        print(USAGE, file=sys.stderr)
+        print("ccflex: unknown commands: {} (see ccflex --list)".format(", ".join(unknown)), file=sys.stderr)
+        return 2
+
+    setup_logging()
+    for command_args in commands:
+        command = command_args[0]
+        start = time.time()
+        try:
+            run_command(command, command_args[1:])
+        except SystemExit as e:
+            # argparse and some commands exit when they are done (code 0) or fail
+            if e.code not in (None, 0):
+                module_logger.error("The command {} exited with the code {}".format(command, e.code))
+                return e.code if isinstance(e.code, int) else 1
+        if len(commands) > 1:
+            module_logger.info("ccflex: {} finished in {:.2f} s".format(command, time.time() - start))
+    return 0
@@ -0,0 +1,5 @@
+import sys
+
+from ccflex import main
+
+sys.exit(main())
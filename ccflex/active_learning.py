@@ -0,0 +1,413 @@
+# An independent script for manually selecting and labeling data
+
+import argparse
+import copy
+import csv
+import logging
+import os
+import time
+import pandas as pd
+import numpy as np
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from modAL.disagreement import vote_entropy
+from modAL.models import ActiveLearner, Committee
+from modAL.uncertainty import classifier_uncertainty
+
+from common.configuration import ConfigurationHandler
+from common.storage import read_features
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def query(learner, utility_function, X_pool, available, n_instances, sample_size=None):
+    """
+    Returns the indices of n_instances available lines of the pool with the highest utility (e.g., uncertainty).
+    If sample_size is given, only a random sample of the available lines is scored.
+    """
+    candidates = np.flatnonzero(available)
+    if sample_size is not None and sample_size < len(candidates):
+        candidates = np.random.choice(candidates, sample_size, replace=False)
+        utility = utility_function(learner, X_pool[candidates])
+    else:
+        # scoring the whole pool is cheaper than copying the available lines
+        utility = utility_function(learner, X_pool)[candidates]
+    # ties (e.g., all lines are equally uncertain before the models are trained) are broken randomly
+    best = np.lexsort((np.random.random(len(utility)), -utility))[:n_instances]
+    return list(candidates[best])
+
+
+def _teach(learner, X, y):
+    learner.teach(X=X, y=y)
+    return learner
+
+
+class BackgroundTeacher(object):
+    """
+    Teaches a copy of the learner in a background thread, so the next lines can be shown without waiting for
+    the models to be refitted. Queries use the latest learner that finished training; the labels provided
+    in the meantime are taught when the training finishes.
+    """
+
+    def __init__(self, learner, background=True):
+        self.learner = learner
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.future = None
+        self.pending_X = []
+        self.pending_y = []
+
+    def _submit_pending(self):
+        X = np.concatenate(self.pending_X)
+        y = np.concatenate(self.pending_y)
+        self.pending_X = []
+        self.pending_y = []
+        if self.executor is None:
+            _teach(self.learner, X, y)
+        else:
+            self.future = self.executor.submit(_teach, copy.deepcopy(self.learner), X, y)
+
+    def current_learner(self):
+        if self.future is not None and self.future.done():
+            self.learner = self.future.result()
+            self.future = None
+        if self.future is None and len(self.pending_X) > 0:
+            self._submit_pending()
+        return self.learner
+
+    def teach(self, X, y):
+        self.pending_X.append(X)
+        self.pending_y.append(y)
+        self.current_learner()
+
+    def finish(self):
+        """Waits for the training to finish, teaches the remaining labels and returns the learner."""
+        if self.future is not None:
+            self.learner = self.future.result()
+            self.future = None
+        if len(self.pending_X) > 0:
+            self.executor = None
+            self._submit_pending()
+        return self.learner
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_files", help="The name of the input file containing features and contents",
+                        nargs='+', type=str, required=True)
+    parser.add_argument("--output_file", help="The name of the output file",
+                        default=False, type=str)
+    parser.add_argument("--base_learner", help="The name of classification algorithm used to evaluate",
+                        default=False, type=str)
+    parser.add_argument("--use_existing_labels",
+                        help="The already added labels will be used; lines that are not explicitly "
+                             "labeled will be treated as unknown",
+                        default=False, action='store_true')
+    parser.add_argument("--committee",
+                        help="Uses committe of classifiers to select samples.",
+                        default=False, action='store_true')
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--classifiers_options", help="Path to classifiers options file",
+                        type=str, required=False, default="./classifiers_options.json")
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--max_lines", help="The maximum number of lines to read from each input file",
+                        type=int, required=False, default=10 ** 5)
+    parser.add_argument("--batch_size", help="The number of lines to label in each round of queries",
+                        type=int, required=False, default=1)
+    parser.add_argument("--query_sample_size", help="The number of randomly sampled unlabeled lines scored "
+                                                    "in each query (by default all unlabeled lines are scored)",
+                        type=int, required=False, default=None)
+    parser.add_argument("--synchronous_training", help="Wait for the models to be retrained after each round "
+                                                       "instead of retraining them in the background",
+                        default=False, action='store_true')
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    classifiers_options_file_path = args['classifiers_options']
+
+    input_files = args['input_files']
+    output_file = args['output_file']
+    base_learner = args['base_learner']
+    use_existing_labels = args['use_existing_labels']
+    max_lines = args['max_lines']
+    committee = args['committee']
+    batch_size = args['batch_size']
+    query_sample_size = args['query_sample_size']
+    synchronous_training = args['synchronous_training']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classifiers_options_config = ConfigurationHandler(classifiers_options_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classifiers_options_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    add_contents = args['add_contents']
+
+    output_file_path = workspace_dir.get_processing_file_path(output_file)
+
+    input_full_df = None
+
+    for input_file in input_files:
+        input_file_path = workspace_dir.get_processing_file_path(input_file)
+
+        logger.info(">>> Loading file {}".format(input_file))
+
+        input_df = read_features(input_file_path, sep=csv_separator, nrows=max_lines)
+        columns = list(input_df.columns)
+        if 'contents' in columns:
+            input_df.contents = input_df.contents.fillna("")
+        else:
+            input_df['contents'] = np.array([''] * input_df.shape[0])
+
+        if 'class_value' not in columns:
+            # input_df['class_value'] = np.array([decision_classes['default']['value']] * input_df.shape[0])
+            # input_df['class_name'] = np.array([decision_classes['default']['name']] * input_df.shape[0])
+            input_df['class_value'] = np.array([None] * input_df.shape[0])
+            input_df['class_name'] = np.array([None] * input_df.shape[0])
+
+        if input_full_df is None:
+            input_full_df = input_df
+        else:
+            input_full_df = pd.concat([input_full_df, input_df], axis=0, ignore_index=True)
+
+    if use_existing_labels:
+        train_df = input_full_df[input_full_df['class_value'].notnull()]
+        train_df.is_copy = False
+        input_full_df = input_full_df[input_full_df['class_value'].isnull()]
+
+    decision_class_name_column = None
+    decision_class_value_column = None
+    contents_column = None
+    ids_column = input_full_df['id']
+    file_names = [x.split(":")[0] for x in list(input_full_df['id'])]
+
+    columns = list(input_full_df.columns)
+    columns_to_drop = ['id']
+    if decision_class_name_column is None and 'class_value' in columns:
+        decision_class_name_column = input_full_df['class_name']
+        decision_class_value_column = input_full_df['class_value']
+        columns_to_drop.append('class_value')
+        columns_to_drop.append('class_name')
+
+    if contents_column is None and 'contents' in columns:
+        contents_column = input_full_df['contents']
+        columns_to_drop.append('contents')
+
+    input_full_df.drop(columns_to_drop, inplace=True, axis=1)
+
+    output_contents = []
+    output_ids = []
+    ids_column_list = list(ids_column)
+    contents_list = list(contents_column)
+
+    X_pool = input_full_df.values
+    X_train = None
+    y_train = None
+    if use_existing_labels:
+        y_train = train_df['class_value'].astype('int')
+        output_ids = list(train_df['id'])
+        output_contents = list(train_df['contents'])
+        train_df.drop(columns_to_drop, inplace=True, axis=1)
+        X_train = train_df.values
+
+    if not committee:
+        model = None
+        model_options = classifiers_options_config.get(base_learner, {})
+        if base_learner == "CART":
+            model = DecisionTreeClassifier(**model_options)
+
+        elif base_learner == "RandomForest":
+            model = RandomForestClassifier(**model_options)
+
+        # active learner - default - uncertainty
+        learner = ActiveLearner(
+            estimator=model,
+            X_training=np.copy(X_train), y_training=np.copy(y_train),
+        )
+    else:
+        learner_list = []
+        models = ["RandomForest", "RandomForest", "CART", "KNN"]
+        for base_learner in models:
+            model_options = classifiers_options_config.get(base_learner, {})
+            if base_learner == "CART":
+                model = DecisionTreeClassifier(**model_options)
+            elif base_learner == "RandomForest":
+                model = RandomForestClassifier(**model_options)
+            elif base_learner == "KNN":
+                model = KNeighborsClassifier(**model_options)
+            member_learner = ActiveLearner(
+                estimator=model,
+                X_training=np.copy(X_train), y_training=np.copy(y_train),
+            )
+            learner_list.append(member_learner)
+
+        learner = Committee(learner_list=learner_list)
+
+    prompt_message = ", ".join(["[{}]-{}".format(x['value'], x['name']) for x in decision_classes['labeled']])
+    prompt_message = "{}, [enter]-{}, [q] to finish: ".format(prompt_message, decision_classes['default']['name'])
+
+    class_values = [str(decision_classes['default']['value'])]
+    class_values.extend([str(x['value']) for x in decision_classes['labeled']])
+
+    # the pool is never copied, labeled lines are only masked out
+    available = np.ones(X_pool.shape[0], dtype=bool)
+    utility_function = vote_entropy if committee else classifier_uncertainty
+    teacher = BackgroundTeacher(learner, background=not synchronous_training)
+
+    query_idx = list(np.random.choice(range(0, X_pool.shape[0]), min(batch_size, X_pool.shape[0]), replace=False))
+
+    cmd = None
+
+    print("Please, label the following lines:")
+
+    count_line = 1
+    answered_at = None
+    while True:
+        labeled_idx = []
+        labels = []
+        for line_idx in query_idx:
+            file_name = file_names[line_idx]
+            print("{}:".format(file_name))
+            lines_to_display = [i for i in range(line_idx - 3, line_idx + 3) if
+                                0 <= i < len(file_names) and file_name == file_names[i]]
+
+            for line_id in lines_to_display:
+                if line_id == line_idx:
+                    spacer = ">>>"
+                    stats = "   | char={}, space={}, tab={}".format(len(contents_list[line_id]),
+                                                               contents_list[line_id].count(" "),
+                                                               contents_list[line_id].count("   "))
+                else:
+                    spacer = "   "
+                    stats = ""
+
+                print('{} {}  {}{}'.format(spacer, ids_column_list[line_id].split(":")[-1], contents_list[line_id],
+                                           stats))
+            if answered_at is not None:
+                logger.info("Prompt latency: {:.3f}s".format(time.time() - answered_at))
+            cmd = input("{}# Choose: {}".format(count_line, prompt_message))
+            answered_at = time.time()
+            print("\n")
+            count_line += 1
+
+            label = 0
+            if cmd == "q":
+                break
+            if cmd in class_values:
+                label = int(cmd)
+            labeled_idx.append(line_idx)
+            labels.append(label)
+
+        if len(labeled_idx) > 0:
+            available[labeled_idx] = False
+            output_contents.extend(contents_list[i] for i in labeled_idx)
+            output_ids.extend(ids_column_list[i] for i in labeled_idx)
+            teacher.teach(X_pool[labeled_idx], np.array(labels))
+
+        if cmd == "q" or not available.any():
+            break
+
+        query_idx = query(teacher.current_learner(), utility_function, X_pool, available, batch_size,
+                          query_sample_size)
+
+    learner = teacher.finish()
+
+    print("Saving results to the file".format(output_file_path))
+
+    if committee:
+        output_x = learner.learner_list[0].X_training
+        output_y = learner.learner_list[0].y_training
+    else:
+        output_x = learner.X_training
+        output_y = learner.y_training
+
+    class_values = np.array(output_y)
+
+    class_value_to_name = dict((x['value'], x['name']) for x in decision_classes['labeled'])
+    class_value_to_name[decision_classes['default']['value']] = decision_classes['default']['name']
+    class_names = np.array([class_value_to_name[x] if x is not None else None for x in list(class_values)])
+
+    output_df = pd.DataFrame(np.array(output_x), columns=list(input_full_df.columns))
+    output_df = pd.concat(
+        [pd.DataFrame(pd.Series(np.array(output_ids), name="id")), output_df, pd.DataFrame({"class_name": class_names}),
+         pd.DataFrame({"class_value": class_values})],
+        axis=1)
+
+    if add_contents:
+        output_df = pd.concat([output_df, pd.Series(np.array(output_contents), name='contents')], axis=1)
+
+    output_df = output_df[output_df['class_value'].notnull()]
+
+    if add_contents:
+        line_numbers = output_df['id'].apply(lambda x: int(x.split(":")[-1]))
+        files = output_df['id'].apply(lambda x: x.split(":")[0])
+
+        lines_df = pd.concat(
+            [output_df['id'], line_numbers, output_df['contents'], output_df[['class_name', 'class_value']], files],
+            axis=1)
+        lines_df = lines_df.set_axis(labels=('id', 'line', 'contents', 'class_name', 'class_value', 'path'), axis=1)
+        lines_output_file_path = workspace_dir.get_processing_file_path("lines-" + output_file)
+        lines_df.to_csv(lines_output_file_path, sep=csv_separator, index=False, encoding="utf-8",
+                        quoting=csv.QUOTE_NONNUMERIC)
+
+        source_output_file_path = workspace_dir.get_processing_file_path(
+            "source-" + output_file.replace(".csv", ".txt"))
+        contents = list(lines_df['contents'])
+        class_values = list(lines_df['class_value'])
+        classes_to_prefix = {}
+        for labeled_class in decision_classes['labeled']:
+            classes_to_prefix[labeled_class['value']] = labeled_class['line_prefix']
+
+        with open(source_output_file_path, 'w', newline='', encoding="utf-8") as out_file:
+            for i, content in enumerate(contents):
+                if decision_classes['default']['value'] == class_values[i]:
+                    out_file.write(content + "\n")
+                else:
+                    out_file.write(classes_to_prefix[class_values[i]] + content + "\n")
+
+    output_df.to_csv(output_file_path, sep=csv_separator, index=False, encoding="utf-8", quoting=csv.QUOTE_NONNUMERIC)
@@ -0,0 +1,219 @@
+# Adds features from +-n lines / cases (all have to be in the same file)
+
+import argparse
+import logging
+import os
+import pandas as pd
+import numpy as np
+import gc
+
+from common.configuration import ConfigurationHandler
+from common.sparse_features import SPARSE_FEATURES_EXTENSION
+from common.storage import read_features, read_features_columns, existing_features_file_path, file_format_of, \
+    storage_format_of, FeaturesWriter
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+meta_columns = ['id', 'class_name', 'class_value', 'contents']
+
+# scipy is imported by the functions using it, so printing the help doesn't load it
+
+
+def context_columns(feature_names, prev_cases, next_cases):
+    columns = []
+    for i in range(1, prev_cases + 1):
+        columns.extend(["{}_prev{}".format(x, i) for x in feature_names])
+    for i in range(1, next_cases + 1):
+        columns.extend(["{}_next{}".format(x, i) for x in feature_names])
+    columns.extend(feature_names)
+    return columns
+
+
+def dense_chunks(input_df_chunks, feature_names):
+    """Splits chunks of a features file into the meta columns and an array of features."""
+    for input_df in input_df_chunks:
+        meta_df = input_df[[x for x in meta_columns if x in input_df.columns]].reset_index(drop=True)
+        yield meta_df, input_df[feature_names].to_numpy()
+
+
+def sparse_chunks(reader):
+    for meta_df, matrix in reader.iter_sparse_chunks():
+        yield meta_df.reset_index(drop=True), matrix
+
+
+def _masked_rows(values, rows, mask):
+    import scipy.sparse as sp
+    if sp.issparse(values):
+        masked = sp.csr_matrix(values[rows].multiply(mask[:, None].astype(values.dtype)))
+        masked.eliminate_zeros()
+        return masked
+    return np.where(mask[:, None], values[rows], 0)
+
+
+def context_block(values, file_names, start, end, prev_cases, next_cases):
+    """
+    Builds the features with context for the rows start..end-1 of values (an array or a CSR matrix) from
+    shifted rows masked by the same-file vector. Lines from other files are represented by zeros.
+    """
+    import scipy.sparse as sp
+    rows = np.arange(start, end)
+    blocks = []
+    for shift in [-j for j in range(1, prev_cases + 1)] + list(range(1, next_cases + 1)):
+        neighbours = rows + shift
+        inside = (neighbours >= 0) & (neighbours < values.shape[0])
+        neighbours = np.where(inside, neighbours, rows)
+        same_file = inside & (file_names[neighbours] == file_names[rows])
+        blocks.append(_masked_rows(values, neighbours, same_file))
+    blocks.append(values[rows])
+    if sp.issparse(values):
+        return sp.hstack(blocks, format='csr')
+    return np.hstack(blocks)
+
+
+def with_context(chunks, prev_cases, next_cases):
+    """
+    Yields chunks of meta columns and features with context in the order of lines. The last prev_cases lines
+    of a chunk are kept as the context of the next one and the last next_cases lines wait for the next chunk,
+    so the lines at the boundaries of chunks don't lose their context.
+    """
+    import scipy.sparse as sp
+    meta_df, values, file_names = None, None, None
+    emitted = 0
+    for chunk_meta_df, chunk_values in chunks:
+        chunk_file_names = chunk_meta_df['id'].astype(str).str.split(":", n=1).str[0].to_numpy()
+        if meta_df is None:
+            meta_df, values, file_names = chunk_meta_df, chunk_values, chunk_file_names
+        else:
+            meta_df = pd.concat([meta_df, chunk_meta_df], ignore_index=True)
+            if sp.issparse(values):
+                values = sp.vstack([values, chunk_values], format='csr')
+            else:
+                values = np.vstack([values, chunk_values])
+            file_names = np.concatenate([file_names, chunk_file_names])
+
+        end = values.shape[0] - next_cases
+        if end > emitted:
+            yield meta_df.iloc[emitted:end].reset_index(drop=True), \
+                  context_block(values, file_names, emitted, end, prev_cases, next_cases)
+            keep_from = max(0, end - prev_cases)
+            meta_df = meta_df.iloc[keep_from:].reset_index(drop=True)
+            values = values[keep_from:]
+            file_names = file_names[keep_from:]
+            emitted = end - keep_from
+
+    if meta_df is not None and values.shape[0] > emitted:
+        yield meta_df.iloc[emitted:].reset_index(drop=True), \
+              context_block(values, file_names, emitted, values.shape[0], prev_cases, next_cases)
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file",
+                        help="Path to input csv file", type=str)
+    parser.add_argument("output_file",
+                        help="Path to output csv file", type=str)
+    parser.add_argument("--prev_cases", help="The number of preceding cases",
+                        default=1, type=int)
+    parser.add_argument("--next_cases", help="The number of proceeding cases",
+                        default=1, type=int)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--add_decision_class", help="Shall the decision class be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+
+    input_file = args['input_file']
+    output_file = args['output_file']
+    prev_cases = args['prev_cases']
+    next_cases = args['next_cases']
+    add_decision_class = args['add_decision_class']
+    add_contents = args['add_contents']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+    storage_format = storage_format_of(files_format_config)
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>> Loading input the file {}".format(input_file))
+
+    input_file_path = existing_features_file_path(workspace_dir.get_processing_file_path(input_file))
+    output_file_path = workspace_dir.get_processing_file_path(output_file)
+
+    # sparse (bag of words) features stay sparse, so the context for wide files fits in memory
+    sparse = file_format_of(input_file_path) == "sparse"
+    if sparse:
+        from common.sparse_features import SparseFeaturesReader
+        reader = SparseFeaturesReader(input_file_path, sep=csv_separator, chunksize=chunk_size)
+        input_columns = reader.columns()
+    else:
+        input_columns = read_features_columns(input_file_path, sep=csv_separator, resolve=False)
+    feature_names = [x for x in input_columns if x not in meta_columns]
+    if sparse:
+        chunks = sparse_chunks(reader)
+    else:
+        chunks = dense_chunks(read_features(input_file_path, sep=csv_separator, chunksize=chunk_size, resolve=False),
+                              feature_names)
+
+    # prepare header
+    header = context_columns(feature_names, prev_cases, next_cases)
+    output_meta_columns = ['id']
+    if add_decision_class and 'class_value' in input_columns:
+        output_meta_columns.extend(['class_name', 'class_value'])
+    if add_contents and 'contents' in input_columns:
+        output_meta_columns.append('contents')
+
+    if sparse:
+        from common.sparse_features import SparseFeaturesWriter
+        output_file_path = os.path.splitext(output_file_path)[0] + SPARSE_FEATURES_EXTENSION
+        with SparseFeaturesWriter(output_file_path, header, output_meta_columns, sep=csv_separator) as writer:
+            for meta_df, block in with_context(chunks, prev_cases, next_cases):
+                logger.info(">>> Saving {} lines to the file {}".format(meta_df.shape[0], output_file_path))
+                writer.write(block, meta_df[output_meta_columns].values.tolist())
+                del block
+                gc.collect()
+    else:
+        with FeaturesWriter(output_file_path, sep=csv_separator, storage_format=storage_format) as writer:
+            output_file_path = writer.file_path
+            for meta_df, block in with_context(chunks, prev_cases, next_cases):
+                logger.info(">>> Saving {} lines to the file {}".format(meta_df.shape[0], output_file_path))
+                output_df = pd.concat([meta_df[['id']], pd.DataFrame(block, columns=header),
+                                       meta_df[output_meta_columns[1:]]], axis=1)
+                writer.write(output_df)
+                del output_df
+                del block
+                gc.collect()
+            if writer.no_chunks == 0:
+                writer.write(pd.DataFrame(columns=['id'] + header + output_meta_columns[1:]))
+
+    logger.info(">>> Output saved to the file {}".format(output_file_path))
@@ -0,0 +1,175 @@
+# Extracts basic manual features
+import argparse
+import logging
+import os
+
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+from common.cache import CACHE_FILE_NAME, file_hash
+from common.configuration import ConfigurationHandler
+from common.storage import storage_format_of
+from common.workspace import WorkspaceHandler
+from prepare.feature_extractors import LineFeaturesExtractionController, CountVectorizerBasedFeatureExtraction, \
+    SparseLineFeaturesExtractionController, TokenCorpusBasedFeatureExtraction
+from prepare.token_corpus import TokenMapping, load_token_corpus, token_corpus_name
+from prepare.vocabularies import VocabularyTokenizer
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("code_location_config_key",
+                        help="Name of the node in configuration defining path to code", type=str)
+    parser.add_argument("vocabulary_file_name",
+                        help="Name of the vocabulary file", type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--add_decision_class", help="Shall the decision class be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--token_signature_for_missing", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--min_ngrams", help="Min. number of n-grams",
+                        type=int, required=False, default=1)
+    parser.add_argument("--max_ngrams", help="Max. number of n-grams",
+                        type=int, required=False, default=1)
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 3)
+    parser.add_argument("--max_line_length", help="Maximum line length; if exceeded it will be truncated.",
+                        type=int, required=False, default=1000)
+    parser.add_argument("--sparse", help="Extract features in chunks and store them in a sparse .npz file "
+                                         "(with a -meta.csv sidecar file) instead of csv",
+                        default=False, action='store_true')
+    parser.add_argument("--workers", help="Number of processes used to extract features (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--max_chunks_in_flight", help="Maximum number of chunks being processed or waiting "
+                                                       "to be saved when using workers (default 2 x workers)",
+                        type=int, required=False, default=None)
+    parser.add_argument("--use_cache", help="Reuse features of files which lines haven't changed since the previous "
+                                            "run (stored in the cache folder of the workspace)",
+                        default=False, action='store_true')
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    chunk_size = args['chunk_size']
+    max_line_length = args['max_line_length']
+    sparse = args['sparse']
+    workers = args['workers']
+    max_chunks_in_flight = args['max_chunks_in_flight']
+    use_cache = args['use_cache']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+    separator = files_format_config.get("csv_sep", ",")
+    storage_format = storage_format_of(files_format_config)
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    code_loc_config_key = args['code_location_config_key']
+    code_loc = locations_config.get(code_loc_config_key, None)
+    input_file_path = workspace_dir.get_processing_file_path("{}-lines.csv".format(code_loc_config_key))
+    output_file_extension = "npz" if sparse else "csv"
+    output_file_path = workspace_dir.get_processing_file_path(
+        "{}-bag-of-words.{}".format(code_loc_config_key, output_file_extension))
+
+    vocabulary_file_path = workspace_dir.get_processing_file_path(args['vocabulary_file_name'])
+    base_vocabulary_file_path = workspace_dir.get_processing_file_path("base-" + args['vocabulary_file_name'])
+
+    add_decision_class = args['add_decision_class']
+    add_contents = args['add_contents']
+
+    token_signature_for_missing = args['token_signature_for_missing']
+    min_ngrams = args['min_ngrams']
+    max_ngrams = args['max_ngrams']
+
+    logger.info(">>> Loading vocabularies")
+
+    base_vocab = pd.read_csv(base_vocabulary_file_path, sep=separator, encoding="utf-8")
+    vocabulary = pd.read_csv(vocabulary_file_path, sep=separator, encoding="utf-8")
+
+    vocab_tokens = set(base_vocab.token)
+
+    if token_signature_for_missing:
+        logger.info(">>> Using a tokenizer that will use token signatures for tokens outside of the base vocabulary")
+    else:
+        logger.info(">>> Using a tokenizer that will skip tokens outside of the base vocabulary")
+    tokenizer = VocabularyTokenizer(vocab_tokens, token_signature_for_missing)
+
+    logger.info(">>> Extracting features")
+
+    tokens = list(vocabulary['token'])
+    vocab = dict((key, value) for value, key in enumerate(tokens))
+
+    count_vect = CountVectorizer(ngram_range=(min_ngrams, max_ngrams), tokenizer=tokenizer, vocabulary=vocab, lowercase=False)
+
+    lines_data_chunks = pd.read_csv(input_file_path, sep=separator, encoding="utf-8", chunksize=chunk_size)
+
+    for lines_data in lines_data_chunks:
+        lines_data.contents = lines_data.contents.fillna("")
+        contents = [line if len(line) < max_line_length else line[:max_line_length] for line in lines_data.contents]
+        count_vect.fit_transform(contents)
+        break
+
+    # the ids of tokens are used instead of tokenizing the lines if the lines file was tokenized (tokenize_lines)
+    corpus = load_token_corpus(workspace_dir.get_processing_file_path(token_corpus_name(input_file_path)),
+                               input_file_path)
+    if corpus is not None:
+        mapping = TokenMapping(corpus.tokens, vocab_tokens, token_signature_for_missing)
+        extractors = [TokenCorpusBasedFeatureExtraction(count_vect, separator, "{}".format(separator),
+                                                        corpus, mapping, max_line_length)]
+    else:
+        extractors = [CountVectorizerBasedFeatureExtraction(count_vect, separator, "{}".format(separator))]
+
+    if sparse:
+        controller = SparseLineFeaturesExtractionController(extractors,
+                                                            input_file_path, output_file_path,
+                                                            sep=separator,
+                                                            max_line_length=max_line_length,
+                                                            add_decision_class=add_decision_class,
+                                                            add_contents=add_contents,
+                                                            chunk_size=chunk_size,
+                                                            workers=workers,
+                                                            max_chunks_in_flight=max_chunks_in_flight)
+    else:
+        controller = LineFeaturesExtractionController(extractors,
+                                                      input_file_path, output_file_path,
+                                                      sep=separator,
+                                                      add_decision_class=add_decision_class,
+                                                      add_contents=add_contents,
+                                                      workers=workers,
+                                                      chunk_size=chunk_size,
+                                                      max_chunks_in_flight=max_chunks_in_flight,
+                                                      storage_format=storage_format)
+    if use_cache:
+        controller.use_cache(workspace_dir.get_cache_file_path(CACHE_FILE_NAME),
+                             os.path.basename(output_file_path),
+                             {"vocabulary": file_hash(vocabulary_file_path),
+                              "base_vocabulary": file_hash(base_vocabulary_file_path),
+                              "token_signature_for_missing": token_signature_for_missing,
+                              "min_ngrams": min_ngrams, "max_ngrams": max_ngrams})
+    controller.extract()
+
+    logger.info(">>> Bag of words features saved to file {}".format(output_file_path))
+
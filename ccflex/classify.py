@@ -0,0 +1,491 @@
+# Trains a classifier and classifies new instances
+# (the "train" and "predict" commands allow to train a model once and use it to classify many inputs)
+import argparse
+import logging
+import os
+import sys
+
+from common.cache import content_hash, file_hash
+from common.configuration import ConfigurationHandler
+from common.incremental import feature_columns, iter_training_chunks, partial_fit_models, training_classes, \
+    read_sample_weights, weights_of, accepts_sample_weight
+from common.models import ModelArtifact, ModelStore, model_version
+from common.parallel import map_in_order
+from common.results import ResultsWriter, class_results_files
+from common.storage import read_features, read_features_columns, features_file_hash
+from common.workspace import WorkspaceHandler
+import pandas as pd
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.linear_model import SGDClassifier
+from sklearn.tree import _tree
+import numpy as np
+from subprocess import call
+import gc
+
+logger = logging.getLogger('pyccflex')
+
+
+def tree_to_code(tree, feature_names):
+    result = ""
+    tree_ = tree.tree_
+    feature_name = [
+        feature_names[i] if i != _tree.TREE_UNDEFINED else "undefined!"
+        for i in tree_.feature
+    ]
+    result += "def tree({}):\n".format(", ".join(feature_names))
+
+    def recurse(node, depth, result):
+        indent = "  " * depth
+        if tree_.feature[node] != _tree.TREE_UNDEFINED:
+            name = feature_name[node]
+            threshold = tree_.threshold[node]
+            result += "{}if '{}' <= {}:\n".format(indent, name, threshold)
+            result = recurse(tree_.children_left[node], depth + 1, result)
+            result += "{}else:  # if '{}' > {}\n".format(indent, name, threshold)
+            result = recurse(tree_.children_right[node], depth + 1, result)
+        else:
+            result += "{}return {}\n".format(indent, np.argmax(tree_.value[node][0]), result)
+        return result
+
+    result = recurse(0, 1, result)
+    return result
+
+
+sklearn_classifiers = ("CART", "RandomForest", "KNN", "MultinomialNB", "SGD", "PassiveAggressive")
+commands = ("train", "predict")
+all_classifiers = "ALL"
+
+# options of classifiers that are not passed to sklearn: if "partial_fit" is true, a model supporting partial_fit
+# is trained reading the training file in chunks ("epochs" passes over the file), so it doesn't need to fit in memory
+PARTIAL_FIT_OPTION = "partial_fit"
+EPOCHS_OPTION = "epochs"
+streaming_options = (PARTIAL_FIT_OPTION, EPOCHS_OPTION)
+
+
+def create_model(classifier, model_options):
+    model_options = dict((k, v) for k, v in model_options.items() if k not in streaming_options)
+    if classifier == "CART":
+        return DecisionTreeClassifier(**model_options)
+    elif classifier == "RandomForest":
+        return RandomForestClassifier(**model_options)
+    elif classifier == "KNN":
+        return KNeighborsClassifier(**model_options)
+    elif classifier == "MultinomialNB":
+        return MultinomialNB(**model_options)
+    elif classifier == "SGD":
+        return SGDClassifier(**model_options)
+    elif classifier == "PassiveAggressive":
+        try:
+            from sklearn.linear_model import PassiveAggressiveClassifier
+        except ImportError:
+            # removed from newer versions of sklearn, SGDClassifier with these options is equivalent
+            pa_options = {"loss": "hinge", "penalty": None, "learning_rate": "pa1", "eta0": 1.0}
+            pa_options.update(model_options)
+            return SGDClassifier(**pa_options)
+        return PassiveAggressiveClassifier(**model_options)
+    raise Exception("Unknown classifier {} (available: {})".format(classifier, ", ".join(sklearn_classifiers)))
+
+
+def is_streaming(classifier, model_options):
+    if not model_options.get(PARTIAL_FIT_OPTION, False):
+        return False
+    if not hasattr(create_model(classifier, model_options), "partial_fit"):
+        raise Exception("The classifier {} doesn't support partial_fit".format(classifier))
+    return True
+
+
+def read_training_data(train_input_file, csv_separator, sample_weights=None):
+    logger.info(">>>> Loading and transforming inputs")
+    input_raw = read_features(train_input_file, sep=csv_separator)
+    W = None if sample_weights is None else weights_of(input_raw['id'], sample_weights)
+
+    collumns_to_drop = ['id', 'class_name']
+    if 'contents' in list(input_raw.columns):
+        collumns_to_drop.append('contents')
+    input_data = input_raw.drop(collumns_to_drop, inplace=False, axis=1)
+    del input_raw
+
+    logger.info(">>> Preparing training data")
+    Y = input_data['class_value']
+    X = input_data.drop(['class_value'], inplace=False, axis=1)
+    return X, Y, W
+
+
+def _init_training_worker(X, Y, W):
+    global training_data
+    training_data = (X, Y, W)
+
+
+def _train_in_worker(job):
+    classifier, model_options, version = job
+    X, Y, W = training_data
+    logger.info(">>> {}: training model".format(classifier))
+    model = create_model(classifier, model_options)
+    if W is not None and accepts_sample_weight(model.fit):
+        model.fit(X, Y, sample_weight=W)
+    else:
+        if W is not None:
+            logger.warning(">>> {}: the classifier doesn't support sample weights, "
+                           "training without them".format(classifier))
+        model.fit(X, Y)
+    return ModelArtifact(model, X.columns, classifier, version)
+
+
+def train_streaming(train_input_file, jobs, csv_separator, chunk_size, sample_weights=None):
+    """
+    Trains the models supporting partial_fit reading the training file in chunks of chunk_size lines; all models
+    are trained with the same passes over the file (sparse features files are read as sparse matrices).
+    """
+    classes = training_classes(train_input_file, sep=csv_separator, chunksize=chunk_size)
+    models = [create_model(classifier, model_options) for classifier, model_options, version in jobs]
+    epochs = [int(model_options.get(EPOCHS_OPTION, 1)) for classifier, model_options, version in jobs]
+    for epoch in range(max(epochs)):
+        trained_models = [model for model, model_epochs in zip(models, epochs) if model_epochs > epoch]
+        logger.info(">>> {}: training models with partial_fit (epoch {})".format(
+            ", ".join(classifier for (classifier, _, _), model_epochs in zip(jobs, epochs) if model_epochs > epoch),
+            epoch + 1))
+        partial_fit_models(trained_models, iter_training_chunks(train_input_file, sep=csv_separator,
+                                                                chunksize=chunk_size,
+                                                                sample_weights=sample_weights), classes)
+    feature_names = feature_columns(train_input_file, sep=csv_separator)
+    return [ModelArtifact(model, feature_names, classifier, version)
+            for model, (classifier, model_options, version) in zip(models, jobs)]
+
+
+def train(train_input_file, classifiers, classifiers_options_config, model_store, output_prefix, csv_separator,
+          workers=1, chunk_size=10 ** 5, sample_weights_file=None):
+    """
+    Trains models of the classifiers (in a pool of processes if workers > 1) reading the training data once.
+    Models configured with partial_fit are trained reading the training data in chunks instead.
+    If a file of sample weights is given (see read_sample_weights), the lines are weighted when training.
+    Stored models are loaded instead if the training data (with the weights) and options haven't changed.
+    """
+    train_data_hash = features_file_hash(train_input_file)
+    sample_weights = None
+    if sample_weights_file is not None:
+        train_data_hash = content_hash(train_data_hash + file_hash(sample_weights_file))
+    artifacts = {}
+    jobs = []
+    streaming_jobs = []
+    for classifier in classifiers:
+        model_options = classifiers_options_config.get(classifier, {})
+        model_name = "{}{}".format(output_prefix, classifier)
+        version = model_version(train_data_hash, classifier, model_options)
+        if model_store.exists(model_name, version):
+            model_file_path = model_store.model_file_path(model_name, version)
+            logger.info(">>> {}: training data and options haven't changed, using the model {}".format(
+                classifier, model_file_path))
+            artifacts[classifier] = model_store.load(model_file_path)
+        elif is_streaming(classifier, model_options):
+            streaming_jobs.append((classifier, model_options, version))
+        else:
+            jobs.append((classifier, model_options, version))
+
+    if sample_weights_file is not None and len(streaming_jobs) + len(jobs) > 0:
+        logger.info(">>> Loading sample weights from the file {}".format(sample_weights_file))
+        sample_weights = read_sample_weights(sample_weights_file, sep=csv_separator)
+
+    trained = []
+    if len(streaming_jobs) > 0:
+        trained = train_streaming(train_input_file, streaming_jobs, csv_separator, chunk_size, sample_weights)
+    for artifact in trained:
+        model_file_path = model_store.save("{}{}".format(output_prefix, artifact.classifier), artifact)
+        logger.info(">>> {}: model saved to the file {}".format(artifact.classifier, model_file_path))
+        artifacts[artifact.classifier] = artifact
+
+    if len(jobs) > 0:
+        X, Y, W = read_training_data(train_input_file, csv_separator, sample_weights)
+        trained = map_in_order(_train_in_worker, jobs, workers=min(workers, len(jobs)),
+                               max_chunks_in_flight=len(jobs), initializer=_init_training_worker,
+                               initargs=(X, Y, W))
+        for artifact in trained:
+            model_file_path = model_store.save("{}{}".format(output_prefix, artifact.classifier), artifact)
+            logger.info(">>> {}: model saved to the file {}".format(artifact.classifier, model_file_path))
+            artifacts[artifact.classifier] = artifact
+        del X, Y, W
+        gc.collect()
+
+    return [artifacts[classifier] for classifier in classifiers]
+
+
+def save_tree(artifact, output_tree_file_path):
+    tree_text = tree_to_code(artifact.model, artifact.feature_names)
+    with open(output_tree_file_path, "wt") as tree_file:
+        tree_file.write(tree_text)
+    logger.info(">>> {} model structure saved to the file {} ".format(artifact.classifier, output_tree_file_path))
+
+
+def log_written_results(output_name, output_file_path, no_lines, class_counts):
+    if output_file_path is not None:
+        logger.info(">>> {}: {} lines of predictions saved to {}".format(output_name, no_lines, output_file_path))
+    for decision_class, class_file_path, no_class_lines in class_counts:
+        logger.info(">>> {}: {} lines of predictions for the class \"{}\" saved to {}".format(
+            output_name, no_class_lines, decision_class['name'], class_file_path))
+
+
+def predict(artifacts, classify_input_file, workspace_dir, output_prefix, decision_classes, csv_separator,
+            chunk_size, merge=False):
+    """
+    Classifies instances in chunks with each of the models. The input is read once and only the id, contents and
+    features used by the models are read. The results of each classifier are saved to separate files; if merge is
+    True they are also saved to the merged files (classify-output-ALL). The results of each chunk are written
+    to the results files and the files of each of the classes at once, so they are never read again.
+    """
+    columns = read_features_columns(classify_input_file, sep=csv_separator)
+    feature_names = []
+    for artifact in artifacts:
+        missing = [x for x in artifact.feature_names if x not in set(columns)]
+        if len(missing) > 0:
+            raise Exception("The file {} doesn't contain {} features used by the {} model (e.g., {})".format(
+                classify_input_file, len(missing), artifact.classifier, ", ".join(missing[:5])))
+        feature_names.extend([x for x in artifact.feature_names if x not in set(feature_names)])
+
+    classify_raw_chunks = read_features(classify_input_file, sep=csv_separator, chunksize=chunk_size,
+                                        columns=['id', 'contents'] + feature_names)
+
+    writers = []
+    for artifact in artifacts:
+        output_name = "{}classify-output-{}".format(output_prefix, artifact.classifier)
+        writers.append(ResultsWriter(workspace_dir.get_results_file_path("{}.csv".format(output_name)),
+                                     class_results_files(workspace_dir, output_name, decision_classes),
+                                     ['pred_class'], sep=csv_separator))
+    all_writer = None
+    if merge:
+        all_output_name = "{}classify-output-ALL".format(output_prefix)
+        all_writer = ResultsWriter(workspace_dir.get_results_file_path("{}.csv".format(all_output_name)),
+                                   class_results_files(workspace_dir, all_output_name, decision_classes),
+                                   ["pred_{}".format(artifact.classifier) for artifact in artifacts],
+                                   sep=csv_separator)
+        writers.append(all_writer)
+
+    try:
+        for classify_raw in classify_raw_chunks:
+            output_all = classify_raw[['id', 'contents']]
+
+            for artifact, writer in zip(artifacts, writers[:len(artifacts)]):
+                classifier = artifact.classifier
+                pred = artifact.model.predict(classify_raw[artifact.feature_names])
+
+                output_full = classify_raw[['id', 'contents']]
+                output_full = output_full.assign(pred_class=pred)
+                log_written_results(classifier, writer.output_file_path, output_full.shape[0],
+                                    writer.write(output_full))
+                output_all = output_all.assign(**{"pred_{}".format(classifier): pred})
+                del output_full
+                del pred
+
+            if all_writer is not None:
+                log_written_results("ALL", all_writer.output_file_path, output_all.shape[0],
+                                    all_writer.write(output_all))
+
+            del output_all
+            del classify_raw
+            gc.collect()
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def report_classes(workspace_dir, output_file_path, output_prefix, classifier, decision_classes, csv_separator,
+                   chunk_size):
+    # Reporting results for classes (the results are saved by R, they are read once to split them by classes)
+    output_file_chunks = pd.read_csv(output_file_path, sep=csv_separator, encoding="utf-8",
+                                     chunksize=chunk_size)
+
+    output_name = "{}classify-output-{}".format(output_prefix, classifier)
+    with ResultsWriter(None, class_results_files(workspace_dir, output_name, decision_classes), ['pred_class'],
+                       sep=csv_separator) as writer:
+        for output_full in output_file_chunks:
+            log_written_results(classifier, None, output_full.shape[0], writer.write(output_full))
+            del output_full
+            gc.collect()
+
+
+def create_parser(command):
+    parser = argparse.ArgumentParser(prog="classify" if command is None else "classify {}".format(command))
+    if command is None:
+        parser.add_argument("train_input_csv",
+                            help="Path to input train csv file", type=str)
+        parser.add_argument("classify_input_csv",
+                            help="Path to input classify csv file", type=str)
+    elif command == "train":
+        parser.add_argument("train_input_csv",
+                            help="Path to input train csv file", type=str)
+    elif command == "predict":
+        parser.add_argument("classify_input_csv", nargs='+',
+                            help="Paths to input classify csv files", type=str)
+        parser.add_argument("--model", help="Path to the model file to use (by default the latest model trained "
+                                            "for the classifier and output prefix)",
+                            type=str, required=False, default=None)
+    parser.add_argument('--classifier', type=str, required=True,
+                        help="The classifier to use or ALL to use all the classifiers configured in the "
+                             "classifiers options file (with a single pass over the input)")
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--classifiers_options", help="Path to classifiers options file",
+                        type=str, required=False, default="./classifiers_options.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+    parser.add_argument("--output_prefix", help="Prefix used for the output file",
+                        type=str, required=False, default="")
+    parser.add_argument("--workers", help="Number of processes used to train the models of all classifiers",
+                        type=int, required=False, default=1)
+    if command in (None, "train"):
+        parser.add_argument("--sample_weights", help="Name of a file in the processing folder with weights of "
+                                                     "training lines: the id column and the weights (e.g., "
+                                                     "<location>-duplicates.csv saved by lines2csv "
+                                                     "--remove_global_duplicates); other lines get the weight 1",
+                            type=str, required=False, default=None)
+    return parser
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    # without a command the model is trained (or reused) and the instances are classified at once
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = argv[0] if len(argv) > 0 and argv[0] in commands else None
+    parser = create_parser(command)
+    args = vars(parser.parse_args(argv if command is None else argv[1:]))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    classifiers_options_file_path = args['classifiers_options']
+    chunk_size = args['chunk_size']
+    output_prefix = args['output_prefix']
+    workers = args['workers']
+
+    classifier = args['classifier']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classifiers_options_config = ConfigurationHandler(classifiers_options_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classifiers_options_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    if classifier == all_classifiers:
+        # skip keys that do not represent classifiers
+        classifiers = [x for x in classifiers_options_config.config.keys() if x in sklearn_classifiers]
+        skipped = [x for x in classifiers_options_config.config.keys() if x not in sklearn_classifiers + ("INFO",)]
+        if len(skipped) > 0:
+            logger.info(">>> Skipping the classifiers {} (they need to be run separately)".format(", ".join(skipped)))
+        if len(classifiers) == 0:
+            logger.error("There are no sklearn classifiers in the file {}".format(classifiers_options_file_path))
+            exit(1)
+    else:
+        classifiers = [classifier]
+
+    if command is not None and classifier not in sklearn_classifiers + (all_classifiers,):
+        logger.error("The {} command is available only for the classifiers: {}".format(
+            command, ", ".join(sklearn_classifiers)))
+        exit(1)
+
+    model_store = ModelStore(workspace_dir.get_models_dir_path())
+
+    logger.info(">>>> Setting up paths complete!")
+
+    # train models
+    artifacts = []
+    if command in (None, "train") and classifier != "C50":
+        train_input_file = workspace_dir.get_processing_file_path(args['train_input_csv'])
+        sample_weights_file = None
+        if args['sample_weights'] is not None:
+            sample_weights_file = workspace_dir.get_processing_file_path(args['sample_weights'])
+        artifacts = train(train_input_file, classifiers, classifiers_options_config, model_store, output_prefix,
+                          csv_separator, workers=workers, chunk_size=chunk_size,
+                          sample_weights_file=sample_weights_file)
+
+        for artifact in artifacts:
+            if artifact.classifier == "CART":
+                save_tree(artifact, workspace_dir.get_results_file_path(
+                    "{}classify-output-{}-model.txt".format(output_prefix, artifact.classifier)))
+
+    if command == "train":
+        exit(0)
+
+    # load models
+    if command == "predict":
+        for model_classifier in classifiers:
+            model_name = "{}{}".format(output_prefix, model_classifier)
+            model_file_path = args['model'] if args['model'] is not None and classifier != all_classifiers \
+                else model_store.latest_model_file_path(model_name)
+            if model_file_path is None or not os.path.isfile(model_file_path):
+                logger.error("There is no trained model for {}, run: classify train".format(model_name))
+                exit(1)
+            logger.info(">>> {}: loading the model {}".format(model_classifier, model_file_path))
+            artifacts.append(model_store.load(model_file_path))
+        classify_input_csvs = args['classify_input_csv']
+    else:
+        classify_input_csvs = [args['classify_input_csv']]
+
+    # classify instances
+    logger.info(">>> {}: classifying instances".format(classifier))
+
+    for classify_input_csv in classify_input_csvs:
+        classify_input_file = workspace_dir.get_processing_file_path(classify_input_csv)
+
+        # outputs for many inputs are distinguished by the names of the input files
+        input_output_prefix = output_prefix
+        if len(classify_input_csvs) > 1:
+            input_output_prefix = "{}{}-".format(output_prefix,
+                                                 os.path.splitext(os.path.basename(classify_input_csv))[0])
+
+        # Running C50 algorithm training and classification in R
+        if classifier == "C50":
+            train_input_file = workspace_dir.get_processing_file_path(args['train_input_csv'])
+            output_file_prefix = workspace_dir.get_results_file_path(
+                "{}classify-output-{}".format(output_prefix, classifier))
+            r_script_exec = locations_config.get("rscript_executable_path", "RScript.exe")
+
+            call([r_script_exec, "./bin/classify_c5.R", train_input_file, classify_input_file, output_file_prefix,
+                  classifiers_options_file_path, classes_file_path, csv_separator])
+
+            output_file_path = workspace_dir.get_results_file_path(
+                "{}classify-output-{}.csv".format(input_output_prefix, classifier))
+            report_classes(workspace_dir, output_file_path, input_output_prefix, classifier, decision_classes,
+                           csv_separator, chunk_size)
+
+        # Classifying instances for sklearn algorithms
+        else:
+            try:
+                predict(artifacts, classify_input_file, workspace_dir, input_output_prefix, decision_classes,
+                        csv_separator, chunk_size, merge=(classifier == all_classifiers))
+            except Exception as e:
+                logger.error(str(e))
+                exit(1)
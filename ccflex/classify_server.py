@@ -0,0 +1,208 @@
+# Runs a local server classifying lines of files on demand with trained models kept in memory
+
+import argparse
+import logging
+import os
+
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+from common.classification_server import LineClassifier, ClassificationService, ClassificationHTTPServer, \
+    ClassificationUnixServer
+from common.configuration import ConfigurationHandler
+from common.models import ModelStore
+from common.workspace import WorkspaceHandler
+from prepare.case_extractors import LinesCaseExtractor
+from prepare.feature_extractors import CountVectorizerBasedFeatureExtraction, manual_features_extractors
+from prepare.online_features import OnlineFeaturesBuilder
+from prepare.vocabularies import VocabularyTokenizer
+
+logger = logging.getLogger('pyccflex')
+
+
+def bag_of_words_extractor(vocabulary_file_path, base_vocabulary_file_path, separator, min_ngrams, max_ngrams,
+                           token_signature_for_missing):
+    """Returns the bag of words extractor configured the same way as by bag_of_words."""
+    base_vocab = pd.read_csv(base_vocabulary_file_path, sep=separator, encoding="utf-8")
+    vocabulary = pd.read_csv(vocabulary_file_path, sep=separator, encoding="utf-8")
+    tokenizer = VocabularyTokenizer(set(base_vocab.token), token_signature_for_missing)
+    tokens = list(vocabulary['token'])
+    vocab = dict((key, value) for value, key in enumerate(tokens))
+    count_vect = CountVectorizer(ngram_range=(min_ngrams, max_ngrams), tokenizer=tokenizer, vocabulary=vocab,
+                                 lowercase=False)
+    count_vect.fit([""])
+    return CountVectorizerBasedFeatureExtraction(count_vect, separator, "{}".format(separator))
+
+
+def file_modification_times(paths):
+    return dict((path, os.path.getmtime(path) if path is not None and os.path.isfile(path) else None)
+                for path in paths)
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classifier', nargs='+', type=str, required=True,
+                        help="The classifiers which models (trained by classify) are used")
+    parser.add_argument("--output_prefix", help="Prefix used for the output file when the models were trained",
+                        type=str, required=False, default="")
+    parser.add_argument("--vocabulary_file_name", help="Name of the vocabulary file used to extract bag of words "
+                                                       "features (no bag of words features if not given)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--token_signature_for_missing", help="Use token signatures for tokens outside of "
+                                                              "the base vocabulary (see bag_of_words)",
+                        default=False, action='store_true')
+    parser.add_argument("--min_ngrams", help="Min. number of n-grams",
+                        type=int, required=False, default=1)
+    parser.add_argument("--max_ngrams", help="Max. number of n-grams",
+                        type=int, required=False, default=1)
+    parser.add_argument('--extractors', nargs='+', type=str, required=False, default=[],
+                        help="The list of manual feature extractors (see predefined_manual_features)")
+    parser.add_argument("--legacy_pattern_extractors", help="Use a separate extractor for each pattern instead of "
+                                                            "the compiled one",
+                        default=False, action='store_true')
+    parser.add_argument("--block_features_config", help="Path to a json file with the list of block features "
+                                                        "(the \"block_features\" key, see "
+                                                        "extract_block_features_from_features)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--prev_cases", help="The number of preceding cases (see add_seq_context)",
+                        default=0, type=int)
+    parser.add_argument("--next_cases", help="The number of proceeding cases (see add_seq_context)",
+                        default=0, type=int)
+    parser.add_argument("--max_line_length", help="Maximum line length; if exceeded it will be truncated.",
+                        type=int, required=False, default=1000)
+    parser.add_argument("--socket", help="Path to a Unix socket to listen on (instead of the localhost port)",
+                        type=str, required=False, default=None)
+    parser.add_argument("--host", help="The address to listen on",
+                        type=str, required=False, default="127.0.0.1")
+    parser.add_argument("--port", help="The port to listen on",
+                        type=int, required=False, default=8765)
+    parser.add_argument("--batch_wait", help="Milliseconds to wait for more requests to classify them together",
+                        type=float, required=False, default=2.0)
+    parser.add_argument("--max_batch_lines", help="Maximum number of lines classified together",
+                        type=int, required=False, default=10 ** 5)
+    parser.add_argument("--reload_interval", help="Seconds between checks if the models or their configuration "
+                                                  "changed (they are reloaded if so)",
+                        type=float, required=False, default=2.0)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--manual_features_config", help="Path to manual features configuration file",
+                        type=str, required=False, default="./manual_features.json")
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    manual_features_file_path = args['manual_features_config']
+    block_features_file_path = args['block_features_config']
+    classifiers = args['classifier']
+    output_prefix = args['output_prefix']
+    extractors_to_use = args['extractors']
+    legacy_pattern_extractors = args['legacy_pattern_extractors']
+    token_signature_for_missing = args['token_signature_for_missing']
+    min_ngrams = args['min_ngrams']
+    max_ngrams = args['max_ngrams']
+    prev_cases = args['prev_cases']
+    next_cases = args['next_cases']
+    max_line_length = args['max_line_length']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+
+    separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+    model_store = ModelStore(workspace_dir.get_models_dir_path())
+
+    vocabulary_file_path = None
+    base_vocabulary_file_path = None
+    if args['vocabulary_file_name'] is not None:
+        vocabulary_file_path = workspace_dir.get_processing_file_path(args['vocabulary_file_name'])
+        base_vocabulary_file_path = workspace_dir.get_processing_file_path("base-" + args['vocabulary_file_name'])
+
+    config_file_paths = [x for x in [vocabulary_file_path, base_vocabulary_file_path, block_features_file_path,
+                                     manual_features_file_path if len(extractors_to_use) > 0 else None]
+                         if x is not None]
+    model_names = ["{}{}".format(output_prefix, classifier) for classifier in classifiers]
+
+    def current_sources():
+        return file_modification_times([model_store.latest_model_file_path(name) for name in model_names] +
+                                       config_file_paths)
+
+    def load_classifier():
+        sources = current_sources()
+        extractors = []
+        if vocabulary_file_path is not None:
+            logger.info(">>> Loading vocabularies")
+            extractors.append(bag_of_words_extractor(vocabulary_file_path, base_vocabulary_file_path, separator,
+                                                     min_ngrams, max_ngrams, token_signature_for_missing))
+        if len(extractors_to_use) > 0:
+            logger.info(">>> Preparing feature extractors")
+            extractors.extend(manual_features_extractors(extractors_to_use,
+                                                         ConfigurationHandler(manual_features_file_path),
+                                                         legacy_pattern_extractors))
+        block_features = []
+        if block_features_file_path is not None:
+            block_features = ConfigurationHandler(block_features_file_path).get("block_features", [])
+        features_builder = OnlineFeaturesBuilder(extractors, block_features=block_features, prev_cases=prev_cases,
+                                                 next_cases=next_cases, max_line_length=max_line_length)
+
+        artifacts = []
+        for model_name in model_names:
+            model_file_path = model_store.latest_model_file_path(model_name)
+            if model_file_path is None:
+                raise Exception("There is no trained model for {}, run: classify train".format(model_name))
+            logger.info(">>> Loading the model {}".format(model_file_path))
+            artifacts.append(model_store.load(model_file_path))
+        return LineClassifier(features_builder, artifacts, sources)
+
+    try:
+        service = ClassificationService(load_classifier, current_sources, batch_wait=args['batch_wait'] / 1000.0,
+                                        max_batch_lines=args['max_batch_lines'],
+                                        reload_interval=args['reload_interval'])
+    except Exception as e:
+        logger.error("Couldn't load the models: {}".format(e))
+        exit(1)
+
+    # lines are split and their classes (prefixes) are removed the same way as by lines2csv
+    lines_extractor = LinesCaseExtractor({}, None, decision_classes, max_line_length=max_line_length)
+
+    if args['socket'] is not None:
+        server = ClassificationUnixServer(args['socket'], service, lines_extractor.extract_lines)
+        logger.info(">>> Listening on the Unix socket {}".format(args['socket']))
+    else:
+        server = ClassificationHTTPServer((args['host'], args['port']), service, lines_extractor.extract_lines)
+        logger.info(">>> Listening on http://{}:{}".format(args['host'], args['port']))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(">>> Stopping the server")
+    finally:
+        server.server_close()
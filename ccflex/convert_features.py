@@ -0,0 +1,76 @@
+# Converts a features file between the storage formats (csv, parquet, arrow) based on the file extensions
+
+import argparse
+import logging
+import os
+
+from common.configuration import ConfigurationHandler
+from common.storage import read_features, file_format_of, FeaturesWriter, FEATURES_EXTENSIONS
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file",
+                        help="Name of the features file to convert (e.g., train-features.csv)", type=str)
+    parser.add_argument("output_file",
+                        help="Name of the output file (e.g., train-features.parquet)", type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    input_file = args['input_file']
+    output_file = args['output_file']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    input_file_path = workspace_dir.get_processing_file_path(input_file)
+    output_file_path = workspace_dir.get_processing_file_path(output_file)
+
+    if os.path.splitext(output_file_path)[1] not in FEATURES_EXTENSIONS[:-1]:
+        logger.error("The output file needs to have one of the extensions: {}".format(
+            ", ".join(FEATURES_EXTENSIONS[:-1])))
+        exit(1)
+    output_format = file_format_of(output_file_path)
+
+    logger.info(">>> Converting the file {} to the {} format".format(input_file_path, output_format))
+
+    input_df_chunks = read_features(input_file_path, sep=csv_separator, chunksize=chunk_size, resolve=False,
+                                    low_memory=False, dtype={'id': object})
+
+    with FeaturesWriter(output_file_path, sep=csv_separator, storage_format=output_format) as writer:
+        for input_df in input_df_chunks:
+            writer.write(input_df)
+            logger.info(">>> Converted {} lines".format(input_df.shape[0]))
+
+    logger.info(">>> Output saved to the file {}".format(writer.file_path))
@@ -0,0 +1,47 @@
+# Creates a temporary folder
+
+import argparse
+import logging
+import os
+import shutil
+
+from common.configuration import ConfigurationHandler
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_name",
+                        help="Name of the file from the data subdirectory to copy to the workspace", type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    file_name = args['file_name']
+
+    try:
+        config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    workspace_dir_conf = config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    from_file = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + os.path.sep + "data" + os.path.sep + \
+                args['file_name']
+    to_file = workspace_dir.get_processing_file_path(args['file_name'])
+
+    print(from_file)
+    print(to_file)
+    shutil.copy(from_file, to_file)
+
+    logger.info(">>> Copied the file {} to {}".format(from_file, to_file))
@@ -0,0 +1,223 @@
+# Evaluates accuracy with respect to oracle
+
+import argparse
+import collections
+import logging
+import os
+import pprint
+
+import pandas as pd
+import gc
+import numpy as np
+import csv
+import itertools
+
+from common.configuration import ConfigurationHandler
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def plot_confusion_matrix(cm, classes,
+                          normalize=False,
+                          title='Confusion matrix',
+                          cmap=None):
+    """
+    This function prints and plots the confusion matrix.
+    Normalization can be applied by setting `normalize=True`.
+    """
+    import matplotlib.pyplot as plt
+    if cmap is None:
+        cmap = plt.cm.Blues
+    np.set_printoptions(precision=2)
+
+    if normalize:
+        cm = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+
+    plt.imshow(cm, interpolation='nearest', cmap=cmap)
+    plt.title(title)
+    plt.colorbar()
+    tick_marks = np.arange(len(classes))
+    plt.xticks(tick_marks, classes, rotation=45)
+    plt.yticks(tick_marks, classes)
+
+    fmt = '.2f' if normalize else 'd'
+    thresh = cm.max() / 2.
+    for i, j in itertools.product(range(cm.shape[0]), range(cm.shape[1])):
+        plt.text(j, i, format(cm[i, j], fmt),
+                 horizontalalignment="center",
+                 color="white" if cm[i, j] > thresh else "black")
+
+    plt.tight_layout()
+    plt.ylabel('True label')
+    plt.xlabel('Predicted label')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("oracle_file",
+                        help="Path to a file containing class_value column used as an oracle", type=str)
+    parser.add_argument("pred_file",
+                        help="Path to prediction file", type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    oracle_file = args['oracle_file']
+    pred_file = args['pred_file']
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+    classes_labels = [decision_classes['default']['name']]
+    for class_labeled in decision_classes['labeled']:
+        classes_labels.append(class_labeled['name'])
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>>> Starting to merge the result csv files...")
+
+    output_file_path = workspace_dir.get_results_file_path("acc-" + pred_file)
+    output_oracle_vs_pred_file_path = workspace_dir.get_results_file_path("oracle-vs-" + pred_file)
+    output_file_confusion_matrix_path = workspace_dir.get_results_file_path("acc-" + pred_file.replace(".csv", ".pdf"))
+
+    oracle_file_path = workspace_dir.get_results_file_path(oracle_file)
+    pred_file_path = workspace_dir.get_results_file_path(pred_file)
+
+    logger.info(">>>> Comparing predictions with the oracle")
+
+    # the confusion matrix is accumulated chunk by chunk (counts of pairs of the oracle and predicted class values)
+    confusion_counts = collections.Counter()
+    oracle_chunks = pd.read_csv(oracle_file_path, sep=csv_separator, encoding="utf-8", chunksize=chunk_size,
+                                usecols=['id', 'contents', 'class_value'], dtype={'id': str, 'contents': str},
+                                keep_default_na=False)
+    pred_chunks = pd.read_csv(pred_file_path, sep=csv_separator, encoding="utf-8", chunksize=chunk_size,
+                              usecols=['id', 'pred_class'], dtype={'id': str}, keep_default_na=False)
+
+    with open(output_oracle_vs_pred_file_path, "w", newline='', encoding="utf-8") as out_csv:
+        header = True
+        no_rows = 0
+        # the chunks of both files have the same size, so the files have the same number of rows only if each pair
+        # of chunks has (and both files end together)
+        for oracle_df, pred_df in itertools.zip_longest(oracle_chunks, pred_chunks):
+            no_oracle_rows = 0 if oracle_df is None else oracle_df.shape[0]
+            no_pred_rows = 0 if pred_df is None else pred_df.shape[0]
+            if no_oracle_rows != no_pred_rows:
+                raise Exception("The numbers of lines of the oracle and the predictions differ: {} != {}".format(
+                    no_rows + no_oracle_rows + sum(x.shape[0] for x in oracle_chunks),
+                    no_rows + no_pred_rows + sum(x.shape[0] for x in pred_chunks)))
+            no_rows += no_oracle_rows
+            mismatched = np.flatnonzero(oracle_df['id'].to_numpy() != pred_df['id'].to_numpy())
+            if len(mismatched) > 0:
+                raise Exception("Lines do not match! {} != {}".format(oracle_df['id'].iloc[mismatched[0]],
+                                                                     pred_df['id'].iloc[mismatched[0]]))
+
+            oracle_vs_pred = pd.DataFrame({'id': oracle_df['id'].to_numpy(),
+                                           'contents': oracle_df['contents'].to_numpy(),
+                                           'class_value': oracle_df['class_value'].to_numpy(dtype=float),
+                                           'class_pred': pred_df['pred_class'].to_numpy(dtype=float)})
+            oracle_vs_pred.to_csv(out_csv, sep=csv_separator, index=False, encoding="utf-8", header=header,
+                                  quoting=csv.QUOTE_NONNUMERIC, lineterminator="\r\n")
+            header = False
+
+            pairs, counts = np.unique(np.column_stack([oracle_vs_pred['class_value'].to_numpy(dtype=int),
+                                                       oracle_vs_pred['class_pred'].to_numpy(dtype=int)]),
+                                      axis=0, return_counts=True)
+            confusion_counts.update(dict(((int(y_true), int(y_pred)), int(count))
+                                         for (y_true, y_pred), count in zip(pairs, counts)))
+
+        if header:
+            pd.DataFrame(columns=['id', 'contents', 'class_value', 'class_pred']).to_csv(
+                out_csv, sep=csv_separator, index=False, encoding="utf-8", quoting=csv.QUOTE_NONNUMERIC,
+                lineterminator="\r\n")
+
+    labels = sorted(set(y for pair in confusion_counts for y in pair) | {0, 1})
+    if labels != [0, 1]:
+        logger.error("Only two classes (0 and 1) can be evaluated, the class values are: {}".format(labels))
+        exit(1)
+    cnf_matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    for (y_true, y_pred), count in confusion_counts.items():
+        cnf_matrix[labels.index(y_true), labels.index(y_pred)] += count
+
+    tp = cnf_matrix[1, 1]
+    fp = cnf_matrix[0, 1]
+
+    tn = cnf_matrix[0, 0]
+    fn = cnf_matrix[1, 0]
+
+    n = int(cnf_matrix.sum())
+
+    # the same as accuracy_score, precision_score, recall_score and f1_score of sklearn (0 if undefined)
+    acc = float(tp + tn) / n if n > 0 else 0.0
+    precision = float(tp) / (tp + fp) if tp + fp > 0 else 0.0
+    recall = float(tp) / (tp + fn) if tp + fn > 0 else 0.0
+    f1score = float(2 * tp) / (2 * tp + fp + fn) if tp + fp + fn > 0 else 0.0
+
+    print("Accuracy = {}".format(acc))
+    print("Precision = {}".format(precision))
+    print("Recall = {}".format(recall))
+    print("F1-score = {}".format(f1score))
+    print("TP = {}, TN = {}, FP = {}, FN = {}, N = {}".format(tp, tn, fp, fn, n))
+    pprint.pprint(cnf_matrix)
+
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(15, 6))
+
+    plt.subplot(1, 2, 1)
+    plot_confusion_matrix(cnf_matrix, classes=classes_labels,
+                          title='Confusion matrix, without normalization')
+
+    # Plot normalized confusion matrix
+    plt.subplot(1, 2, 2)
+    plot_confusion_matrix(cnf_matrix, classes=classes_labels, normalize=True,
+                          title='Normalized confusion matrix')
+
+    fig.savefig(output_file_confusion_matrix_path)
+
+    with open(output_file_path, "w", newline='', encoding="utf-8") as out_csv:
+        writer = csv.writer(out_csv, delimiter=csv_separator, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+
+        header_row = ['name', 'classifer', 'rule',
+                      'N', 'TP', 'FP', 'TN', 'FN',
+                      "Accuracy", "Precision", "Recall", "F1-Score"]
+        writer.writerow(header_row)
+
+        row = ['', '', '',
+               n, tp, fp, tn, fn,
+               acc, precision, recall, f1score]
+        writer.writerow(row)
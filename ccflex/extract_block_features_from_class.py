@@ -0,0 +1,118 @@
+# Extracts "block" features based on previously predicted class
+
+import argparse
+import logging
+import csv
+
+import numpy as np
+import pandas as pd
+
+from common.configuration import ConfigurationHandler
+from common.workspace import WorkspaceHandler
+from prepare.block_features import BlockFeatureTracker, file_names_of
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("input_file",
+                        help="Path to classification file", type=str)
+    parser.add_argument("output_file",
+                        help="Path to output csv file", type=str)
+    parser.add_argument("feature_name",
+                        help="The name of feature to create", type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--block_classes_config", help="Path to block classes configuration file",
+                        type=str, required=False, default="./block_classes.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    input_file = args['input_file']
+    output_file = args['output_file']
+    add_contents = args['add_contents']
+    feature_name = args['feature_name']
+    block_classes_file_path = args['block_classes_config']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        block_classes_config = ConfigurationHandler(block_classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(block_classes_file_path))
+        exit(1)
+    block_decision_classes = block_classes_config.get("classes", {})
+
+    block_value_to_label = {x['value']: x['name'] for x in block_decision_classes['labeled']}
+    block_value_to_label[block_decision_classes['default']['value']] = block_decision_classes['default']['name']
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>> Loading input the file {}".format(input_file))
+
+    input_file_path = workspace_dir.get_results_file_path(input_file)
+    output_file_path = workspace_dir.get_processing_file_path(output_file)
+
+    # only the ids, the predicted classes and the contents (if added) are read
+    input_columns = ['id', 'pred_class'] + (['contents'] if add_contents else [])
+    reader = pd.read_csv(input_file_path, sep=csv_separator, encoding="utf-8", usecols=input_columns,
+                         dtype={'id': str, 'contents': str}, keep_default_na=False, chunksize=chunk_size)
+
+    block_values = dict((label, [value for value, x in block_value_to_label.items() if x == label])
+                        for label in ['start', 'end', 'start_end'])
+    tracker = BlockFeatureTracker()
+    with open(output_file_path, "w", newline='', encoding="utf-8") as out_csv:
+        writer = csv.writer(out_csv, delimiter=csv_separator, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+
+        header_row = ['id', feature_name]
+        if add_contents:
+            header_row.append('contents')
+        writer.writerow(header_row)
+
+        for chunk in reader:
+            pred_class = chunk['pred_class'].to_numpy(dtype=np.float64).astype(np.int64)
+            unknown = ~np.isin(pred_class, list(block_value_to_label.keys()))
+            if unknown.any():
+                logger.error("Unknown block class {} of the line {}".format(
+                    pred_class[unknown][0], chunk['id'].to_numpy()[unknown][0]))
+                exit(1)
+            start_end = np.isin(pred_class, block_values['start_end'])
+            feature_values = tracker.values(file_names_of(chunk['id']),
+                                            start_end | np.isin(pred_class, block_values['start']),
+                                            start_end | np.isin(pred_class, block_values['end']))
+            out_columns = [chunk['id'].tolist(), feature_values.tolist()]
+            if add_contents:
+                out_columns.append(chunk['contents'].tolist())
+            writer.writerows(zip(*out_columns))
+
+    logger.info(">>> Output saved to the file {}".format(output_file))
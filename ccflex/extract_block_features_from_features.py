@@ -0,0 +1,113 @@
+# Extracts "block" features based on existing features
+
+import argparse
+import logging
+import numpy as np
+
+from common.configuration import ConfigurationHandler
+from common.storage import read_features, read_features_columns, storage_format_of, FeaturesWriter
+from common.workspace import WorkspaceHandler
+from prepare.block_features import BlockFeatureTracker, file_names_of
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("input_file",
+                        help="Path to a feature file", type=str)
+    parser.add_argument("output_file",
+                        help="Path to output csv file", type=str)
+    parser.add_argument("feature_name",
+                        help="The name of feature to create", type=str)
+    parser.add_argument("--feature_start", nargs='+', type=str,
+                        help="The name of feature to start a block", required=True)
+    parser.add_argument("--feature_end", nargs='+', type=str,
+                        help="The name of feature to end a block", required=True)
+    parser.add_argument("--forbidding_features", nargs='+', type=str, required=False, default=[],
+                        help="If any of these features are greater than zero the feature is set to zero")
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    input_file = args['input_file']
+    output_file = args['output_file']
+    add_contents = args['add_contents']
+    feature_name = args['feature_name']
+    feature_start = args['feature_start']
+    feature_end = args['feature_end']
+    forbidding_features = args['forbidding_features']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+    csv_separator = files_format_config.get("csv_sep", ",")
+    storage_format = storage_format_of(files_format_config)
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>> Loading input the file {}".format(input_file))
+
+    input_file_path = workspace_dir.get_processing_file_path(input_file)
+    output_file_path = workspace_dir.get_processing_file_path(output_file)
+
+    # only the ids, the referenced features and the contents (if added) are read; missing features are zeros
+    available_columns = set(read_features_columns(input_file_path, sep=csv_separator))
+    referenced_columns = [x for x in dict.fromkeys(feature_start + feature_end + forbidding_features)
+                          if x in available_columns]
+    input_columns = ['id'] + (['contents'] if add_contents else []) + referenced_columns
+    reader = read_features(input_file_path, sep=csv_separator, chunksize=chunk_size, columns=input_columns,
+                           dtype={'id': str, 'contents': str}, keep_default_na=False)
+
+    def any_positive(chunk, features):
+        features = [x for x in features if x in available_columns]
+        if len(features) == 0:
+            return np.zeros(chunk.shape[0], dtype=bool)
+        return np.trunc(chunk[features].to_numpy(dtype=np.float64)).sum(axis=1) > 0
+
+    tracker = BlockFeatureTracker()
+    with FeaturesWriter(output_file_path, sep=csv_separator, storage_format=storage_format) as writer:
+
+        header_row = ['id', feature_name]
+        if add_contents:
+            header_row.append('contents')
+
+        for chunk in reader:
+            feature_values = tracker.values(file_names_of(chunk['id']), any_positive(chunk, feature_start),
+                                            any_positive(chunk, feature_end),
+                                            any_positive(chunk, forbidding_features))
+            out_columns = [chunk['id'].tolist(), feature_values.tolist()]
+            if add_contents:
+                out_columns.append(chunk['contents'].fillna("").tolist())
+            writer.write_rows(header_row, list(zip(*out_columns)))
+
+        if writer.no_chunks == 0:
+            writer.write_rows(header_row, [])
+
+    logger.info(">>> Output saved to the file {}".format(writer.file_path))
@@ -0,0 +1,261 @@
+# Finds similar lines (e.g., duplicates) that are labeled differently in a features file
+
+import argparse
+import csv
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import pdist, squareform
+from sklearn.neighbors import BallTree, KDTree
+
+from common.configuration import ConfigurationHandler
+from common.parallel import map_in_order
+from common.storage import read_features
+
+logger = logging.getLogger('pyccflex')
+
+# KD-trees are faster for a small number of features, ball trees cope better with many features
+KD_TREE_MAX_FEATURES = 20
+
+index = None
+
+
+def _init_query_worker(neighbour_index):
+    global index
+    index = neighbour_index
+
+
+def _query_in_worker(job):
+    values, threshold_distance = job
+    return index.query_radius(values, r=threshold_distance)
+
+
+def duplicate_groups(X_values):
+    """
+    Groups identical rows (hash buckets of rows verified by comparing them to the first row of a bucket).
+    Returns the group of each row and the first row of each group.
+    """
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(X_values), index=False).values
+    groups, _ = pd.factorize(hashes)
+    first_rows = np.full(groups.max() + 1 if len(groups) > 0 else 0, len(groups), dtype=np.int64)
+    np.minimum.at(first_rows, groups, np.arange(len(groups)))
+    if not np.array_equal(X_values, X_values[first_rows[groups]]):
+        logger.info(">>> Hash collision found, grouping rows by sorting them")
+        _, first_rows, groups = np.unique(X_values, axis=0, return_index=True, return_inverse=True)
+        groups = groups.reshape(-1)
+    return groups, first_rows
+
+
+def neighbour_groups(unique_values, threshold_distance, workers=1, batch_size=10 ** 4):
+    """Returns, for each of the unique rows, the indices of unique rows within the Manhattan threshold distance."""
+    if threshold_distance <= 0:
+        return [np.array([i]) for i in range(unique_values.shape[0])]
+    tree_type = KDTree if unique_values.shape[1] <= KD_TREE_MAX_FEATURES else BallTree
+    logger.info(">>> Building {} of {} unique lines".format(tree_type.__name__, unique_values.shape[0]))
+    neighbour_index = tree_type(unique_values, metric='manhattan')
+    jobs = ((values, threshold_distance) for values in
+            (unique_values[start:start + batch_size] for start in range(0, unique_values.shape[0], batch_size)))
+    result = []
+    for neighbours in map_in_order(_query_in_worker, jobs, workers=workers,
+                                   initializer=_init_query_worker, initargs=(neighbour_index,)):
+        result.extend(neighbours)
+        logger.info(">>> Found neighbours of {} unique lines".format(len(result)))
+    return result
+
+
+def inconsistent_pairs_with_index(X_values, class_values, threshold_distance, workers=1, batch_size=10 ** 4):
+    """
+    Yields pairs (i, j), i < j, of lines within the Manhattan threshold distance having different labels, in the same
+    order as the pairwise search. Identical lines are grouped (hash buckets) and only the unique lines are searched
+    for neighbours using a KD-tree or a ball tree, so the memory doesn't grow quadratically with the number of lines.
+    """
+    groups, first_rows = duplicate_groups(X_values)
+    logger.info(">>> Found {} unique lines out of {}".format(len(first_rows), len(groups)))
+    neighbours = neighbour_groups(X_values[first_rows], threshold_distance, workers=workers, batch_size=batch_size)
+
+    order = np.argsort(groups, kind='stable')
+    members = np.split(order, np.cumsum(np.bincount(groups, minlength=len(first_rows)))[:-1])
+    group_labels = [set(class_values[rows]) for rows in members]
+    # lines of a group are inconsistent if there are different labels among the lines of neighbouring groups
+    inconsistent_groups = np.array([len(set().union(*(group_labels[g] for g in group_neighbours))) > 1
+                                    for group_neighbours in neighbours], dtype=bool)
+
+    for i in np.flatnonzero(inconsistent_groups[groups]):
+        candidates = np.concatenate([members[g] for g in neighbours[groups[i]]])
+        candidates = np.sort(candidates[(candidates > i) & (class_values[candidates] != class_values[i])])
+        for j in candidates:
+            yield i, j
+
+
+def inconsistent_pairs_pairwise(X_values, class_values, threshold_distance):
+    """Yields pairs (i, j), i < j, of lines within the threshold distance having different labels (full distance matrix)."""
+    d_matrix = squareform(pdist(X_values, 'cityblock'))
+    for i in range(d_matrix.shape[0]):
+        for j in range(i, d_matrix.shape[0]):
+            if i != j and d_matrix[i, j] <= threshold_distance and class_values[i] != class_values[j]:
+                yield i, j
+
+
+def plot_dendrogram(plot_data, X_plot, threshold_distance, output_dendogram_file):
+    import matplotlib.pyplot as plt
+    from scipy.cluster.hierarchy import dendrogram, linkage
+
+    data_link = linkage(pdist(X_plot, 'cityblock'), 'ward')
+    with_contents = "contents" in plot_data.columns
+
+    def llf(idx):
+        if with_contents:
+            return "{}:{} : {}".format(plot_data.index[idx], plot_data.contents.iloc[idx],
+                                       plot_data.class_name.iloc[idx])
+        else:
+            return "{}: {}".format(plot_data.index[idx], plot_data.class_name.iloc[idx])
+
+    try:
+        fig = plt.figure(figsize=(20, plot_data.shape[0] * 0.2))
+        dendrogram(data_link,
+                   labels=plot_data.contents.values if with_contents else plot_data.id.values,
+                   show_leaf_counts=True,
+                   orientation='right',
+                   leaf_font_size=10,
+                   leaf_label_func=llf,
+                   distance_sort=False,
+                   color_threshold=threshold_distance,
+                   show_contracted=True)
+        plt.xlabel('Manhattan Distance')
+        plt.ylabel('Lines')
+
+        ax = plt.gca()
+
+        label_colors = {'ignore': 'r', 'count': 'g'}
+
+        xlbls = ax.get_ymajorticklabels()
+        for lbl in xlbls:
+            idx = int(lbl.get_text().split(":")[0])
+            class_name = plot_data.class_name.loc[idx]
+            lbl.set_color(label_colors.get(class_name, "b"))
+
+        plt.tight_layout(pad=5, w_pad=5, h_pad=5)
+        plt.savefig(output_dendogram_file)
+    except (ValueError, KeyError) as e:
+        pass
+
+
+def plot_tsne(plot_data, X_plot, output_tsne_file):
+    from sklearn.manifold import TSNE
+    from ggplot import ggplot, aes, geom_point, geom_text, ggtitle
+
+    tsne = TSNE(n_components=2, verbose=1, n_iter=10000)
+    tsne_results = tsne.fit_transform(X_plot)
+    df_tsne = pd.concat([pd.DataFrame(tsne_results, columns=("x-tsne", "y-tsne")),
+                         plot_data.class_name.reset_index(drop=True),
+                         pd.Series(plot_data.index.values, name="line")], axis=1)
+    df_tsne['line'] = df_tsne['line'].astype(str)
+    chart = ggplot(df_tsne, aes(x='x-tsne', y='y-tsne', color='class_name', shape='class_name', label='line')) \
+            + geom_point(size=70, alpha=0.5) \
+            + geom_text(size=8, position='jitter') \
+            + ggtitle("tSNE dimensions for lines")
+    ggplot.save(chart, output_tsne_file, 15, 10, 300)
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_path",
+                        help="A path to a feature file", type=str)
+    parser.add_argument('--threshold_distance', type=int,
+                        help="A minimal Manhattan distance to say that lines are similar",
+                        required=False, default=0)
+    parser.add_argument("--tsne", help="If used t-SNE 2D plot will be generated ",
+                        default=False, action='store_true')
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--neighbour_index", help="Search for similar lines using a tree index of unique lines "
+                                                  "instead of the matrix of distances between all lines "
+                                                  "(for large files)",
+                        default=False, action='store_true')
+    parser.add_argument("--workers", help="Number of processes querying the index (used with --neighbour_index)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--batch_size", help="Number of unique lines in a batch of queries to the index",
+                        type=int, required=False, default=10 ** 4)
+    parser.add_argument("--plot_sample_size", help="Number of lines sampled to generate the plots (by default all "
+                                                   "lines; with --neighbour_index the dendrogram is generated only "
+                                                   "if the sample size is given)",
+                        type=int, required=False, default=None)
+    parser.add_argument("--no_dendrogram", help="If used the dendrogram will not be generated",
+                        default=False, action='store_true')
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    input_path = args['input_path']
+    threshold_distance = args['threshold_distance']
+    files_format_file_path = args['files_format_config']
+    tsne = args['tsne']
+    neighbour_index = args['neighbour_index']
+    workers = args['workers']
+    batch_size = args['batch_size']
+    plot_sample_size = args['plot_sample_size']
+    no_dendrogram = args['no_dendrogram']
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    output_csv_file = ".".join(input_path.split(".")[:-1]) + "-similar.csv"
+    output_dendogram_file = ".".join(input_path.split(".")[:-1]) + "-similar-dendr.pdf"
+    output_tsne_file = ".".join(input_path.split(".")[:-1]) + "-similar-tsne.pdf"
+
+    input_data = read_features(input_path, sep=csv_separator)
+    columns_names = list(input_data.columns)
+
+    if "contents" in columns_names:
+        input_data["contents"] = input_data.contents.fillna("<empty line>")
+
+    columns_to_drop = ['id', 'contents', 'class_value', 'class_name']
+    X_values = input_data.drop([x for x in columns_to_drop if x in columns_names], axis=1).values
+
+    if plot_sample_size is not None and plot_sample_size < input_data.shape[0]:
+        sample = np.sort(np.random.RandomState(0).choice(input_data.shape[0], plot_sample_size, replace=False))
+    else:
+        sample = np.arange(input_data.shape[0])
+    plot_data = input_data.iloc[sample]
+    X_plot = X_values[sample]
+
+    if not no_dendrogram and (not neighbour_index or plot_sample_size is not None):
+        logger.info(">>> Generating the dendrogram of {} lines".format(len(sample)))
+        plot_dendrogram(plot_data, X_plot, threshold_distance, output_dendogram_file)
+
+    if tsne:
+        logger.info(">>> Generating the t-SNE plot of {} lines".format(len(sample)))
+        plot_tsne(plot_data, X_plot, output_tsne_file)
+
+    class_values = input_data.class_value.values
+    if neighbour_index:
+        pairs = inconsistent_pairs_with_index(X_values, class_values, threshold_distance,
+                                              workers=workers, batch_size=batch_size)
+    else:
+        pairs = inconsistent_pairs_pairwise(X_values, class_values, threshold_distance)
+
+    inconsistent_indices = set()
+    for i, j in pairs:
+        print("Inconsistent pair:")
+        print(" {}-> {}:{}".format(int(class_values[i]), i + 1,
+                                   input_data.contents[i] if "contents" in columns_names else input_data.id[i]))
+        print(" {}-> {}:{}".format(int(class_values[j]), j + 1,
+                                   input_data.contents[j] if "contents" in columns_names else input_data.id[j]))
+        inconsistent_indices.add(i)
+        inconsistent_indices.add(j)
+
+    inconsistent_df = input_data.loc[sorted(inconsistent_indices), :]
+
+    inconsistent_df.to_csv(output_csv_file, sep=csv_separator, index=False, encoding="utf-8",
+                           quoting=csv.QUOTE_NONNUMERIC)
+
+    logger.info(">>> Similarity files created sucessfully")
@@ -0,0 +1,108 @@
+# Transform code structure into a flat CSV file
+
+import argparse
+import logging
+import os
+
+from common.cache import CACHE_FILE_NAME
+from common.configuration import ConfigurationHandler
+from common.workspace import WorkspaceHandler
+from prepare.case_extractors import LinesCaseExtractor
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("code_location_config_key",
+                        help="Name of the node in configuration defining path to code", type=str)
+    parser.add_argument("--remove_duplicates", help="Will not add duplicated lines (research only)",
+                        default=False, action='store_true')
+    parser.add_argument("--remove_global_duplicates", help="Will add only the first occurrence of a line in all "
+                                                           "the files; the number of occurrences of duplicated lines "
+                                                           "is saved to <code location key>-duplicates.csv",
+                        default=False, action='store_true')
+    parser.add_argument("--workers", help="Number of processes used to extract lines (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--files_per_chunk", help="Number of files sent to a worker process in a batch "
+                                                  "(each batch is saved to a separate shard file)",
+                        type=int, required=False, default=100)
+    parser.add_argument("--max_chunks_in_flight", help="Maximum number of chunks being processed or waiting "
+                                                       "to be merged when using workers (default 2 x workers)",
+                        type=int, required=False, default=None)
+    parser.add_argument("--use_cache", help="Reuse lines of files that haven't changed since the previous run "
+                                            "(stored in the cache folder of the workspace)",
+                        default=False, action='store_true')
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    classes_file_path = args['classes_config']
+    files_format_file_path = args['files_format_config']
+    remove_duplicates = args['remove_duplicates']
+    remove_global_duplicates = args['remove_global_duplicates']
+    workers = args['workers']
+    files_per_chunk = args['files_per_chunk']
+    max_chunks_in_flight = args['max_chunks_in_flight']
+    use_cache = args['use_cache']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    code_loc_config_key = args['code_location_config_key']
+    code_loc = locations_config.get(code_loc_config_key, None)
+
+    output_file_path = workspace_dir.get_processing_file_path("{}-lines.csv".format(code_loc_config_key))
+    duplicates_file_path = workspace_dir.get_processing_file_path("{}-duplicates.csv".format(code_loc_config_key))
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    lines_extractor = LinesCaseExtractor(code_loc, output_file_path, decision_classes,
+                                         sep=files_format_config.get("csv_sep", ","),
+                                         quotechar=files_format_config.get("quotechar", "\""),
+                                         remove_duplicates=remove_duplicates,
+                                         workers=workers,
+                                         files_per_chunk=files_per_chunk,
+                                         max_chunks_in_flight=max_chunks_in_flight,
+                                         remove_global_duplicates=remove_global_duplicates,
+                                         duplicates_file_path=duplicates_file_path)
+    if use_cache:
+        lines_extractor.use_cache(workspace_dir.get_cache_file_path(CACHE_FILE_NAME),
+                                  os.path.basename(output_file_path))
+    lines_extractor.extract()
+
+
+
+
+
+
+
+
@@ -0,0 +1,503 @@
+# Allows to label lines manualy by "hand-written" script
+
+import argparse
+import itertools
+import logging
+import csv
+import re
+from contextlib import ExitStack
+
+from common.configuration import ConfigurationHandler
+from common.parallel import chunks_of, map_in_order
+from common.storage import iter_feature_rows
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+BRACES_IF_PATTERN = re.compile("^(\\s)*((if)|(else(\\s)*if))(\\s)*[(]")
+BRACES_ELSE_PATTERN = re.compile("^(\\s)*else(\\s)*")
+BRACES_FOR_PATTERN = re.compile("^(\\s)*for(\\s)*[(]")
+BRACES_OPEN_BRACE_PATTERN = re.compile("[{]")
+BRACES_CLOSE_BRACKET_PATTERN = re.compile("[)](\\s)*$")
+
+
+def braces_compound(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = str(line["contents"]).strip()
+        if contents == "nan":
+            contents = ""
+
+        is_if = BRACES_IF_PATTERN.search(contents) is not None
+        is_else = BRACES_ELSE_PATTERN.search(contents) is not None
+        is_for = BRACES_FOR_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if is_for or is_if or is_else and not is_comment:
+            if BRACES_OPEN_BRACE_PATTERN.search(contents) is None:
+                semicolons = contents.count(";")
+                if is_if and semicolons > 0:
+                    class_value = 1
+                elif is_for and semicolons > 2:
+                    class_value = 1
+                else:
+                    number_brackets = contents.count("(") - contents.count(")")
+                    if number_brackets == 0:  # is complete if or for
+                        if i + 1 < len(file_lines):
+                            contents_next = str(file_lines[i + 1]["contents"]).strip()
+                            if contents_next == "nan":
+                                contents_next = ""
+                            if BRACES_OPEN_BRACE_PATTERN.search(contents_next) is None and contents_next != "":
+                                class_value = 1
+                            else:
+                                if i + 2 < len(file_lines):
+                                    contents_next = str(file_lines[i + 2]["contents"]).strip()
+                                    if contents_next == "nan":
+                                        contents_next = ""
+                                        if BRACES_OPEN_BRACE_PATTERN.search(contents_next) is None \
+                                                and contents_next != "":
+                                            class_value = 1
+
+                        else:
+                            class_value = 1
+                    else:  # is partial if or for
+                        for j in range(i + 1, i + 6):
+                            if j < len(file_lines):
+                                contents_next = str(file_lines[j]["contents"]).strip()
+                                if contents_next == "nan":
+                                    contents_next = ""
+                                if BRACES_OPEN_BRACE_PATTERN.search(contents_next) is None:
+                                    semicolons += contents_next.count(";")
+                                    if is_if and semicolons > 0:
+                                        class_value = 1
+                                    elif is_for and semicolons > 3:
+                                        class_value = 1
+                                else:
+                                    break
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+            if i + 1 < len(file_lines):
+                contents_next = str(file_lines[i + 1]["contents"]).strip()
+                if contents_next == "nan":
+                    contents_next = ""
+                logger.info("{}: {}".format(file_lines[i + 1]['id'],  contents_next))
+            logger.info("----------------------------------------------------------------")
+
+
+    return result
+
+
+IFDEF_PATTERN = re.compile("^[#](ifdef|ifndef|else|endif)")
+IFDEF_BLOCK_COMMENT_AFTER_PATTERN = re.compile("^[#](ifdef|ifndef|else|endif).*[/][*].*[*][/]")
+
+
+def ifdefine(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+        is_pattern_block_comment_after = IFDEF_BLOCK_COMMENT_AFTER_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if IFDEF_PATTERN.search(contents) and (not is_comment or is_pattern_block_comment_after):
+            class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+DEFINE_PATTERN = re.compile("^[#]define")
+
+
+def define(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if DEFINE_PATTERN.search(contents) and not is_comment:
+            class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+ENUM_CLASS_PATTERN = re.compile("((\\s)|^)+enum(\\s)(struct|class)")
+ENUM_PATTERN = re.compile("((\\s)|^)enum(\\s)+")
+
+
+def enum_class(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+        is_enum_class = ENUM_CLASS_PATTERN.search(contents) is not None
+        is_enum = ENUM_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if is_enum and not is_comment:
+            if not is_enum_class:
+                class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+STATEMENT_ARRAY_PATTERN = re.compile(
+    "[A-Za-z:_0-9\\<\\>*]+(\\s)+([A-Za-z:_0-9\\[\\],](\\s)*)+(\\s)*=(\\s)*[A-Za-z:_0-9\\<\\>]*(\\s)*[{]")
+STATEMENT_ARRAY_ASSIGNMENT_PATTERN = re.compile("[A-Za-z:_0-9\\<\\>.\\-]+(\\s)*=(\\s)*[{].*[}]")
+STATEMENT_FOR_PATTERN = re.compile("for(\\s)*[(]")
+STATEMENT_BRACES_PATTERN = re.compile("[{].*[}]")
+STATEMENT_RETURN_ARRAY_PATTERN = re.compile("^(\\s)*return(\\s)*[{]")
+STATEMENT_CONST_ARRAY_PATTERN = re.compile("const.+(\\s)*=(\\s)*[{]")
+STATEMENT_BRACES_WITH_TOKEN_PATTERN = re.compile("[A-Za-z_0-9\\<\\>]+(\\s)*[{]")
+STATEMENT_ONLY_BRACES_PATTERN = re.compile("^(\\s)*[{].*[}]([)]?)(\\s)*(;)?(\\s)*$")
+STATEMENT_BRACES_WITHIN_BRACKETS_PATTERN = re.compile("[(].*[{].*[}].*[)]")
+STATEMENT_BRACES_CONST_BRACES_PATTERN = re.compile("[)](\\s)*const(\\s)*[{]")
+STATEMENT_STRING_PATTERN = re.compile('\".+\"')
+
+
+def one_statement_in_line(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+        contents = contents.split("/*")[0]
+        contents = contents.split("//")[0]
+        contents = STATEMENT_STRING_PATTERN.sub("\"\"", contents)
+        contents = contents.replace("';'", '')
+
+        is_for = STATEMENT_FOR_PATTERN.search(contents) is not None \
+            or STATEMENT_ARRAY_ASSIGNMENT_PATTERN.search(contents)
+        is_array = STATEMENT_ARRAY_PATTERN.search(contents) is not None \
+            or STATEMENT_CONST_ARRAY_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        rule = ""
+        #logger.info("{} {} {}".format(not is_comment, not is_array, contents))
+        if not is_comment and not is_array:
+            semicolons = contents.count(";")
+            if is_for:
+                if semicolons > 3:
+                    rule = "R1"
+                    class_value = 1
+                else:
+                    is_braces = STATEMENT_BRACES_PATTERN.search(contents) is not None
+                    if semicolons > 2 and is_braces:
+                        rule = "R2"
+                        class_value = 1
+            else:
+                if semicolons > 1:
+                    rule = "R3"
+                    class_value = 1
+                elif semicolons > 0:
+                    is_braces = STATEMENT_BRACES_PATTERN.search(contents) is not None
+                    if is_braces:
+                        is_return = STATEMENT_RETURN_ARRAY_PATTERN.search(contents) is not None
+                        is_braces_with_token = STATEMENT_BRACES_WITH_TOKEN_PATTERN.search(contents) is not None
+                        is_only_braces = STATEMENT_ONLY_BRACES_PATTERN.search(contents) is not None
+                        is_braces_between_brackets = \
+                            STATEMENT_BRACES_WITHIN_BRACKETS_PATTERN.search(contents) is not None
+                        is_braces_const_brackets = STATEMENT_BRACES_CONST_BRACES_PATTERN.search(contents) is not None
+
+                        if not is_return and (not is_braces_with_token or is_braces_const_brackets) \
+                                and not is_only_braces and not is_braces_between_brackets:
+                            rule = "R4"
+                            class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}->{}: {}".format(line['id'], rule, line['contents']))
+
+    return result
+
+
+def len_max_120chars(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"]
+
+        if len(contents) > 120:
+            class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+CONSTANTS_NUMBER_PATTERN = re.compile("(^|(\\s)|(==)|(<=)|[,\\-*/+%(\\[<>])\\d((\\s)|[,\\-*/+%,;)\\]<>]|$)")
+CONSTANTS_STRING_PATTERN = re.compile("[\"].*[\"]")
+CONSTANTS_CONST_PATTERN = re.compile("const.*=(\\s)*(([\"].*[\"])|(\\d))")
+CONSTANTS_CONST_LIKE_PATTERN = re.compile("[A-Z_]+(\\s)*=(\\s)*(([\"].*[\"])|(\\d))")
+CONSTANTS_DEFINE_PATTERN = re.compile("^#define(\\s)+[A-Za-z0-9_]+(\\s)+(([\"].*[\"])|(\\d))")
+CONSTANTS_INCLUDE_PATTERN = re.compile("^#include(\\s)+([\"].*[\"])")
+
+
+def named_constants(file_lines, classes_names):
+    result = []
+    # hash_start_pattern = re.compile("^[#](ifdef|ifndef|else|endif|define|include)")
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+
+        is_number = CONSTANTS_NUMBER_PATTERN.search(contents) is not None
+        is_string_pattern = CONSTANTS_STRING_PATTERN.search(contents) is not None
+        is_hash_start_pattern = CONSTANTS_DEFINE_PATTERN.search(contents) is not None \
+            or CONSTANTS_INCLUDE_PATTERN.search(contents) is not None
+        is_const_pattern = CONSTANTS_CONST_PATTERN.search(contents) is not None \
+            or CONSTANTS_CONST_LIKE_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if (is_number or is_string_pattern) and not is_comment and not is_hash_start_pattern and not is_const_pattern:
+            class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+FUNC_PATTERN = re.compile("([A-Za-z][A-Za-z0-9]*)(\\s)+[A-Za-z09_]+[(]")
+FUNC_METHOD_PATTERN = re.compile("([A-Za-z][A-Za-z0-9]*)(\\s)+([A-Za-z][A-Za-z0-9]*)::(\\s)*[A-Za-z09_]+[(]")
+FUNC_CONSTRUCT_INIT_PATTERN = re.compile("new(\\s)+[A-Za-z09_]+[(]")
+FUNC_LOWER_CAMEL_CASE_PATTERN = "[a-z]+[a-zA-Z0-9]*"
+FUNC_LOWER_CAMEL_CASE_FUNC_PATTERN = re.compile("([.:]|->|\\s){}[(]".format(FUNC_LOWER_CAMEL_CASE_PATTERN))
+FUNC_LOWER_CAMEL_CASE_TEST_FUNC_PATTERN = re.compile("([.:]|->|\\s)test_{}[(]".format(FUNC_LOWER_CAMEL_CASE_PATTERN))
+FUNC_KEYWORDS_PATTERN = re.compile("(throw|explicit|return|if|for|while)")
+
+
+def func_lower_camel_case(file_lines, classes_names):
+    result = []
+
+    for i, line in enumerate(file_lines):
+        class_value = 0
+        contents = line["contents"].strip()
+
+        is_func = FUNC_PATTERN.search(contents) is not None
+        is_method = FUNC_METHOD_PATTERN.search(contents) is not None
+        is_define = DEFINE_PATTERN.search(contents) is not None
+        is_construct_init = FUNC_CONSTRUCT_INIT_PATTERN.search(contents) is not None
+        is_keyword = FUNC_KEYWORDS_PATTERN.search(contents) is not None
+        is_lower_camel_case_func = FUNC_LOWER_CAMEL_CASE_FUNC_PATTERN.search(contents) is not None
+        is_lower_camel_case_test_func = FUNC_LOWER_CAMEL_CASE_TEST_FUNC_PATTERN.search(contents) is not None
+        is_comment = int(line['block_comment']) > 0 or int(line['whole_line_comment']) > 0
+
+        if (is_func or is_method) and not is_comment and not is_define and not is_keyword:
+            if not is_lower_camel_case_func and not is_construct_init and not is_lower_camel_case_test_func:
+                class_value = 1
+
+        line['class_value'] = class_value
+        line['class_name'] = classes_names[class_value]
+        result.append(line)
+
+        if class_value != 0:
+            logger.info("{}: {}".format(line['id'], line['contents']))
+    return result
+
+
+ORACLES = {
+    "braces_compound": braces_compound,
+    "ifdefine": ifdefine,
+    "define": define,
+    "enum_class": enum_class,
+    "one_statement_in_line": one_statement_in_line,
+    "len_max_120chars": len_max_120chars,
+    "named_constants": named_constants,
+    "func_lower_camel_case": func_lower_camel_case
+}
+
+# columns of the features file used by the oracles (only these are read and sent to the worker processes)
+ORACLE_COLUMNS = ['id', 'contents', 'block_comment', 'whole_line_comment']
+
+worker_oracles = None
+worker_classes_names = None
+
+
+def _init_oracles_worker(oracle_names, classes_names):
+    global worker_oracles, worker_classes_names
+    worker_oracles = [ORACLES[oracle_name] for oracle_name in oracle_names]
+    worker_classes_names = classes_names
+
+
+def _label_files_in_worker(files):
+    """Returns (id, contents, class values of the oracles) for each line of the files."""
+    labeled_lines = []
+    for file_lines in files:
+        # the oracles label the rows in place, so the class values are collected after each of them
+        class_values = [[line['class_value'] for line in oracle(file_lines, worker_classes_names)]
+                        for oracle in worker_oracles]
+        for i, line in enumerate(file_lines):
+            labeled_lines.append((line['id'], line['contents'], [values[i] for values in class_values]))
+    return labeled_lines
+
+
+def files_lines(reader):
+    """Groups consecutive rows of the same file (read with the columns used by the oracles only)."""
+    for filename, rows in itertools.groupby(reader, key=lambda row: row['id'].split(":")[0]):
+        yield list(rows)
+
+
+def oracle_output_file(output_file, oracle_name):
+    return ".".join(output_file.split(".")[:-1]) + "-{}.".format(oracle_name) + output_file.split(".")[-1]
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("input_file",
+                        help="Path to a feature file", type=str)
+    parser.add_argument("output_file",
+                        help="Path to output csv file (with many oracles, the name of an oracle is added to the "
+                             "name of the file unless --wide is used)", type=str)
+    parser.add_argument("--oracle", type=str, nargs='+', choices=list(ORACLES.keys()),
+                        help="The names of oracles to use", required=True)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--wide", help="Save the class values of all oracles to a single file "
+                                       "(one column per oracle)",
+                        default=False, action='store_true')
+    parser.add_argument("--workers", help="Number of processes used to label files (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--files_per_chunk", help="Number of files sent to a worker process at once",
+                        type=int, required=False, default=100)
+    parser.add_argument("--max_chunks_in_flight", help="Maximum number of chunks being processed or waiting "
+                                                       "to be saved when using workers (default 2 x workers)",
+                        type=int, required=False, default=None)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    input_file = args['input_file']
+    output_file = args['output_file']
+    oracle_names = args['oracle']
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    add_contents = args['add_contents']
+    wide = args['wide']
+    workers = args['workers']
+    files_per_chunk = args['files_per_chunk']
+    max_chunks_in_flight = args['max_chunks_in_flight']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+    classes_names = {decision_classes['default']['value']: decision_classes['default']['name']}
+    for label_class in decision_classes['labeled']:
+        classes_names[label_class['value']] = label_class['name']
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>> Loading input the file {}".format(input_file))
+
+    input_file_path = workspace_dir.get_processing_file_path(input_file)
+    if wide or len(oracle_names) == 1:
+        output_files = [output_file]
+    else:
+        output_files = [oracle_output_file(output_file, oracle_name) for oracle_name in oracle_names]
+
+    with ExitStack() as out_files:
+        # the features file is read in the format it was stored in (see storage_format in files_format.json)
+        reader = iter_feature_rows(input_file_path, sep=csv_separator, columns=ORACLE_COLUMNS)
+        writers = []
+        for output_file_name in output_files:
+            out_csv = out_files.enter_context(open(workspace_dir.get_results_file_path(output_file_name), "w",
+                                                   newline='', encoding="utf-8"))
+            writers.append(csv.writer(out_csv, delimiter=csv_separator, quotechar='"',
+                                      quoting=csv.QUOTE_NONNUMERIC))
+
+        header_row = ['id']
+        if add_contents:
+            header_row.append('contents')
+        if wide:
+            writers[0].writerow(header_row + oracle_names)
+        else:
+            for writer in writers:
+                writer.writerow(header_row + ['class_name', 'class_value'])
+
+        labeled_chunks = map_in_order(_label_files_in_worker, chunks_of(files_lines(reader), files_per_chunk),
+                                      workers=workers, max_chunks_in_flight=max_chunks_in_flight,
+                                      initializer=_init_oracles_worker, initargs=(oracle_names, classes_names))
+        for i, labeled_lines in enumerate(labeled_chunks):
+            files_done = (i + 1) * files_per_chunk
+            if files_done // 10000 > (files_done - files_per_chunk) // 10000:
+                logger.info(">>> Processed {} files: {}".format(files_done, labeled_lines[-1][0].split(":")[0]))
+            for line_id, contents, class_values in labeled_lines:
+                out_row = [line_id]
+                if add_contents:
+                    out_row.append(contents)
+                if wide:
+                    writers[0].writerow(out_row + class_values)
+                else:
+                    for writer, class_value in zip(writers, class_values):
+                        writer.writerow(out_row + [classes_names[class_value], class_value])
+
+    logger.info(">>> Output saved to the file(s) {}".format(", ".join(output_files)))
@@ -0,0 +1,121 @@
+# Merges results file into one showing classification by different algorithms
+
+import argparse
+import logging
+import os
+import pandas as pd
+import gc
+
+from common.configuration import ConfigurationHandler
+from common.results import ResultsWriter, class_results_files
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classes_config", help="Path to classes configuration file",
+                        type=str, required=False, default="./classes.json")
+    parser.add_argument("--classifiers_options", help="Path to classifiers options file",
+                        type=str, required=False, default="./classifiers_options.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classes_file_path = args['classes_config']
+    classifiers_options_file_path = args['classifiers_options']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classifiers_options_config = ConfigurationHandler(classifiers_options_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classifiers_options_file_path))
+        exit(1)
+
+    try:
+        classes_config = ConfigurationHandler(classes_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classes_file_path))
+        exit(1)
+    decision_classes = classes_config.get("classes", {})
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>>> Starting to merge the result csv files...")
+
+    output_file_path = workspace_dir.get_results_file_path("classify-output-ALL.csv")
+
+    input_files_df_chunks = []
+    classifier_names = []
+    pred_colnames = []
+    for classifier_name in classifiers_options_config.config.keys():
+        # skip keys that do not represent classifiers
+        if classifier_name in ("INFO"):
+            continue
+
+        classifier_output_file = workspace_dir.get_results_file_path("classify-output-{}.csv".format(classifier_name))
+        if os.path.exists(classifier_output_file):
+            res_df_chunks = pd.read_csv(classifier_output_file, sep=csv_separator, encoding="utf-8",
+                                        chunksize=chunk_size)
+            input_files_df_chunks.append(res_df_chunks)
+            classifier_names.append(classifier_name)
+            pred_colnames.append("pred_{}".format(classifier_name))
+
+    first_input_file_df_chunks = input_files_df_chunks.pop(0)
+    first_classifier_name = classifier_names.pop(0)
+
+    # the merged results and the files of each of the classes are written once, as the chunks are merged
+    with ResultsWriter(output_file_path, class_results_files(workspace_dir, "classify-output-ALL", decision_classes),
+                       pred_colnames, sep=csv_separator) as writer:
+
+        for i, first_input_file_df_chunk in enumerate(first_input_file_df_chunks):
+            first_input_file_df_chunk.rename(columns={'pred_class': "pred_{}".format(first_classifier_name)},
+                                             inplace=True)
+            to_merge = [first_input_file_df_chunk]
+            for j, input_file_dfs_chunks in enumerate(input_files_df_chunks):
+                try:
+                    input_df_chunk = input_file_dfs_chunks.get_chunk()
+                except StopIteration as e:
+                    pass
+
+                input_df_chunk.rename(columns={'pred_class': "pred_{}".format(classifier_names[j])}, inplace=True)
+
+                to_merge.append(input_df_chunk[["pred_{}".format(classifier_names[j])]])
+
+            merged_df = pd.concat(to_merge, axis=1)
+            del to_merge
+
+            logger.info(">>>> Saving {} lines of merged results to {}".format(merged_df.shape[0], output_file_path))
+            for decision_class, output_file_path_class, no_lines in writer.write(merged_df):
+                logger.info(">>>> Saving {} lines of merged results to {}".format(no_lines, output_file_path_class))
+            del merged_df
+            gc.collect()
@@ -0,0 +1,129 @@
+# Extracts manual features
+import argparse
+import logging
+import os
+
+from common.cache import CACHE_FILE_NAME
+from common.configuration import ConfigurationHandler
+from common.storage import storage_format_of
+from common.workspace import WorkspaceHandler
+from prepare.feature_extractors import LineFeaturesExtractionController, manual_features_extractors
+
+logger = logging.getLogger('pyccflex')
+
+default_extractors = ["PatternSubstringExctractor", "PatternWordExtractor", "BlankLineFeatureExtraction",
+                        "CommentStringExtractor", "NoWordsExtractor", "NoCharsExtractor", "RegexpCountingFeatureExtraction"]
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("code_location_config_key",
+                        help="Name of the node in configuration defining path to code",
+                        type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--manual_features_config", help="Path to manual features configuration file",
+                        type=str, required=False, default="./manual_features.json")
+    parser.add_argument("--add_decision_class", help="Shall the decision class be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument("--add_contents", help="Shall the content of the line be added to output?",
+                        default=False, action='store_true')
+    parser.add_argument('--extractors', nargs='+', type=str,
+                        help="The list of feature extractors.", required=False)
+    parser.add_argument("--chunk_size", help="Number of lines sent to a worker process in a batch",
+                        type=int, required=False, default=10 ** 3)
+    parser.add_argument("--workers", help="Number of processes used to extract features (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--max_chunks_in_flight", help="Maximum number of chunks being processed or waiting "
+                                                       "to be saved when using workers (default 2 x workers)",
+                        type=int, required=False, default=None)
+    parser.add_argument("--legacy_pattern_extractors", help="Use a separate extractor (and a separate pass over "
+                                                            "a line) for each pattern instead of the compiled one",
+                        default=False, action='store_true')
+    parser.add_argument("--use_cache", help="Reuse features of files which lines haven't changed since the previous "
+                                            "run (stored in the cache folder of the workspace)",
+                        default=False, action='store_true')
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    manual_features_file_path = args['manual_features_config']
+    extractors_to_use = args['extractors']
+    chunk_size = args['chunk_size']
+    workers = args['workers']
+    max_chunks_in_flight = args['max_chunks_in_flight']
+    use_cache = args['use_cache']
+    legacy_pattern_extractors = args['legacy_pattern_extractors']
+    if extractors_to_use is None:
+        extractors_to_use = default_extractors
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        manual_features_config = ConfigurationHandler(manual_features_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(manual_features_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+    separator = files_format_config.get("csv_sep", ",")
+    storage_format = storage_format_of(files_format_config)
+
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    code_loc_config_key = args['code_location_config_key']
+    code_loc = locations_config.get(code_loc_config_key, None)
+
+    add_decision_class = args['add_decision_class']
+    add_contents = args['add_contents']
+
+    input_file_path = workspace_dir.get_processing_file_path("{}-lines.csv".format(code_loc_config_key))
+    output_file_path = workspace_dir.get_processing_file_path("{}-manual.csv".format(code_loc_config_key))
+
+    logger.info(">>> Preparing feature extractors")
+
+    extractors = manual_features_extractors(extractors_to_use, manual_features_config, legacy_pattern_extractors)
+
+    logger.info(">>> Extracting features")
+
+    controller = LineFeaturesExtractionController(extractors,
+                                                  input_file_path, output_file_path,
+                                                  sep=separator,
+                                                  add_decision_class=add_decision_class,
+                                                  add_contents=add_contents,
+                                                  verbosity=10,
+                                                  workers=workers,
+                                                  chunk_size=chunk_size,
+                                                  max_chunks_in_flight=max_chunks_in_flight,
+                                                  storage_format=storage_format)
+    if use_cache:
+        controller.use_cache(workspace_dir.get_cache_file_path(CACHE_FILE_NAME),
+                             os.path.basename(output_file_path),
+                             {"manual_features": manual_features_config.config})
+    controller.extract()
+
+    logger.info(">>> Features stored in the file {}".format(output_file_path))
+
+
+
+
+
+
@@ -0,0 +1,66 @@
+# Removes a given column from a features file (csv, parquet, arrow) or recursively for all such files if folder is given
+
+import argparse
+import logging
+import os
+
+from common.configuration import ConfigurationHandler
+from common.storage import read_features, write_features, file_format_of
+
+logger = logging.getLogger('pyccflex')
+
+
+def remove_columns(input_path, columns, csv_separator):
+    if not os.path.exists(input_path):
+        logger.info("File / folder {} does not exist".format(input_path))
+        return
+
+    if os.path.isfile(input_path) and os.path.splitext(input_path)[1] in (".csv", ".parquet", ".arrow"):
+
+        file_format = file_format_of(input_path)
+        csv_data = read_features(input_path, sep=csv_separator, resolve=False)
+        columns_in_file = set(list(csv_data.columns))
+        available_columns = list(columns_in_file & set(columns))
+
+        if len(available_columns) > 0:
+            csv_data.drop(available_columns, axis=1, inplace=True)
+            write_features(csv_data, input_path, sep=csv_separator, storage_format=file_format)
+            logger.info(">>> Removed columns {} from file {}".format(", ".join(available_columns), input_path))
+
+    elif os.path.isdir(input_path):
+        children = [f for f in os.listdir(input_path)]
+        for child_path in children:
+            child_path = os.path.join(os.path.normpath(input_path), child_path)
+            remove_columns(child_path, columns, csv_separator)
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path",
+                        help="A path to a file or directory", type=str)
+    parser.add_argument('--columns', nargs='+', type=str,
+                        help="The names of columns to remove", required=True)
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    input_path = args['path']
+    columns = args['columns']
+    files_format_file_path = args['files_format_config']
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    remove_columns(input_path, columns, csv_separator)
+
+    logger.info(">>> Columns successfuly removed")
@@ -0,0 +1,112 @@
+# Runs the stages of a pipeline defined in a json file (instead of a shell script like run.sh) in the order of their
+# dependencies; stages that are up to date are skipped and independent stages can be run concurrently
+
+import argparse
+import csv
+import logging
+import os
+import time
+
+from ccflex import command_module_path
+from common.configuration import ConfigurationHandler
+from common.instrumentation import INSTRUMENTATION_ENV, use_workspace
+from common.pipeline import PipelineRunner, load_pipeline, PIPELINE_STATE_FILE_NAME, \
+    STAGE_RUN, STAGE_SKIPPED, STAGE_FAILED
+from common.storage import keep_frames_in_memory
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pipeline_config", help="Path to the json file defining stages of the pipeline",
+                        type=str, required=False, default="./pipeline.json")
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--set", help="Values of variables of the pipeline (NAME=VALUE)",
+                        type=str, nargs='+', required=False, default=[])
+    parser.add_argument("--targets", help="Names of stages to run with the stages they depend on (default all)",
+                        type=str, nargs='+', required=False, default=None)
+    parser.add_argument("--workers", help="Number of processes running independent stages concurrently "
+                                          "(1 - all stages are run in this process)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--force", help="Run all stages even if they are up to date",
+                        default=False, action='store_true')
+    parser.add_argument("--memory_budget", help="Megabytes of memory used to keep features files read by stages "
+                                                "for the next stages run in the same process (0 - disabled)",
+                        type=int, required=False, default=1024)
+    parser.add_argument("--instrument", help="Measure the time, memory and rows processed by each stage "
+                                             "and save the report to the reports folder of the workspace",
+                        default=False, action='store_true')
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    pipeline_file_path = args['pipeline_config']
+    locations_file_path = args['locations_config']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+    if not os.path.exists(workspace_dir.processing_path):
+        workspace_dir.create_workspace_dir()
+
+    variables = {"LOCATIONS_CONFIG": locations_file_path,
+                 "WORKSPACE": os.path.normpath(workspace_dir.path),
+                 "PROCESSING": os.path.normpath(workspace_dir.processing_path),
+                 "RESULTS": os.path.normpath(workspace_dir.results_path),
+                 "REPORTS": os.path.normpath(workspace_dir.reports_path)}
+    for assignment in args['set']:
+        name, _, value = assignment.partition("=")
+        variables[name] = value
+
+    try:
+        stages = load_pipeline(pipeline_file_path, variables)
+    except Exception as e:
+        logger.error("Couldn't load the pipeline {}: {}".format(pipeline_file_path, e))
+        exit(1)
+
+    keep_frames_in_memory(args['memory_budget'] * 2 ** 20)
+    if args['instrument']:
+        # stages (run in this process or by workers) are measured if the environment variable is set
+        os.environ[INSTRUMENTATION_ENV] = "1"
+        use_workspace(workspace_dir.reports_path, [workspace_dir.processing_path, workspace_dir.results_path,
+                                                   workspace_dir.reports_path])
+
+    start = time.time()
+    runner = PipelineRunner(stages, workspace_dir.get_cache_file_path(PIPELINE_STATE_FILE_NAME),
+                            scripts_dir=os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                                     "bin"),
+                            script_source=command_module_path,
+                            workers=args['workers'], force=args['force'])
+    summary = runner.run(args['targets'])
+    total_seconds = time.time() - start
+
+    logger.info(">>> Timing summary:")
+    for name, status, seconds in summary:
+        logger.info("    {:<40} {:<8} {:>10.2f}s".format(name, status, seconds))
+    statuses = [status for _, status, _ in summary]
+    logger.info(">>> Pipeline finished in {:.2f}s ({} stages run, {} up to date, {} failed; "
+                "{:.2f}s of running stages)".format(total_seconds, statuses.count(STAGE_RUN),
+                                                   statuses.count(STAGE_SKIPPED), statuses.count(STAGE_FAILED),
+                                                   sum(seconds for _, _, seconds in summary)))
+
+    timing_file_path = workspace_dir.get_reports_file_path("pipeline-timing.csv")
+    with open(timing_file_path, "w", newline='', encoding="utf-8") as timing_file:
+        writer = csv.writer(timing_file)
+        writer.writerow(["stage", "status", "seconds"])
+        writer.writerows(summary)
+    logger.info(">>> Timing summary saved to the file {}".format(timing_file_path))
+
+    if len(statuses) != statuses.count(STAGE_RUN) + statuses.count(STAGE_SKIPPED):
+        exit(1)
@@ -0,0 +1,99 @@
+# Samples lines of results files (e.g., to label them)
+
+import argparse
+import logging
+
+from common.configuration import ConfigurationHandler
+from common.parallel import map_in_order
+from common.sampling import STRATA, sample_lines_of_file
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_file",
+                        help="Path to an output file", type=str)
+    parser.add_argument("--files", nargs='+', type=str,
+                        help="The names of files to sample from", required=True)
+    parser.add_argument("--lines", help="The number of lines sampled from each file (from each stratum of a file "
+                                        "if --stratify_by is used)",
+                        default=50, type=int)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--ctx_next", help="How many following lines add to each line",
+                        default=0, type=int)
+    parser.add_argument("--ctx_prev", help="How many preceding lines add to each line",
+                        default=0, type=int)
+    parser.add_argument("--stratify_by", nargs='+', type=str, required=False, default=[], choices=STRATA,
+                        help="Sample the lines of each predicted class (the values of pred_* columns) and / or "
+                             "of each source file (the prefix of the id) separately")
+    parser.add_argument("--seed", help="Seed of the random sampling (the same seed gives the same sample)",
+                        default=0, type=int)
+    parser.add_argument("--workers", help="Number of processes used to sample the files (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    files = args['files']
+    lines = args['lines']
+    output_file = args['output_file']
+    ctx_next = args['ctx_next']
+    ctx_prev = args['ctx_prev']
+    stratify_by = args['stratify_by']
+    seed = args['seed']
+    workers = args['workers']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    logger.info(">>> Starting sampling files...")
+
+    output_file_path = workspace_dir.get_results_file_path(output_file)
+
+    # each file is read once, the sampled lines with their context are written in the order of files
+    jobs = [(workspace_dir.get_results_file_path(file), {"sample_size": lines, "sep": csv_separator, "seed": seed,
+                                                         "stratify_by": stratify_by, "ctx_prev": ctx_prev,
+                                                         "ctx_next": ctx_next, "chunk_size": chunk_size})
+            for file in files]
+    samples = map_in_order(sample_lines_of_file, jobs, workers=min(workers, len(jobs)))
+    with open(output_file_path, 'w', newline='', encoding="utf-8") as out_file:
+        for file, (text, no_lines, no_strata) in zip(files, samples):
+            logger.info(">>> Sampled the {} lines of {} ({} strata)".format(no_lines, file, no_strata))
+            out_file.write(text)
+
+    logger.info(">>> Sample lines saved to {}".format(output_file_path))
+
+
+
+
+
+
@@ -0,0 +1,113 @@
+# Reading input csv file with features, performs feature selection and storres the resulting features file
+
+import argparse
+import csv
+import logging
+import pandas as pd
+from sklearn.feature_selection import VarianceThreshold, SelectPercentile, SelectFpr
+import numpy as np
+
+from common.configuration import ConfigurationHandler
+from common.incremental import accumulate_statistics, feature_columns, fit_selector, iter_training_chunks
+from common.workspace import WorkspaceHandler
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    # Parse input parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("train_file",
+                        help="Path to train csv file", type=str)
+    parser.add_argument("selected_features_file",
+                        help="Path to classify csv file", type=str)
+    parser.add_argument('--feature_selector', type=str, required=True)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--classifiers_options", help="Path to classifiers options file",
+                        type=str, required=False, default="./classifiers_options.json")
+    parser.add_argument("--feature_selectors_options", help="Path to feature selectors options file",
+                        type=str, required=False, default="./feature_selectors_options.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+    classifiers_options_file_path = args['classifiers_options']
+    feature_selectors_options_file_path = args['feature_selectors_options']
+
+    train_file = args['train_file']
+    selected_features_file = args['selected_features_file']
+    feature_selector = args['feature_selector']
+    chunk_size = args['chunk_size']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+
+    try:
+        classifiers_options_config = ConfigurationHandler(classifiers_options_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(classifiers_options_file_path))
+        exit(1)
+
+    try:
+        feature_selectors_options_config = ConfigurationHandler(feature_selectors_options_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(feature_selectors_options_file_path))
+        exit(1)
+
+    csv_separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    input_train_file_path = workspace_dir.get_processing_file_path(train_file)
+    output_train_file_path = workspace_dir.get_processing_file_path(selected_features_file)
+
+    selector_options = dict(feature_selectors_options_config.get(feature_selector, {}))
+    # the statistics of features are accumulated over chunks, so the training set doesn't need to fit in memory
+    score_func = selector_options.pop("score_func", "f_classif")
+
+    if feature_selector == "VarianceThreshold":
+        selector = VarianceThreshold(**selector_options)
+    elif feature_selector == "SelectPercentile":
+        selector = SelectPercentile(**selector_options)
+    elif feature_selector == "SelectFpr":
+        selector = SelectFpr(**selector_options)
+    else:
+        logger.error("Unknown feature selector {}".format(feature_selector))
+        exit(1)
+
+    logger.info(">>> Loading training file {} in chunks of {} lines".format(train_file, chunk_size))
+    feature_names = np.array(feature_columns(input_train_file_path, sep=csv_separator))
+    statistics = accumulate_statistics(iter_training_chunks(input_train_file_path, sep=csv_separator,
+                                                            chunksize=chunk_size))
+
+    logger.info(">>> {}: determining features".format(feature_selector))
+    fit_selector(selector, statistics, score_func=score_func)
+    selected_features = feature_names[selector.get_support()]
+
+    logger.info(">>> Selected {} out of {} features...".format(selected_features.shape[0], feature_names.shape[0]))
+    selected_features_df = pd.DataFrame(selected_features, columns=["features"])
+
+    logger.info(">>> Saving output to the file {}".format(output_train_file_path))
+    selected_features_df.to_csv(output_train_file_path, sep=csv_separator, index=False, encoding="utf-8", header=True,
+                                quoting=csv.QUOTE_NONNUMERIC)
@@ -0,0 +1,70 @@
+# Tokenizes a lines file once and stores the ids of tokens (a token corpus) used by vocabulary_extractor and bag_of_words
+
+import argparse
+import logging
+import os
+
+from common.configuration import ConfigurationHandler
+from common.workspace import WorkspaceHandler
+from prepare.token_corpus import TokenCorpusBuilder, token_corpus_name
+
+logger = logging.getLogger('pyccflex')
+
+
+def main(argv=None):
+
+    logger.info("\n#### Running: {}".format(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lines_file",
+                        help="CSV file with the extracted lines - either path or name of the file "
+                             "that will be searched in the processing directory of the workspace",
+                        type=str)
+    parser.add_argument("--locations_config", help="Path to locations configuration file",
+                        type=str, required=False, default="./locations.json")
+    parser.add_argument("--files_format_config", help="Path to files format configuration file",
+                        type=str, required=False, default="./files_format.json")
+    parser.add_argument("--chunk_size", help="Number of lines to process in a batch",
+                        type=int, required=False, default=10 ** 5)
+    parser.add_argument("--workers", help="Number of processes used to tokenize lines (1 - no parallelism)",
+                        type=int, required=False, default=1)
+    parser.add_argument("--max_chunks_in_flight", help="Maximum number of chunks being processed or waiting "
+                                                       "to be saved when using workers (default 2 x workers)",
+                        type=int, required=False, default=None)
+    args = vars(parser.parse_args(argv))
+    logger.info("Run parameters: {}".format(str(args)))
+
+    locations_file_path = args['locations_config']
+    files_format_file_path = args['files_format_config']
+
+    try:
+        locations_config = ConfigurationHandler(locations_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(locations_file_path))
+        exit(1)
+
+    try:
+        files_format_config = ConfigurationHandler(files_format_file_path)
+    except Exception as e:
+        logger.error("Couldn't load configuration file {}".format(files_format_file_path))
+        exit(1)
+    separator = files_format_config.get("csv_sep", ",")
+
+    workspace_dir_conf = locations_config.get('workspace_dir', None)
+    workspace_dir_path = workspace_dir_conf.get("path", "")
+    workspace_dir = WorkspaceHandler(workspace_dir_path)
+
+    lines_file = args['lines_file']
+    if os.path.exists(lines_file):
+        input_file_path = lines_file
+    else:
+        input_file_path = workspace_dir.get_processing_file_path(lines_file)
+    output_prefix = workspace_dir.get_processing_file_path(token_corpus_name(input_file_path))
+
+    logger.info(">>> Tokenizing lines from file {}".format(input_file_path))
+    builder = TokenCorpusBuilder(input_file_path, output_prefix, separator,
+                                 chunk_size=args['chunk_size'],
+                                 workers=args['workers'],
+                                 max_chunks_in_flight=args['max_chunks_in_flight'])
+    builder.build()
+    logger.info(">>> Token corpus saved to files {}-*".format(output_prefix))
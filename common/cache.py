@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import uuid
+
+module_logger = logging.getLogger('pyccflex.common.cache')
+
+CACHE_FILE_NAME = "cache.sqlite"
+
+
+def content_hash(content):
+    """Returns the hash of a bytes or str content."""
+    if isinstance(content, str):
+        content = content.encode("utf-8", errors="surrogatepass")
+    return hashlib.sha1(content).hexdigest()
+
+
+def config_hash(config):
+    """Returns the hash of a configuration (anything that can be serialized to json)."""
+    return content_hash(json.dumps(config, sort_keys=True, default=str))
+
+
+def file_hash(file_path, block_size=2 ** 20):
+    """Returns the hash of the contents of a file (e.g., a vocabulary); the file is read in blocks."""
+    sha = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ContentCache(object):
+    """
+    Content-addressed cache of processing results (e.g., lines or feature rows of a single code file)
+    stored in a sqlite database in the cache folder of the workspace.
+
+    Entries are keyed by the hash of the content and the hash of the configuration used to process it.
+    Each run records which item (e.g., file path) used which entry in a scope (e.g., stage and location key);
+    when the run is finished, items that were not seen are forgotten and entries no longer used
+    by any scope are evicted. The cache can be shared by worker processes.
+    """
+
+    def __init__(self, cache_file_path, scope, config):
+        self.logger = logging.getLogger('pyccflex.common.cache.ContentCache')
+        self.cache_file_path = cache_file_path
+        self.scope = scope
+        self.config_hash = config_hash(config)
+        self.run = uuid.uuid4().hex
+        self._connection = None
+        self._pid = None
+        self._create_tables()
+
+    def _get_connection(self):
+        # connections can't be shared with forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.cache_file_path, timeout=600)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        return state
+
+    def _create_tables(self):
+        connection = self._get_connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB)")
+        connection.execute("CREATE TABLE IF NOT EXISTS usages (scope TEXT, item TEXT, key TEXT, run TEXT, "
+                           "hit INTEGER, PRIMARY KEY (scope, item))")
+        connection.commit()
+
+    def key(self, content_hash_value):
+        return "{}:{}".format(self.config_hash, content_hash_value)
+
+    def get(self, item, key):
+        """Returns the cached value for the key (or None) and records that the item used it."""
+        connection = self._get_connection()
+        found = connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        self._use(item, key, found is not None)
+        return None if found is None else pickle.loads(found[0])
+
+    def put(self, item, key, value):
+        connection = self._get_connection()
+        connection.execute("INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)",
+                           (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        self._use(item, key, False)
+
+    def _use(self, item, key, hit):
+        self._get_connection().execute("INSERT OR REPLACE INTO usages (scope, item, key, run, hit) "
+                                       "VALUES (?, ?, ?, ?, ?)", (self.scope, item, key, self.run, 1 if hit else 0))
+
+    def commit(self):
+        self._get_connection().commit()
+
+    def finish(self):
+        """Evicts the entries of items that weren't seen in this run and logs the statistics."""
+        connection = self._get_connection()
+        hits, items = connection.execute("SELECT COALESCE(SUM(hit), 0), COUNT(*) FROM usages "
+                                         "WHERE scope = ? AND run = ?", (self.scope, self.run)).fetchone()
+        removed_items = connection.execute("DELETE FROM usages WHERE scope = ? AND run != ?",
+                                           (self.scope, self.run)).rowcount
+        evicted = connection.execute("DELETE FROM entries WHERE key NOT IN (SELECT key FROM usages)").rowcount
+        connection.commit()
+        self.logger.info(">>> Cache {}: {} hits, {} misses, {} removed items, {} evicted entries".format(
+            self.scope, hits, items - hits, removed_items, evicted))
+        return hits, items - hits
@@ -0,0 +1,263 @@
+import http.server
+import json
+import logging
+import os
+import queue
+import socketserver
+import stat
+import threading
+import time
+import warnings
+
+module_logger = logging.getLogger('pyccflex.common.classification_server')
+
+CLASSIFY_PATH = "/classify"
+STATUS_PATH = "/status"
+
+
+class LineClassifier(object):
+    """
+    Classifies lines with trained models (ModelArtifacts) using a features builder computing the features
+    of lines in memory (see prepare.online_features.OnlineFeaturesBuilder). The sources are the modification
+    times of the files the classifier was loaded from (models, vocabularies, configuration).
+    """
+
+    def __init__(self, features_builder, artifacts, sources=None):
+        self.logger = logging.getLogger('pyccflex.common.classification_server.LineClassifier')
+        self.features_builder = features_builder
+        self.artifacts = artifacts
+        self.sources = {} if sources is None else sources
+        self.feature_names = []
+        for artifact in artifacts:
+            self.feature_names.extend([x for x in artifact.feature_names if x not in set(self.feature_names)])
+        missing = features_builder.missing_columns(self.feature_names)
+        if len(missing) > 0:
+            raise Exception("{} features used by the models are not computed by the server (e.g., {}); check the "
+                            "features options".format(len(missing), ", ".join(missing[:5])))
+
+    def classify(self, texts, file_names):
+        """Returns a dictionary: classifier -> list of predicted class values of the lines."""
+        if len(texts) == 0:
+            return dict((artifact.classifier, []) for artifact in self.artifacts)
+        X = self.features_builder.features(texts, file_names, self.feature_names)
+        predictions = {}
+        with warnings.catch_warnings():
+            # arrays are passed instead of data frames, sklearn checks the dtype of each column of a data frame
+            # which takes longer than predicting a few lines; the order of columns is the same as in training
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            for artifact in self.artifacts:
+                predictions[artifact.classifier] = artifact.model.predict(X[artifact.feature_names].to_numpy()).tolist()
+        return predictions
+
+    def describe(self):
+        return [{"classifier": artifact.classifier, "version": artifact.version,
+                 "features": len(artifact.feature_names)} for artifact in self.artifacts]
+
+
+class _PendingRequest(object):
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.predictions = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ClassificationService(object):
+    """
+    Keeps a LineClassifier loaded and classifies the lines of requests in batches: a single thread takes the requests
+    waiting in the queue (up to max_batch_lines lines, waiting at most batch_wait seconds for more requests) and
+    classifies their lines at once. Before a batch, at most every reload_interval seconds, the sources of the classifier
+    are compared with the current ones (current_sources) and the classifier is loaded again (load_classifier)
+    if they changed, e.g., when a model was trained again.
+    """
+
+    def __init__(self, load_classifier, current_sources, batch_wait=0.002, max_batch_lines=10 ** 5,
+                 reload_interval=2.0):
+        self.logger = logging.getLogger('pyccflex.common.classification_server.ClassificationService')
+        self.load_classifier = load_classifier
+        self.current_sources = current_sources
+        self.batch_wait = batch_wait
+        self.max_batch_lines = max_batch_lines
+        self.reload_interval = reload_interval
+        self.classifier = load_classifier()
+        self.loaded = time.time()
+        self.last_check = time.time()
+        self.no_requests = 0
+        self.no_lines = 0
+        self.no_batches = 0
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._serve_batches, name="classification-batches", daemon=True)
+        self.thread.start()
+
+    def classify(self, texts):
+        """Classifies the lines (called by the threads handling requests); returns the dictionary of predictions."""
+        request = _PendingRequest(texts)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.predictions
+
+    def status(self):
+        return {"models": self.classifier.describe(),
+                "loaded": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded)),
+                "requests": self.no_requests,
+                "lines": self.no_lines,
+                "batches": self.no_batches}
+
+    def reload_if_changed(self):
+        if time.time() - self.last_check < self.reload_interval:
+            return
+        self.last_check = time.time()
+        try:
+            if self.current_sources() == self.classifier.sources:
+                return
+            self.logger.info(">>> Models or their configuration changed, reloading")
+            self.classifier = self.load_classifier()
+            self.loaded = time.time()
+            self.logger.info(">>> Reloaded models: {}".format(
+                ", ".join("{} ({})".format(x['classifier'], x['version']) for x in self.classifier.describe())))
+        except Exception as e:
+            self.logger.error("Couldn't reload the models, still using the previous ones: {}".format(e))
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        no_lines = len(batch[0].texts)
+        deadline = time.time() + self.batch_wait
+        while no_lines < self.max_batch_lines:
+            timeout = deadline - time.time()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            no_lines += len(request.texts)
+        return batch
+
+    def _serve_batches(self):
+        while True:
+            batch = self._next_batch()
+            self.reload_if_changed()
+            start = time.perf_counter()
+            texts = []
+            file_names = []
+            for i, request in enumerate(batch):
+                texts.extend(request.texts)
+                # lines of different requests are never the context of each other
+                file_names.extend([i] * len(request.texts))
+            try:
+                predictions = self.classifier.classify(texts, file_names)
+                offset = 0
+                for request in batch:
+                    request.predictions = dict((classifier, values[offset:offset + len(request.texts)])
+                                               for classifier, values in predictions.items())
+                    offset += len(request.texts)
+            except Exception as e:
+                self.logger.error("Couldn't classify a batch of {} requests: {}".format(len(batch), e))
+                for request in batch:
+                    request.error = e
+            self.no_requests += len(batch)
+            self.no_lines += len(texts)
+            self.no_batches += 1
+            self.logger.debug("Classified {} lines of {} requests in {:.1f} ms".format(
+                len(texts), len(batch), (time.perf_counter() - start) * 1000))
+            for request in batch:
+                request.done.set()
+
+
+class ClassificationRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handles the requests of the classification server (json in and out):
+      GET /status - the loaded models and the number of requests and lines classified,
+      POST /classify - classifies the lines of a file: {"path": "<path to a file>"}
+                       or of a source code: {"text": "<source code>", "name": "<optional name of the file>"}.
+    The server (ClassificationHTTPServer or ClassificationUnixServer) provides the service and the function
+    splitting the contents of a file (bytes) into lines ([number, contents, class_name, class_value]).
+    """
+
+    def address_string(self):
+        # the address of a client connected to a Unix socket is an empty string
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        module_logger.debug("{} {}".format(self.address_string(), format % args))
+
+    def _send_json(self, code, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path != STATUS_PATH:
+            self._send_json(404, {"error": "Unknown path {}".format(self.path)})
+            return
+        self._send_json(200, self.server.service.status())
+
+    def do_POST(self):
+        if self.path != CLASSIFY_PATH:
+            self._send_json(404, {"error": "Unknown path {}".format(self.path)})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            if "path" in request:
+                name = request["path"]
+                with open(name, "rb") as input_file:
+                    contents = input_file.read()
+            elif "text" in request:
+                name = request.get("name", "<text>")
+                contents = request["text"].encode("utf-8")
+            else:
+                raise ValueError("The request needs the path of a file or the text to classify")
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        lines = self.server.split_lines(contents)
+        try:
+            predictions = self.server.service.classify([contents for number, contents, _, _ in lines])
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {
+            "name": name,
+            "lines": [dict([("id", "{}:{}".format(name, number)), ("line", number), ("contents", text)] +
+                           [("pred_{}".format(classifier), values[i]) for classifier, values in predictions.items()])
+                      for i, (number, text, _, _) in enumerate(lines)],
+            "milliseconds": (time.perf_counter() - start) * 1000})
+
+
+class ClassificationHTTPServer(http.server.ThreadingHTTPServer):
+    """Serves the classification requests over HTTP (each request is handled by a separate thread)."""
+
+    def __init__(self, address, service, split_lines):
+        self.service = service
+        self.split_lines = split_lines
+        http.server.ThreadingHTTPServer.__init__(self, address, ClassificationRequestHandler)
+
+
+class ClassificationUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves the classification requests over HTTP on a Unix socket (e.g., curl --unix-socket <path>)."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, service, split_lines):
+        self.service = service
+        self.split_lines = split_lines
+        # a socket left by a server that wasn't stopped cleanly
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, ClassificationRequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
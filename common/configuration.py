@@ -1,9 +1,13 @@
+import copy
 import json
 import logging
 import os
 
 module_logger = logging.getLogger('pyccflex.common.configuration')
 
+# parsed configuration files by (path, time of modification, size), shared by the commands run in one process
+_loaded_configs = {}
+
 
 class ConfigurationHandler(object):
     """
@@ -18,9 +22,14 @@ class ConfigurationHandler(object):
             self.logger.error("Configuration file doesn't exist")
             raise Exception("Configuration file doesn't exist")
 
-        with open(config_file_path) as config_file:
-            self.config = json.load(config_file)
-            self.logger.info("Configuration file loaded from {}".format(config_file_path))
+        stat = os.stat(config_file_path)
+        key = (os.path.abspath(config_file_path), stat.st_mtime_ns, stat.st_size)
+        if key not in _loaded_configs:
+            with open(config_file_path) as config_file:
+                _loaded_configs[key] = json.load(config_file)
+                self.logger.info("Configuration file loaded from {}".format(config_file_path))
+        # each handler gets its own copy, so the changes made by a command are not seen by the next ones
+        self.config = copy.deepcopy(_loaded_configs[key])
 
     def get(self, key, default):
         return self.config.get(key, default)
\ No newline at end of file
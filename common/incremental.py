@@ -0,0 +1,226 @@
+import inspect
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy import special
+
+from common.storage import read_features, read_features_columns, existing_features_file_path, file_format_of
+
+module_logger = logging.getLogger('pyccflex.common.incremental')
+
+# columns of features files that are not features
+NON_FEATURE_COLUMNS = ('id', 'class_name', 'class_value', 'contents')
+
+
+def feature_columns(file_path, sep=","):
+    return [x for x in read_features_columns(file_path, sep=sep) if x not in NON_FEATURE_COLUMNS]
+
+
+def read_sample_weights(file_path, sep=","):
+    """
+    Reads the weights of training lines from a csv file with the id column and the weights in the second column
+    (e.g., the numbers of occurrences of duplicated lines saved by lines2csv); returns a Series indexed by ids.
+    """
+    df = pd.read_csv(file_path, sep=sep, encoding="utf-8", dtype={'id': str})
+    return pd.Series(df.iloc[:, 1].to_numpy(dtype=np.float64), index=df['id'].to_numpy())
+
+
+def weights_of(ids, sample_weights):
+    """Returns an array of the weights of lines (ids); the lines without a weight get 1."""
+    return pd.Series(np.asarray(ids)).map(sample_weights).fillna(1.0).to_numpy(dtype=np.float64)
+
+
+def accepts_sample_weight(method):
+    """Returns True if a method of a model (fit or partial_fit) accepts sample weights."""
+    return "sample_weight" in inspect.signature(method).parameters
+
+
+def iter_training_chunks(file_path, sep=",", chunksize=10 ** 5, sparse=True, sample_weights=None):
+    """
+    Yields pairs (X, y) of chunks of a training features file: X is a DataFrame of features (or a CSR matrix
+    if the file is a sparse features file and sparse is True) and y is an array of class values.
+    If sample_weights (see read_sample_weights) are given, triples (X, y, weights of the lines) are yielded.
+    """
+    file_path = existing_features_file_path(file_path)
+    reader = read_features(file_path, sep=sep, chunksize=chunksize, resolve=False)
+    if sparse and file_format_of(file_path) == "sparse":
+        for meta_df, matrix in reader.iter_sparse_chunks():
+            if sample_weights is not None:
+                yield matrix, meta_df['class_value'].values, weights_of(meta_df['id'], sample_weights)
+            else:
+                yield matrix, meta_df['class_value'].values
+        return
+    for chunk in reader:
+        y = chunk['class_value'].values
+        X = chunk.drop([x for x in NON_FEATURE_COLUMNS if x in chunk.columns], axis=1)
+        if sample_weights is not None:
+            yield X, y, weights_of(chunk['id'], sample_weights)
+        else:
+            yield X, y
+
+
+def training_classes(file_path, sep=",", chunksize=10 ** 5):
+    """Returns the sorted class values of a training features file (reading only the class_value column)."""
+    classes = set()
+    for chunk in read_features(file_path, sep=sep, chunksize=chunksize, columns=['class_value']):
+        classes.update(chunk['class_value'].unique())
+    return np.array(sorted(classes))
+
+
+def _as_matrix(X):
+    return X if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+
+
+class FeatureStatistics(object):
+    """
+    Statistics of features accumulated over chunks of a training set: the number of rows, sums, sums of squares,
+    minima and maxima of features, and the number of rows and sums of features per class. They are enough to compute
+    the variances of features and the ANOVA F-values (f_classif) and chi-squared statistics of features
+    the same way as sklearn does, without keeping the whole training set in memory.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('pyccflex.common.incremental.FeatureStatistics')
+        self.no_rows = 0
+        self.sums = None
+        self.squares = None
+        self.mins = None
+        self.maxes = None
+        self.classes = []
+        self.class_counts = None
+        self.class_sums = None
+
+    def update(self, X, y):
+        X = _as_matrix(X)
+        y = np.asarray(y)
+        if self.sums is None:
+            no_features = X.shape[1]
+            self.sums = np.zeros(no_features)
+            self.squares = np.zeros(no_features)
+            self.mins = np.full(no_features, np.inf)
+            self.maxes = np.full(no_features, -np.inf)
+            self.class_counts = np.zeros(0, dtype=np.int64)
+            self.class_sums = np.zeros((0, no_features))
+        if X.shape[0] == 0:
+            return
+        self.no_rows += X.shape[0]
+        if sp.issparse(X):
+            X = X.tocsr().astype(np.float64)
+            self.sums += np.asarray(X.sum(axis=0)).ravel()
+            self.squares += np.asarray(X.multiply(X).sum(axis=0)).ravel()
+            self.mins = np.minimum(self.mins, X.min(axis=0).toarray().ravel())
+            self.maxes = np.maximum(self.maxes, X.max(axis=0).toarray().ravel())
+        else:
+            self.sums += X.sum(axis=0)
+            self.squares += (X ** 2).sum(axis=0)
+            self.mins = np.minimum(self.mins, X.min(axis=0))
+            self.maxes = np.maximum(self.maxes, X.max(axis=0))
+
+        chunk_classes, indices = np.unique(y, return_inverse=True)
+        for i, class_value in enumerate(chunk_classes):
+            if class_value not in self.classes:
+                self.classes.append(class_value)
+                self.class_counts = np.append(self.class_counts, 0)
+                self.class_sums = np.vstack([self.class_sums, np.zeros((1, self.class_sums.shape[1]))])
+            k = self.classes.index(class_value)
+            rows = indices.ravel() == i
+            self.class_counts[k] += rows.sum()
+            self.class_sums[k] += np.asarray(X[rows].sum(axis=0)).ravel()
+
+    def variances(self, threshold=0.0):
+        """Returns the variances of features (bounded by the peak-to-peak values if threshold is 0, like sklearn)."""
+        variances = self.squares / self.no_rows - (self.sums / self.no_rows) ** 2
+        variances = np.maximum(variances, 0.0)
+        if threshold == 0:
+            variances = np.nanmin(np.array([variances, self.maxes - self.mins]), axis=0)
+        return variances
+
+    def f_classif(self):
+        """Returns the ANOVA F-values and p-values of features (see sklearn.feature_selection.f_classif)."""
+        no_classes = len(self.classes)
+        square_of_sums_alldata = self.sums ** 2
+        sstot = self.squares - square_of_sums_alldata / float(self.no_rows)
+        ssbn = (self.class_sums ** 2 / self.class_counts.reshape(-1, 1)).sum(axis=0)
+        ssbn -= square_of_sums_alldata / float(self.no_rows)
+        sswn = sstot - ssbn
+        dfbn = no_classes - 1
+        dfwn = self.no_rows - no_classes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            msb = ssbn / float(dfbn)
+            msw = sswn / float(dfwn)
+            f = msb / msw
+        constant_features_idx = np.where(msw == 0.0)[0]
+        if np.nonzero(msb)[0].size != msb.size and constant_features_idx.size:
+            warnings.warn("Features %s are constant." % constant_features_idx, UserWarning)
+        return f, special.fdtrc(dfbn, dfwn, f)
+
+    def chi2(self):
+        """Returns the chi-squared statistics and p-values of features (see sklearn.feature_selection.chi2)."""
+        if np.any(self.mins < 0):
+            raise ValueError("Input X must be non-negative.")
+        observed = self.class_sums.copy()
+        class_prob = (self.class_counts / float(self.no_rows)).reshape(-1, 1)
+        if len(self.classes) == 1:
+            # like LabelBinarizer, a single class is treated as two classes (the other one being empty)
+            observed = np.vstack([np.zeros_like(observed), observed])
+            class_prob = np.vstack([np.zeros_like(class_prob), class_prob])
+        expected = np.dot(class_prob, self.sums.reshape(1, -1))
+        chisq = (observed - expected) ** 2
+        with np.errstate(invalid="ignore"):
+            chisq /= expected
+        chisq = chisq.sum(axis=0)
+        return chisq, special.chdtrc(len(observed) - 1, chisq)
+
+
+def accumulate_statistics(chunks):
+    """Returns the FeatureStatistics of chunks (pairs X, y) of a training set."""
+    statistics = FeatureStatistics()
+    for X, y in chunks:
+        statistics.update(X, y)
+        module_logger.info(">>> Accumulated statistics of {} rows".format(statistics.no_rows))
+    return statistics
+
+
+SCORE_FUNCTIONS = {"f_classif": FeatureStatistics.f_classif,
+                   "chi2": FeatureStatistics.chi2}
+
+
+def fit_selector(selector, statistics, score_func="f_classif"):
+    """
+    Sets the statistics of a sklearn selector (VarianceThreshold, SelectPercentile, SelectFpr) computed from
+    the accumulated statistics, so it selects the same features as if it was fitted on the whole training set.
+    """
+    if statistics.no_rows == 0:
+        raise ValueError("The training set is empty")
+    if hasattr(selector, "threshold"):
+        selector.variances_ = statistics.variances(selector.threshold)
+        if np.all(~np.isfinite(selector.variances_) | (selector.variances_ <= selector.threshold)):
+            raise ValueError("No feature in X meets the variance threshold {0:.5f}".format(selector.threshold))
+    else:
+        if score_func not in SCORE_FUNCTIONS:
+            raise ValueError("Unknown score function {} (available: {})".format(score_func,
+                                                                                ", ".join(SCORE_FUNCTIONS)))
+        selector.scores_, selector.pvalues_ = SCORE_FUNCTIONS[score_func](statistics)
+    selector.n_features_in_ = len(statistics.sums)
+    return selector
+
+
+def partial_fit_models(models, chunks, classes):
+    """
+    Trains models supporting partial_fit with one pass over chunks (pairs X, y or triples X, y, sample weights)
+    of a training set; the weights are skipped for the models not accepting them. Returns the number of rows used.
+    """
+    no_rows = 0
+    for chunk in chunks:
+        X, y = chunk[0], chunk[1]
+        for model in models:
+            if len(chunk) > 2 and accepts_sample_weight(model.partial_fit):
+                model.partial_fit(X, y, classes=classes, sample_weight=chunk[2])
+            else:
+                model.partial_fit(X, y, classes=classes)
+        no_rows += X.shape[0]
+        module_logger.info(">>> Trained models with {} rows".format(no_rows))
+    return no_rows
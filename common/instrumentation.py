@@ -0,0 +1,288 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+module_logger = logging.getLogger('pyccflex.common.instrumentation')
+
+# instrumentation is turned on by setting the environment variable (e.g., PYCCFLEX_INSTRUMENTATION=1)
+INSTRUMENTATION_ENV = "PYCCFLEX_INSTRUMENTATION"
+REPORT_FILE_NAME = "instrumentation"
+
+_profiles = []
+_reports_path = None
+_watched_dirs = []
+
+
+def instrumentation_enabled():
+    return os.environ.get(INSTRUMENTATION_ENV, "").lower() not in ("", "0", "false", "no")
+
+
+def _peak_rss_mb(children=False):
+    """
+    Returns the peak resident set size of this process (since it started or its peak was reset) or the largest one
+    of its terminated children in MB (None if unknown).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _reset_peak_rss():
+    """Resets the peak RSS of this process to its current RSS (Linux only); returns False if it can't be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs_file:
+            clear_refs_file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _snapshot(dirs):
+    files = {}
+    for dir_path in dirs:
+        if not os.path.isdir(dir_path):
+            continue
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    file_stat = entry.stat()
+                    files[entry.path] = (file_stat.st_size, file_stat.st_mtime_ns)
+    return files
+
+
+def _package_version():
+    try:
+        from importlib.metadata import version
+        return version("pyccflex")
+    except Exception:
+        return None
+
+
+class StageProfile(object):
+    """
+    Measures a stage (a run of one of the bin scripts): wall and CPU time (including child processes), RSS at
+    the start and peak RSS of the stage (the peak of the process is reset when a stage begins, so the stages chained
+    in one process don't report the peaks of the earlier ones; where it can't be reset the peak is reported only
+    if the stage raised it), rows read and written by the shared readers and writers, bytes of files created or changed in the workspace,
+    time spent by each class of features extractors and the throughput of case extractors.
+    """
+
+    def __init__(self, name, args=None):
+        self.logger = logging.getLogger('pyccflex.common.instrumentation.StageProfile')
+        self.name = name
+        self.args = [] if args is None else list(args)
+        self.rows_in = 0
+        self.rows_out = 0
+        self.extractors_seconds = collections.Counter()
+        self.extractors_rows = collections.Counter()
+        self.case_extractors = []
+        self.snapshot = None
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.start_wall = time.time()
+        self.start_times = os.times()
+        # the peaks reached so far by the stages being measured are kept before the peak of the process is reset
+        for profile in _profiles:
+            profile.update_peak_rss()
+        self.peak_rss_reset = resource is not None and _reset_peak_rss()
+        self.start_peak_rss_mb = _peak_rss_mb()
+        self.start_children_peak_rss_mb = _peak_rss_mb(children=True)
+        # right after the reset the peak is the current RSS
+        self.start_rss_mb = self.start_peak_rss_mb if self.peak_rss_reset else None
+        self.peak_rss_mb = None
+        self.watch(_watched_dirs)
+
+    def watch(self, dirs):
+        """Takes the snapshot of files in the folders of the workspace (the output bytes are the difference)."""
+        if self.snapshot is None and len(dirs) > 0:
+            self.snapshot = _snapshot(dirs)
+
+    def update_peak_rss(self):
+        """Keeps the peak RSS of the process reached during the stage (before a nested stage resets it)."""
+        peak_rss_mb = _peak_rss_mb()
+        if peak_rss_mb is not None and (self.peak_rss_reset or peak_rss_mb > self.start_peak_rss_mb):
+            self.peak_rss_mb = peak_rss_mb if self.peak_rss_mb is None else max(self.peak_rss_mb, peak_rss_mb)
+
+    def finish(self):
+        end_times = os.times()
+        cpu_seconds = sum(end_times[:4]) - sum(self.start_times[:4])
+        output_bytes = None
+        if self.snapshot is not None:
+            output_bytes = sum(size for path, (size, mtime) in _snapshot(_watched_dirs).items()
+                               if self.snapshot.get(path) != (size, mtime))
+        self.update_peak_rss()
+        peak_rss_mb = self.peak_rss_mb
+        # the peak of the children is the largest one of all terminated children, it is counted if a child
+        # terminated during the stage raised it (e.g., a worker process)
+        children_peak_rss_mb = _peak_rss_mb(children=True)
+        if children_peak_rss_mb is not None and children_peak_rss_mb > self.start_children_peak_rss_mb:
+            peak_rss_mb = children_peak_rss_mb if peak_rss_mb is None else max(peak_rss_mb, children_peak_rss_mb)
+        return {"stage": self.name,
+                "args": self.args,
+                "started": self.started,
+                "version": _package_version(),
+                "wall_seconds": time.time() - self.start_wall,
+                "cpu_seconds": cpu_seconds,
+                "start_rss_mb": self.start_rss_mb,
+                "peak_rss_mb": peak_rss_mb,
+                "rows_in": self.rows_in,
+                "rows_out": self.rows_out,
+                "output_bytes": output_bytes,
+                "extractors": [{"extractor": name, "seconds": seconds, "rows": self.extractors_rows[name]}
+                               for name, seconds in self.extractors_seconds.most_common()],
+                "case_extractors": self.case_extractors}
+
+
+def begin_stage(name, args=None):
+    """Starts measuring a stage if the instrumentation is enabled; returns the profile or None."""
+    if not instrumentation_enabled():
+        return None
+    profile = StageProfile(name, args)
+    _profiles.append(profile)
+    return profile
+
+
+def measuring():
+    """Returns True if a stage is being measured (e.g., a stage of a pipeline running a command)."""
+    return len(_profiles) > 0
+
+
+def end_stage(profile):
+    """Finishes measuring the stage, logs the measurements and adds them to the report in the reports folder."""
+    if profile is None or profile not in _profiles:
+        return None
+    _profiles.remove(profile)
+    record = profile.finish()
+    module_logger.info(">>> Stage {}: {:.2f}s wall time, {:.2f}s CPU time, peak RSS {} MB ({} MB at the start), "
+                       "{} rows in, {} rows out, {} output bytes".format(
+                           record['stage'], record['wall_seconds'], record['cpu_seconds'],
+                           None if record['peak_rss_mb'] is None else round(record['peak_rss_mb'], 1),
+                           None if record['start_rss_mb'] is None else round(record['start_rss_mb'], 1),
+                           record['rows_in'], record['rows_out'], record['output_bytes']))
+    if _reports_path is not None and os.path.isdir(_reports_path):
+        save_report(record, _reports_path)
+    return record
+
+
+def use_workspace(reports_path, watched_dirs):
+    """Sets the folder the report is saved to and the folders where the outputs of stages are stored."""
+    global _reports_path, _watched_dirs
+    if not instrumentation_enabled():
+        return
+    _reports_path = reports_path
+    _watched_dirs = list(watched_dirs)
+    for profile in _profiles:
+        profile.watch(_watched_dirs)
+
+
+def add_rows_in(no_rows):
+    for profile in _profiles:
+        profile.rows_in += no_rows
+
+
+def add_rows_out(no_rows):
+    for profile in _profiles:
+        profile.rows_out += no_rows
+
+
+def add_extractors_seconds(extractors_seconds, extractors_rows):
+    for profile in _profiles:
+        profile.extractors_seconds.update(extractors_seconds)
+        profile.extractors_rows.update(extractors_rows)
+
+
+def add_case_extraction(extractor, no_files, no_bytes, seconds):
+    for profile in _profiles:
+        profile.case_extractors.append({"extractor": extractor,
+                                        "files": no_files,
+                                        "bytes": no_bytes,
+                                        "seconds": seconds,
+                                        "files_per_second": no_files / seconds if seconds > 0 else None,
+                                        "bytes_per_second": no_bytes / seconds if seconds > 0 else None})
+
+
+class CountingChunks(object):
+    """Counts the rows of chunks read from a chunked reader (iterated or read with get_chunk)."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __iter__(self):
+        for chunk in self.reader:
+            add_rows_in(len(chunk))
+            yield chunk
+
+    def get_chunk(self, *args, **kwargs):
+        chunk = self.reader.get_chunk(*args, **kwargs)
+        add_rows_in(len(chunk))
+        return chunk
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    def __enter__(self):
+        self.reader.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.reader.__exit__(exc_type, exc_val, exc_tb)
+
+
+def counting_chunks(reader):
+    return CountingChunks(reader) if len(_profiles) > 0 else reader
+
+
+def save_report(record, reports_path):
+    """Appends the record to the json report (the history of runs) and regenerates the html report."""
+    json_file_path = os.path.join(reports_path, REPORT_FILE_NAME + ".json")
+    with open(os.path.join(reports_path, "." + REPORT_FILE_NAME + ".lock"), "w") as lock_file:
+        # stages run concurrently by different processes may save their records at the same time
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        records = []
+        if os.path.isfile(json_file_path):
+            with open(json_file_path) as json_file:
+                records = json.load(json_file)
+        records.append(record)
+        with open(json_file_path + ".tmp", "w") as json_file:
+            json.dump(records, json_file, indent=2)
+        os.replace(json_file_path + ".tmp", json_file_path)
+        with open(os.path.join(reports_path, REPORT_FILE_NAME + ".html"), "w", encoding="utf-8") as html_file:
+            html_file.write(html_report(records))
+
+
+def html_report(records):
+    """Returns the html report with tables of stages, extractors and case extractors (the latest runs first)."""
+    # pandas is imported only to build the report, so the commands that don't use it start faster
+    import pandas as pd
+    stages = pd.DataFrame([dict((k, v) for k, v in record.items()
+                                if k not in ("args", "extractors", "case_extractors")) for record in records],
+                          columns=["started", "stage", "version", "wall_seconds", "cpu_seconds", "start_rss_mb",
+                                   "peak_rss_mb", "rows_in", "rows_out", "output_bytes"])
+    extractors = pd.DataFrame([dict(x, started=record['started'], stage=record['stage'])
+                               for record in records for x in record['extractors']],
+                              columns=["started", "stage", "extractor", "seconds", "rows"])
+    case_extractors = pd.DataFrame([dict(x, started=record['started'], stage=record['stage'])
+                                    for record in records for x in record['case_extractors']],
+                                   columns=["started", "stage", "extractor", "files", "bytes", "seconds",
+                                            "files_per_second", "bytes_per_second"])
+    sections = [("Stages", stages), ("Features extractors", extractors), ("Case extractors", case_extractors)]
+    body = "".join("<h2>{}</h2>\n{}\n".format(title, df.iloc[::-1].to_html(index=False, float_format="%.3f"))
+                   for title, df in sections)
+    return "<html>\n<head><meta charset=\"utf-8\"><title>Instrumentation report</title></head>\n" \
+           "<body>\n<h1>Instrumentation report</h1>\n{}</body>\n</html>\n".format(body)
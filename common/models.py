@@ -0,0 +1,74 @@
+import glob
+import logging
+import os
+import re
+
+import joblib
+import sklearn
+
+from common.cache import config_hash
+
+module_logger = logging.getLogger('pyccflex.common.models')
+
+MODEL_FILE_EXTENSION = ".joblib"
+
+
+def model_version(train_data_hash, classifier, options):
+    """Returns the version of a model - the hash of the training data, the classifier and its options."""
+    return config_hash({"train": train_data_hash, "classifier": classifier, "options": options,
+                        "sklearn": sklearn.__version__})
+
+
+class ModelArtifact(object):
+    """A trained model together with the names of features (the order of columns) it expects."""
+
+    def __init__(self, model, feature_names, classifier, version):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self.classifier = classifier
+        self.version = version
+
+
+class ModelStore(object):
+    """
+    Stores trained models in a folder (by default the models folder in the cache folder of the workspace).
+    A model named <name> is saved to the file <name>-<version>.joblib; only the latest version of the model is kept.
+    Models are stored uncompressed so their arrays can be memory mapped when loaded.
+    """
+
+    def __init__(self, models_path):
+        self.logger = logging.getLogger('pyccflex.common.models.ModelStore')
+        self.models_path = models_path
+
+    def model_file_path(self, name, version):
+        return os.path.join(os.path.normpath(self.models_path), "{}-{}{}".format(name, version, MODEL_FILE_EXTENSION))
+
+    def model_file_paths(self, name):
+        pattern = re.compile(r"^{}-[0-9a-f]{{40}}{}$".format(re.escape(name), re.escape(MODEL_FILE_EXTENSION)))
+        paths = glob.glob(os.path.join(glob.escape(os.path.normpath(self.models_path)), "*" + MODEL_FILE_EXTENSION))
+        return [x for x in paths if pattern.match(os.path.basename(x))]
+
+    def latest_model_file_path(self, name):
+        paths = self.model_file_paths(name)
+        if len(paths) == 0:
+            return None
+        return max(paths, key=os.path.getmtime)
+
+    def exists(self, name, version):
+        return os.path.isfile(self.model_file_path(name, version))
+
+    def save(self, name, artifact):
+        path = self.model_file_path(name, artifact.version)
+        tmp_path = path + ".tmp"
+        joblib.dump({"model": artifact.model, "feature_names": artifact.feature_names,
+                     "classifier": artifact.classifier, "version": artifact.version}, tmp_path)
+        os.replace(tmp_path, path)
+        for old_path in self.model_file_paths(name):
+            if old_path != path:
+                os.remove(old_path)
+                self.logger.info("Removed the old version of the model {}".format(old_path))
+        return path
+
+    def load(self, path):
+        stored = joblib.load(path, mmap_mode='r')
+        return ModelArtifact(stored["model"], stored["feature_names"], stored["classifier"], stored["version"])
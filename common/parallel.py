@@ -0,0 +1,53 @@
+import logging
+from collections import deque
+from itertools import islice
+
+module_logger = logging.getLogger('pyccflex.common.parallel')
+
+
+def chunks_of(iterable, chunk_size):
+    """Splits an iterable into lists of at most chunk_size elements."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _process_pool_context():
+    import multiprocessing
+    # fork lets workers inherit objects defined in the running script (e.g., tokenizers defined in bin/ scripts)
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def map_in_order(func, chunks, workers=1, max_chunks_in_flight=None, initializer=None, initargs=()):
+    """
+    Applies func to each of the chunks and yields the results in the order of the chunks.
+    If workers > 1, a pool of processes is used and at most max_chunks_in_flight chunks
+    (2 * workers by default) are submitted and not yet consumed at any time, so the memory stays bounded.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield func(chunk)
+        return
+
+    if max_chunks_in_flight is None or max_chunks_in_flight < 1:
+        max_chunks_in_flight = 2 * workers
+
+    # the processes are imported only when they are used, scripts run without workers don't pay for them
+    from concurrent.futures import ProcessPoolExecutor
+    module_logger.info("Using {} worker processes ({} chunks in flight)".format(workers, max_chunks_in_flight))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_process_pool_context(),
+                             initializer=initializer, initargs=initargs) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            if len(in_flight) >= max_chunks_in_flight:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(func, chunk))
+        while len(in_flight) > 0:
+            yield in_flight.popleft().result()
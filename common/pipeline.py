@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+import runpy
+import shutil
+import string
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from common.cache import config_hash, content_hash, file_hash
+from common.instrumentation import begin_stage, end_stage
+from common.parallel import _process_pool_context
+from common.storage import existing_features_file_path, features_file_hash
+
+module_logger = logging.getLogger('pyccflex.common.pipeline')
+
+PIPELINE_STATE_FILE_NAME = "pipeline-state.json"
+
+STAGE_RUN = "run"
+STAGE_SKIPPED = "skipped"
+STAGE_FAILED = "failed"
+STAGE_NOT_RUN = "not run"
+
+
+def path_hash(path):
+    """
+    Returns the hash of the contents of a file (features files stored in other formats are resolved) or of a folder
+    (the names, sizes and modification times of its files); None if the path doesn't exist.
+    """
+    path = existing_features_file_path(path)
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, file_names in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(file_names):
+                file_stat = os.stat(os.path.join(root, file_name))
+                files.append([os.path.relpath(os.path.join(root, file_name), path),
+                              file_stat.st_size, file_stat.st_mtime_ns])
+        return content_hash(json.dumps(files))
+    if os.path.isfile(path):
+        return features_file_hash(path, resolve=False)
+    return None
+
+
+def _expand(value, variables):
+    try:
+        return string.Template(value).substitute(variables)
+    except KeyError as e:
+        raise Exception("Unknown variable {} in {}".format(e, value))
+
+
+def _expand_args(args, variables):
+    """An argument "${NAME}" of a list variable is replaced by the elements of the list (e.g., names of extractors)."""
+    expanded = []
+    for arg in args:
+        name = arg[2:-1] if arg.startswith("${") and arg.endswith("}") else None
+        if name is not None and isinstance(variables.get(name), list):
+            expanded.extend(str(x) for x in variables[name])
+        else:
+            expanded.append(_expand(arg, variables))
+    return expanded
+
+
+class PipelineStage(object):
+    """
+    A single run of a script from the bin folder. Inputs and outputs are the paths of files (or folders) the stage
+    reads and writes; json files given as arguments (configuration files) are inputs as well.
+    A stage that reads things that can't be listed (e.g., code bases) shall always run.
+    """
+
+    def __init__(self, name, script, args=None, inputs=None, outputs=None, after=None, always=False):
+        self.name = name
+        self.script = script
+        self.args = [] if args is None else list(args)
+        self.inputs = [] if inputs is None else [os.path.normpath(x) for x in inputs]
+        self.outputs = [] if outputs is None else [os.path.normpath(x) for x in outputs]
+        self.after = [] if after is None else list(after)
+        self.always = always
+        for arg in self.args:
+            if arg.endswith(".json") and os.path.isfile(arg) and os.path.normpath(arg) not in self.inputs:
+                self.inputs.append(os.path.normpath(arg))
+
+
+def load_pipeline(pipeline_file_path, variables=None):
+    """
+    Reads the stages of a pipeline from a json file. The variables defined in the file (and the given variables
+    that override them) are substituted for ${NAME} in the arguments, inputs and outputs of stages.
+    """
+    with open(pipeline_file_path) as pipeline_file:
+        pipeline = json.load(pipeline_file)
+    all_variables = dict(pipeline.get("variables", {}))
+    all_variables.update(variables if variables is not None else {})
+    stages = []
+    for stage in pipeline.get("stages", []):
+        stages.append(PipelineStage(stage['name'], stage['script'],
+                                    args=_expand_args(stage.get("args", []), all_variables),
+                                    inputs=[_expand(x, all_variables) for x in stage.get("inputs", [])],
+                                    outputs=[_expand(x, all_variables) for x in stage.get("outputs", [])],
+                                    after=stage.get("after", []),
+                                    always=stage.get("always", False)))
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise Exception("Names of stages of the pipeline {} are not unique".format(pipeline_file_path))
+    return stages
+
+
+def run_script(script_path, args):
+    """
+    Runs a python script in this process as if it was run from the command line, so the modules imported by
+    the stages that were run before (e.g., pandas, sklearn) are reused. Handlers added to the logger by the script
+    are removed when it finishes.
+    """
+    pyccflex_logger = logging.getLogger('pyccflex')
+    saved_argv = sys.argv
+    saved_handlers = list(pyccflex_logger.handlers)
+    saved_level = pyccflex_logger.level
+    for handler in saved_handlers:
+        pyccflex_logger.removeHandler(handler)
+    sys.argv = [script_path] + list(args)
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise Exception("The script {} exited with the code {}".format(script_path, e.code))
+    finally:
+        sys.argv = saved_argv
+        for handler in list(pyccflex_logger.handlers):
+            pyccflex_logger.removeHandler(handler)
+        for handler in saved_handlers:
+            pyccflex_logger.addHandler(handler)
+        pyccflex_logger.setLevel(saved_level)
+
+
+def _run_stage_in_worker(job):
+    name, script_path, args = job
+    start = time.time()
+    profile = begin_stage(name, [os.path.basename(script_path)] + list(args))
+    try:
+        run_script(script_path, args)
+    except Exception as e:
+        module_logger.exception("Stage {} failed: {}".format(name, e))
+        return False, time.time() - start
+    finally:
+        end_stage(profile)
+    return True, time.time() - start
+
+
+class PipelineRunner(object):
+    """
+    Runs the stages of a pipeline in the order of their dependencies, like make. A stage depends on the stages
+    defined before it that write its inputs, read its outputs (they can't be overwritten too early) or write
+    the same outputs, and on the stages listed in "after".
+
+    A stage is skipped if the script, its arguments and the contents of its inputs haven't changed since it was
+    last run and its outputs are the same as it left them. Independent stages are run concurrently by worker
+    processes. With a single worker, all stages are run in this process.
+    """
+
+    def __init__(self, stages, state_file_path, scripts_dir=None, script_source=None, workers=1, force=False):
+        self.logger = logging.getLogger('pyccflex.common.pipeline.PipelineRunner')
+        self.stages = stages
+        self.state_file_path = state_file_path
+        self.scripts_dir = scripts_dir
+        self.script_source = script_source
+        self.workers = workers
+        self.force = force
+        self.dependencies = self._dependencies()
+        self.state = self._load_state()
+
+    def _dependencies(self):
+        names = set(stage.name for stage in self.stages)
+        dependencies = {}
+        for i, stage in enumerate(self.stages):
+            depends_on = set()
+            for name in stage.after:
+                if name not in names:
+                    raise Exception("Stage {} is run after an unknown stage {}".format(stage.name, name))
+                depends_on.add(name)
+            for earlier in self.stages[:i]:
+                if set(earlier.outputs) & set(stage.inputs) or set(earlier.inputs) & set(stage.outputs) \
+                        or set(earlier.outputs) & set(stage.outputs):
+                    depends_on.add(earlier.name)
+            dependencies[stage.name] = depends_on
+        return dependencies
+
+    def _load_state(self):
+        if self.state_file_path is None or not os.path.isfile(self.state_file_path):
+            return {}
+        with open(self.state_file_path) as state_file:
+            return json.load(state_file)
+
+    def _save_state(self):
+        if self.state_file_path is None:
+            return
+        with open(self.state_file_path + ".tmp", "w") as state_file:
+            json.dump(self.state, state_file, indent=2, sort_keys=True)
+        os.replace(self.state_file_path + ".tmp", self.state_file_path)
+
+    def script_path(self, stage):
+        if self.scripts_dir is not None and os.path.isfile(os.path.join(self.scripts_dir, stage.script)):
+            return os.path.join(self.scripts_dir, stage.script)
+        script_path = shutil.which(stage.script)
+        if script_path is None:
+            raise Exception("Couldn't find the script {} of the stage {}".format(stage.script, stage.name))
+        return script_path
+
+    def source_path(self, stage):
+        """
+        Returns the path of the file with the code of the script of a stage: the file returned by script_source
+        (e.g., the module of a command run by a thin script) or the script itself.
+        """
+        source_path = self.script_source(stage.script) if self.script_source is not None else None
+        return source_path if source_path is not None else self.script_path(stage)
+
+    def signature(self, stage):
+        return config_hash({"script": file_hash(self.source_path(stage)),
+                            "args": stage.args,
+                            "inputs": [[x, path_hash(x)] for x in stage.inputs]})
+
+    def is_up_to_date(self, stage, signature):
+        last_run = self.state.get(stage.name)
+        if self.force or stage.always or last_run is None or last_run['signature'] != signature:
+            return False
+        return all(last_run['outputs'].get(x) is not None and path_hash(x) == last_run['outputs'][x]
+                   for x in stage.outputs)
+
+    def _record(self, stage, signature, seconds):
+        self.state[stage.name] = {"signature": signature,
+                                  "outputs": dict((x, path_hash(x)) for x in stage.outputs),
+                                  "seconds": seconds}
+        for output in stage.outputs:
+            if self.state[stage.name]['outputs'][output] is None:
+                self.logger.warning("Stage {} didn't create the output {}".format(stage.name, output))
+        self._save_state()
+
+    def selected_stages(self, targets=None):
+        """Returns the stages needed to run the targets (all stages if no targets are given)."""
+        if targets is None or len(targets) == 0:
+            return list(self.stages)
+        needed = set()
+        to_visit = list(targets)
+        while len(to_visit) > 0:
+            name = to_visit.pop()
+            if name not in self.dependencies:
+                raise Exception("Unknown stage {}".format(name))
+            if name not in needed:
+                needed.add(name)
+                to_visit.extend(self.dependencies[name])
+        return [stage for stage in self.stages if stage.name in needed]
+
+    def run(self, targets=None):
+        """Runs the pipeline and returns the timing summary: a list of (stage name, status, seconds)."""
+        stages = self.selected_stages(targets)
+        selected = set(stage.name for stage in stages)
+        statuses = {}
+        seconds = {}
+        signatures = {}
+        running = {}
+        pending = list(stages)
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_pool_context())
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                no_pending = len(pending)
+                for stage in list(pending):
+                    depends_on = self.dependencies[stage.name] & selected
+                    if any(statuses.get(x) in (STAGE_FAILED, STAGE_NOT_RUN) for x in depends_on):
+                        pending.remove(stage)
+                        statuses[stage.name] = STAGE_NOT_RUN
+                        seconds[stage.name] = 0.0
+                        continue
+                    if not all(x in statuses for x in depends_on):
+                        continue
+                    pending.remove(stage)
+                    signatures[stage.name] = self.signature(stage)
+                    if self.is_up_to_date(stage, signatures[stage.name]):
+                        self.logger.info(">>> Stage {} is up to date".format(stage.name))
+                        statuses[stage.name] = STAGE_SKIPPED
+                        seconds[stage.name] = 0.0
+                        continue
+                    self.logger.info(">>> Running stage {}: {} {}".format(stage.name, stage.script,
+                                                                           " ".join(stage.args)))
+                    job = (stage.name, self.script_path(stage), stage.args)
+                    if executor is None:
+                        self._finish(stage, _run_stage_in_worker(job), signatures, statuses, seconds)
+                        break
+                    running[executor.submit(_run_stage_in_worker, job)] = stage
+
+                if len(running) == 0 and len(pending) == no_pending:
+                    raise Exception("Cyclic dependencies between the stages {}".format(
+                        ", ".join(stage.name for stage in pending)))
+                if len(running) > 0:
+                    done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(running.pop(future), future.result(), signatures, statuses, seconds)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return [(stage.name, statuses[stage.name], seconds[stage.name]) for stage in stages]
+
+    def _finish(self, stage, result, signatures, statuses, seconds):
+        succeeded, stage_seconds = result
+        seconds[stage.name] = stage_seconds
+        if succeeded:
+            statuses[stage.name] = STAGE_RUN
+            self._record(stage, signatures[stage.name], stage_seconds)
+            self.logger.info(">>> Stage {} finished in {:.2f}s".format(stage.name, stage_seconds))
+        else:
+            statuses[stage.name] = STAGE_FAILED
+            self.state.pop(stage.name, None)
+            self._save_state()
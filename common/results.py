@@ -0,0 +1,67 @@
+import csv
+import logging
+
+import numpy as np
+
+module_logger = logging.getLogger('pyccflex.common.results')
+
+
+def class_results_files(workspace_dir, output_name, decision_classes):
+    """
+    Returns pairs (decision class, path of the file of lines predicted as the class) for the labeled classes
+    and the default class, e.g., classify-output-CART-<class name>.csv in the results folder.
+    """
+    return [(decision_class,
+             workspace_dir.get_results_file_path("{}-{}.csv".format(output_name, decision_class['name'])))
+            for decision_class in decision_classes["labeled"] + [decision_classes["default"]]]
+
+
+class ResultsWriter(object):
+    """
+    Writes results of classification in chunks as they are produced: the results file (if output_file_path is given)
+    and, for each of the decision classes, the file of lines predicted as the class by any of the pred_columns.
+    The lines of each class are selected with a mask computed for the whole chunk and each file is opened once
+    and kept open until the writer is closed, so the results don't need to be read again to split them by classes.
+    """
+
+    def __init__(self, output_file_path, class_files, pred_columns, sep=","):
+        self.logger = logging.getLogger('pyccflex.common.results.ResultsWriter')
+        self.output_file_path = output_file_path
+        self.class_files = class_files
+        self.pred_columns = list(pred_columns)
+        self.sep = sep
+        self.files = {}
+        self.no_rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, file_path, df):
+        # the header is written with the first chunk (even if it is empty)
+        first_chunk = file_path not in self.files
+        if first_chunk:
+            self.files[file_path] = open(file_path, "w", newline='', encoding="utf-8")
+            self.no_rows[file_path] = 0
+        df.to_csv(self.files[file_path], sep=self.sep, index=False, encoding="utf-8", header=first_chunk,
+                  quoting=csv.QUOTE_NONNUMERIC)
+        self.no_rows[file_path] += df.shape[0]
+
+    def write(self, output_df):
+        """Writes a chunk of results; returns triples (decision class, path of its file, number of its lines)."""
+        if self.output_file_path is not None:
+            self._write(self.output_file_path, output_df)
+        predictions = output_df[self.pred_columns].to_numpy()
+        counts = []
+        for decision_class, file_path in self.class_files:
+            mask = np.any(predictions == decision_class['value'], axis=1)
+            self._write(file_path, output_df[mask])
+            counts.append((decision_class, file_path, int(mask.sum())))
+        return counts
+
+    def close(self):
+        for results_file in self.files.values():
+            results_file.close()
+        self.files = {}
@@ -0,0 +1,114 @@
+import collections
+import logging
+import os
+import random
+
+import pandas as pd
+
+module_logger = logging.getLogger('pyccflex.common.sampling')
+
+STRATA = ("class", "file")
+
+
+class StratifiedReservoir(object):
+    """
+    Samples up to sample_size items of each stratum of a stream in a single pass (reservoir sampling): the n-th item
+    of a stratum replaces a random item of its reservoir with the probability sample_size / n, so each item
+    of the stratum is equally likely to be in the sample. The random draws are taken from rng (random.Random).
+    """
+
+    def __init__(self, sample_size, rng):
+        self.sample_size = sample_size
+        self.rng = rng
+        self.reservoirs = {}
+        self.seen = collections.Counter()
+
+    def draw(self, stratum):
+        """Counts the next item of the stratum; returns the position it takes in the reservoir or None if skipped."""
+        self.seen[stratum] += 1
+        reservoir = self.reservoirs.setdefault(stratum, [])
+        if len(reservoir) < self.sample_size:
+            reservoir.append(None)
+            return len(reservoir) - 1
+        position = self.rng.randrange(self.seen[stratum])
+        return position if position < self.sample_size else None
+
+    def place(self, stratum, position, item):
+        self.reservoirs[stratum][position] = item
+
+    def items(self):
+        return [item for reservoir in self.reservoirs.values() for item in reservoir]
+
+
+class _SampledLine(object):
+
+    def __init__(self, index, source, prev_lines, contents):
+        self.index = index
+        self.source = source
+        self.prev_lines = prev_lines
+        self.contents = contents
+        self.next_lines = []
+
+    def text(self):
+        return "".join(x + "\n" for x in self.prev_lines + [self.contents] + self.next_lines)
+
+
+def sample_lines(file_path, sample_size, sep=",", seed=0, stratify_by=(), ctx_prev=0, ctx_next=0,
+                 chunk_size=10 ** 5):
+    """
+    Samples lines of a results file (id, contents and prediction columns) in a single pass: up to sample_size lines
+    of each stratum - the predicted classes (the values of pred_* columns) and / or the source file (the prefix
+    of the id) of a line, or of the whole file if stratify_by is empty. Each sampled line comes with up to ctx_prev
+    preceding and ctx_next following lines of the same source file, collected while reading (only the last ctx_prev
+    lines are kept in a buffer). The random draws are seeded with the seed and the name of the file.
+    Returns a triple: the text of sampled lines with their context (in the order of lines in the file), the number
+    of lines read and the number of strata.
+    """
+    unknown = [x for x in stratify_by if x not in STRATA]
+    if len(unknown) > 0:
+        raise ValueError("Unknown strata: {} (available: {})".format(", ".join(unknown), ", ".join(STRATA)))
+    by_class = "class" in stratify_by
+    by_file = "file" in stratify_by
+
+    columns = list(pd.read_csv(file_path, sep=sep, encoding="utf-8", nrows=0).columns)
+    pred_columns = [x for x in columns if x.startswith("pred_")] if by_class else []
+    reader = pd.read_csv(file_path, sep=sep, encoding="utf-8", usecols=['id', 'contents'] + pred_columns,
+                         dtype={'id': str, 'contents': str}, keep_default_na=False, chunksize=chunk_size)
+
+    reservoir = StratifiedReservoir(sample_size, random.Random("{}:{}".format(seed, os.path.basename(file_path))))
+    prev_lines = collections.deque([], ctx_prev)
+    collecting = []
+    index = 0
+    for chunk in reader:
+        sources = [x.split(":")[0] for x in chunk['id'].tolist()]
+        if by_class:
+            classes = list(zip(*[chunk[x].tolist() for x in pred_columns]))
+        for i, contents in enumerate(chunk['contents'].tolist()):
+            source = sources[i]
+            if len(collecting) > 0:
+                # the following lines are collected until the end of the source file
+                collecting = [line for line in collecting if line.source == source]
+                for line in collecting:
+                    line.next_lines.append(contents)
+                collecting = [line for line in collecting if len(line.next_lines) < ctx_next]
+
+            stratum = (classes[i] if by_class else None, source if by_file else None)
+            position = reservoir.draw(stratum)
+            if position is not None:
+                line = _SampledLine(index, source,
+                                    [text for text_source, text in prev_lines if text_source == source], contents)
+                reservoir.place(stratum, position, line)
+                if ctx_next > 0:
+                    collecting.append(line)
+            if ctx_prev > 0:
+                prev_lines.append((source, contents))
+            index += 1
+
+    sampled = sorted(reservoir.items(), key=lambda x: x.index)
+    return "".join(line.text() for line in sampled), index, len(reservoir.reservoirs)
+
+
+def sample_lines_of_file(job):
+    """Samples lines of a file given as a pair (file path, keyword arguments of sample_lines), e.g., in a worker."""
+    file_path, kwargs = job
+    return sample_lines(file_path, **kwargs)
@@ -0,0 +1,154 @@
+import csv
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.instrumentation import add_rows_out
+from common.storage import SPARSE_FEATURES_EXTENSION, sparse_meta_file_path
+
+# scipy is imported when sparse files are written or read
+
+module_logger = logging.getLogger('pyccflex.common.sparse_features')
+
+META_COLUMNS_ORDER = ["id", "class_name", "class_value", "contents"]
+
+
+def is_sparse_features_file(file_path):
+    return file_path.endswith(SPARSE_FEATURES_EXTENSION)
+
+
+class SparseFeaturesWriter(object):
+    """
+    Writes features to a sparse .npz file (CSR matrix and feature names) and a sidecar csv file
+    with the id, class and contents columns. Chunks are appended in the order they are written.
+    """
+
+    def __init__(self, output_path, feature_names, meta_columns, sep=","):
+        self.logger = logging.getLogger('pyccflex.common.sparse_features.SparseFeaturesWriter')
+        self.output_path = output_path
+        self.meta_path = sparse_meta_file_path(output_path)
+        self.feature_names = list(feature_names)
+        self.meta_columns = meta_columns
+        self.sep = sep
+        self.matrices = []
+        self.meta_file = None
+        self.meta_writer = None
+
+    def __enter__(self):
+        self.meta_file = open(self.meta_path, 'w', newline='', encoding="utf-8")
+        self.meta_writer = csv.writer(self.meta_file, delimiter=self.sep, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+        self.meta_writer.writerow(self.meta_columns)
+        return self
+
+    def write(self, matrix, meta_rows):
+        """Appends a chunk - a sparse matrix and a list of rows with values of the meta columns."""
+        import scipy.sparse as sp
+        self.matrices.append(sp.csr_matrix(matrix))
+        self.meta_writer.writerows(meta_rows)
+        add_rows_out(len(meta_rows))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.meta_file.close()
+        if exc_type is not None:
+            return False
+        import scipy.sparse as sp
+        if len(self.matrices) > 0:
+            matrix = sp.vstack(self.matrices, format='csr')
+        else:
+            matrix = sp.csr_matrix((0, len(self.feature_names)), dtype=np.int64)
+        np.savez_compressed(self.output_path, format=np.array(matrix.format), shape=np.array(matrix.shape),
+                            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                            feature_names=np.array(self.feature_names, dtype=str))
+        self.logger.info("Saved {} rows x {} features ({} non-zero values) to {}".format(
+            matrix.shape[0], matrix.shape[1], matrix.nnz, self.output_path))
+        return False
+
+
+def load_sparse_features(file_path):
+    """Loads the CSR matrix and the list of feature names from a sparse features file."""
+    import scipy.sparse as sp
+    matrix = sp.load_npz(file_path).tocsr()
+    with np.load(file_path) as loaded:
+        feature_names = list(loaded['feature_names'])
+    return matrix, feature_names
+
+
+class SparseFeaturesReader(object):
+    """
+    Reads a sparse features file in chunks of DataFrames having the same layout as the csv features files
+    (id, features, class_name, class_value, contents).
+    """
+
+    def __init__(self, file_path, sep=",", chunksize=None, columns=None):
+        self.logger = logging.getLogger('pyccflex.common.sparse_features.SparseFeaturesReader')
+        self.file_path = file_path
+        self.sep = sep
+        self.chunksize = chunksize
+        self.matrix, self.feature_names = load_sparse_features(file_path)
+        meta_path = sparse_meta_file_path(file_path)
+        if not os.path.exists(meta_path):
+            raise Exception("Sidecar file {} for sparse features doesn't exist".format(meta_path))
+        self.meta_path = meta_path
+        self.meta_columns = list(pd.read_csv(meta_path, sep=sep, encoding="utf-8", nrows=0).columns)
+        if columns is not None:
+            # only the selected features (and meta columns) are converted to a dense form
+            selected = [i for i, name in enumerate(self.feature_names) if name in set(columns)]
+            self.matrix = self.matrix[:, selected]
+            self.feature_names = [self.feature_names[i] for i in selected]
+            self.meta_columns = [x for x in self.meta_columns if x in set(columns)]
+        self.meta_chunks = None
+        self.position = 0
+
+    def columns(self):
+        """Returns the names of columns in the order of the DataFrames returned by the reader."""
+        return [x for x in META_COLUMNS_ORDER[:1] if x in self.meta_columns] + list(self.feature_names) + \
+               [x for x in META_COLUMNS_ORDER[1:] if x in self.meta_columns]
+
+    def _to_frame(self, meta_df):
+        start = self.position
+        end = start + meta_df.shape[0]
+        self.position = end
+        features_df = pd.DataFrame(self.matrix[start:end].toarray(), columns=self.feature_names,
+                                   index=meta_df.index)
+        ordered = [meta_df[['id']], features_df] if 'id' in meta_df.columns else [features_df]
+        rest = [x for x in META_COLUMNS_ORDER[1:] if x in meta_df.columns]
+        if len(rest) > 0:
+            ordered.append(meta_df[rest])
+        return pd.concat(ordered, axis=1)
+
+    def read(self):
+        meta_df = pd.read_csv(self.meta_path, sep=self.sep, encoding="utf-8", usecols=self.meta_columns)
+        self.position = 0
+        return self._to_frame(meta_df)
+
+    def _next_meta_chunk(self):
+        if self.meta_chunks is None:
+            self.meta_chunks = pd.read_csv(self.meta_path, sep=self.sep, encoding="utf-8",
+                                           chunksize=self.chunksize, usecols=self.meta_columns)
+        return self.meta_chunks.get_chunk()
+
+    def get_chunk(self):
+        return self._to_frame(self._next_meta_chunk())
+
+    def get_sparse_chunk(self):
+        """Returns the next chunk without converting it to a dense form - a DataFrame of meta columns and a CSR matrix."""
+        meta_df = self._next_meta_chunk()
+        start = self.position
+        self.position = start + meta_df.shape[0]
+        return meta_df, self.matrix[start:self.position]
+
+    def iter_sparse_chunks(self):
+        while True:
+            try:
+                yield self.get_sparse_chunk()
+            except StopIteration:
+                return
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get_chunk()
+            except StopIteration:
+                return
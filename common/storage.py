@@ -0,0 +1,514 @@
+import csv
+import logging
+import os
+import shutil
+from collections import OrderedDict
+
+from common.cache import file_hash, content_hash
+from common.instrumentation import add_rows_in, add_rows_out, counting_chunks
+
+# pyarrow is imported when a parquet or arrow file is used (see _require_pyarrow), not by every script using csv files;
+# pandas and numpy are imported by the functions reading and writing data, so managing files (copying, deleting,
+# resolving the stored format) doesn't load them
+pa = None
+pq = None
+
+module_logger = logging.getLogger('pyccflex.common.storage')
+
+STORAGE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+SPARSE_FEATURES_EXTENSION = ".npz"
+SPARSE_META_SUFFIX = "-meta.csv"
+FEATURES_EXTENSIONS = [".csv", ".parquet", ".arrow", SPARSE_FEATURES_EXTENSION]
+
+
+def _require_pyarrow(file_format):
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("The pyarrow package is required to use the {} format of features files".format(
+                file_format))
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+def sparse_meta_file_path(file_path):
+    """Returns the path of the sidecar csv file storing ids, classes and contents for a sparse features file."""
+    return file_path[:-len(SPARSE_FEATURES_EXTENSION)] + SPARSE_META_SUFFIX
+
+
+def storage_format_of(files_format_config):
+    """Returns the storage format of feature files configured in files_format.json ("storage_format" key)."""
+    storage_format = files_format_config.get("storage_format", "csv")
+    if storage_format not in STORAGE_FORMATS:
+        raise Exception("Unknown storage format {} (available: {})".format(
+            storage_format, ", ".join(STORAGE_FORMATS.keys())))
+    if storage_format != "csv":
+        _require_pyarrow(storage_format)
+    return storage_format
+
+
+def file_format_of(file_path):
+    """Returns the format of a features file based on its extension."""
+    extension = os.path.splitext(file_path)[1]
+    for storage_format, storage_extension in STORAGE_FORMATS.items():
+        if extension == storage_extension:
+            return storage_format
+    if extension == SPARSE_FEATURES_EXTENSION:
+        return "sparse"
+    return "csv"
+
+
+def storage_file_path(file_path, storage_format="csv"):
+    """Returns the path under which a features file is stored in the given format (e.g., x.csv -> x.parquet)."""
+    root, extension = os.path.splitext(file_path)
+    if extension not in FEATURES_EXTENSIONS:
+        root = file_path
+    return root + STORAGE_FORMATS[storage_format]
+
+
+def existing_features_file_path(file_path):
+    """
+    Scripts refer to features files using their csv names (e.g., train-features.csv). If the file was stored
+    in a different format (parquet, arrow or sparse) the path of that file is returned (the most recent one).
+    """
+    root, extension = os.path.splitext(file_path)
+    if extension not in FEATURES_EXTENSIONS:
+        return file_path
+    candidates = [root + x for x in FEATURES_EXTENSIONS if os.path.isfile(root + x)]
+    if len(candidates) == 0:
+        return file_path
+    return max(candidates, key=lambda x: (os.path.getmtime(x), x == file_path))
+
+
+def features_file_hash(file_path, resolve=True):
+    """Returns the hash of the contents of a features file (including the sidecar file of sparse files)."""
+    if resolve:
+        file_path = existing_features_file_path(file_path)
+    if file_format_of(file_path) == "sparse":
+        return content_hash(file_hash(file_path) + file_hash(sparse_meta_file_path(file_path)))
+    return file_hash(file_path)
+
+
+class FramesMemo(object):
+    """
+    Keeps DataFrames read from features files in memory, so a file read again in the same process (e.g., by another
+    stage of a pipeline) isn't parsed again. Entries are keyed by the path, size and modification time of the file
+    and the arguments of the read; the least recently used entries are evicted when the memory limit is exceeded.
+    """
+
+    def __init__(self, max_bytes):
+        self.logger = logging.getLogger('pyccflex.common.storage.FramesMemo')
+        self.max_bytes = max_bytes
+        self.no_bytes = 0
+        self.frames = OrderedDict()
+
+    def key(self, file_path, **read_args):
+        file_stat = os.stat(file_path)
+        return os.path.abspath(file_path), file_stat.st_size, file_stat.st_mtime_ns, repr(sorted(read_args.items()))
+
+    def get(self, key):
+        if key not in self.frames:
+            return None
+        self.frames.move_to_end(key)
+        self.logger.info("Using the features file {} kept in memory".format(key[0]))
+        return self._copy(self.frames[key][0])
+
+    @staticmethod
+    def _copy(df):
+        import pandas as pd
+        # with copy on write (pandas >= 3) a shallow copy is enough to keep the frame unchanged by the callers
+        return df.copy(deep=int(pd.__version__.split(".")[0]) < 3)
+
+    def put(self, key, df):
+        no_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        if no_bytes > self.max_bytes:
+            return
+        self.frames[key] = (self._copy(df), no_bytes)
+        self.no_bytes += no_bytes
+        while self.no_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self.frames.popitem(last=False)
+            self.no_bytes -= evicted_bytes
+
+
+frames_memo = None
+
+
+def keep_frames_in_memory(max_bytes):
+    """Features files read as whole DataFrames are kept in memory of this process (up to max_bytes, 0 - disabled)."""
+    global frames_memo
+    frames_memo = FramesMemo(max_bytes) if max_bytes > 0 else None
+
+
+def read_features(file_path, sep=",", chunksize=None, columns=None, resolve=True, **kwargs):
+    """
+    Reads a features file stored as csv, parquet, arrow or sparse (.npz) features file.
+    If chunksize is given an iterator over chunks (DataFrames) is returned, otherwise a single DataFrame.
+    If columns are given only these columns are read (in the order they are stored in the file).
+    The kwargs are passed to pandas.read_csv when reading csv files (only nrows is supported for other formats).
+    """
+    if resolve:
+        file_path = existing_features_file_path(file_path)
+    if chunksize is not None:
+        return counting_chunks(_read_features(file_path, sep, chunksize, columns, **kwargs))
+    if frames_memo is not None and os.path.isfile(file_path):
+        key = frames_memo.key(file_path, sep=sep, columns=columns, **kwargs)
+        df = frames_memo.get(key)
+        if df is None:
+            df = _read_features(file_path, sep, chunksize, columns, **kwargs)
+            frames_memo.put(key, df)
+    else:
+        df = _read_features(file_path, sep, chunksize, columns, **kwargs)
+    add_rows_in(len(df))
+    return df
+
+
+def _read_features(file_path, sep, chunksize, columns, **kwargs):
+    file_format = file_format_of(file_path)
+    if file_format == "sparse":
+        from common.sparse_features import SparseFeaturesReader
+        reader = SparseFeaturesReader(file_path, sep=sep, chunksize=chunksize, columns=columns)
+    elif file_format in ("parquet", "arrow"):
+        reader = ColumnarFeaturesReader(file_path, file_format, chunksize=chunksize, columns=columns)
+    else:
+        import pandas as pd
+        if columns is not None:
+            kwargs['usecols'] = columns
+        return pd.read_csv(file_path, sep=sep, encoding="utf-8", chunksize=chunksize, **kwargs)
+    if chunksize is not None:
+        return reader
+    df = reader.read()
+    return df if kwargs.get("nrows") is None else df.iloc[:kwargs["nrows"]]
+
+
+def read_features_columns(file_path, sep=",", resolve=True):
+    """Returns the names of columns of a features file without reading the data."""
+    if resolve:
+        file_path = existing_features_file_path(file_path)
+    file_format = file_format_of(file_path)
+    if file_format == "sparse":
+        from common.sparse_features import SparseFeaturesReader
+        return SparseFeaturesReader(file_path, sep=sep).columns()
+    if file_format in ("parquet", "arrow"):
+        return list(_read_schema(file_path, file_format).names)
+    import pandas as pd
+    return list(pd.read_csv(file_path, sep=sep, encoding="utf-8", nrows=0).columns)
+
+
+def _read_schema(file_path, file_format):
+    _require_pyarrow(file_format)
+    if file_format == "parquet":
+        return pq.read_schema(file_path)
+    with pa.memory_map(file_path, 'r') as source:
+        return pa.ipc.open_file(source).schema
+
+
+def iter_feature_rows(file_path, sep=",", columns=None, chunksize=10 ** 4):
+    """
+    Iterates over rows (dicts) of a features file. Csv files are read with csv.DictReader (numbers as floats),
+    other formats are read in chunks. If columns are given the rows have only these of them the file has.
+    """
+    file_path = existing_features_file_path(file_path)
+    if file_format_of(file_path) == "csv":
+        with open(file_path, "r", newline='', encoding="utf-8") as in_csv:
+            for row in csv.DictReader(in_csv, delimiter=sep, quotechar='"', quoting=csv.QUOTE_NONNUMERIC):
+                add_rows_in(1)
+                yield row if columns is None else dict((x, row[x]) for x in columns if x in row)
+        return
+    for chunk in read_features(file_path, sep=sep, chunksize=chunksize, columns=columns, resolve=False):
+        for row in chunk.to_dict("records"):
+            yield row
+
+
+class ColumnarFeaturesReader(object):
+    """
+    Reads a parquet or arrow (IPC file) features file in chunks of exactly chunksize rows (the last may be smaller).
+    The index of chunks continues from chunk to chunk like for pandas.read_csv.
+    """
+
+    def __init__(self, file_path, file_format, chunksize=None, columns=None):
+        self.logger = logging.getLogger('pyccflex.common.storage.ColumnarFeaturesReader')
+        _require_pyarrow(file_format)
+        self.file_path = file_path
+        self.file_format = file_format
+        self.chunksize = chunksize
+        self.schema = _read_schema(file_path, file_format)
+        self.columns = None if columns is None else [x for x in self.schema.names if x in set(columns)]
+        if self.columns is not None:
+            self.schema = pa.schema([self.schema.field(x) for x in self.columns])
+        self.tables = None
+        self.position = 0
+
+    def _batches(self):
+        if self.file_format == "parquet":
+            parquet_file = pq.ParquetFile(self.file_path)
+            for batch in parquet_file.iter_batches(batch_size=self.chunksize, columns=self.columns):
+                yield batch
+        else:
+            # batches of a memory mapped file are not copied until converted to pandas
+            with pa.memory_map(self.file_path, 'r') as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    yield batch if self.columns is None else batch.select(self.columns)
+
+    def _tables(self):
+        pending = []
+        no_pending = 0
+        no_tables = 0
+        for batch in self._batches():
+            pending.append(batch)
+            no_pending += batch.num_rows
+            while no_pending >= self.chunksize:
+                table = pa.Table.from_batches(pending, schema=self.schema)
+                yield table.slice(0, self.chunksize)
+                no_tables += 1
+                rest = table.slice(self.chunksize)
+                pending = rest.to_batches()
+                no_pending = rest.num_rows
+        if no_pending > 0 or no_tables == 0:
+            yield pa.Table.from_batches(pending, schema=self.schema)
+
+    def _to_frame(self, table):
+        import pandas as pd
+        df = table.to_pandas()
+        df.index = pd.RangeIndex(self.position, self.position + df.shape[0])
+        self.position += df.shape[0]
+        return df
+
+    def read(self):
+        self.position = 0
+        if self.file_format == "parquet":
+            table = pq.read_table(self.file_path, columns=self.columns)
+        else:
+            with pa.memory_map(self.file_path, 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            if self.columns is not None:
+                table = table.select(self.columns)
+        return self._to_frame(table)
+
+    def get_chunk(self):
+        if self.tables is None:
+            self.tables = self._tables()
+        return self._to_frame(next(self.tables))
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get_chunk()
+            except StopIteration:
+                return
+
+
+def _unique_column_names(columns):
+    """Renames duplicated columns the same way pandas.read_csv does (x, x.1, x.2, ...)."""
+    columns = [str(x) for x in columns]
+    names = set(columns)
+    used = set()
+    counts = {}
+    result = []
+    for column in columns:
+        name = column
+        if name in used:
+            count = counts.get(column, 1)
+            while "{}.{}".format(column, count) in used or "{}.{}".format(column, count) in names:
+                count += 1
+            counts[column] = count + 1
+            name = "{}.{}".format(column, count)
+        used.add(name)
+        result.append(name)
+    return result
+
+
+def _is_empty_column(values):
+    """Returns True for a non-numeric column without values (e.g., all missing in a chunk)."""
+    import pandas as pd
+    return not pd.api.types.is_numeric_dtype(values.dtype) and bool(values.isna().all())
+
+
+def _arrow_schema(df, null_type=None):
+    """
+    Integer columns are stored as 32 bit integers if possible, text columns as strings. Non-numeric columns without
+    values get the null_type (strings if None).
+    """
+    import numpy as np
+    import pandas as pd
+    fields = []
+    for i, column in enumerate(df.columns):
+        values = df.iloc[:, i]
+        dtype = values.dtype
+        if null_type is not None and _is_empty_column(values):
+            field_type = null_type
+        elif pd.api.types.is_bool_dtype(dtype):
+            field_type = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            fits = values.shape[0] == 0 or (values.min() >= np.iinfo(np.int32).min and
+                                            values.max() <= np.iinfo(np.int32).max)
+            field_type = pa.int32() if fits else pa.int64()
+        elif pd.api.types.is_float_dtype(dtype):
+            field_type = pa.float64()
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(str(column), field_type))
+    return pa.schema(fields)
+
+
+def _is_numeric_type(field_type):
+    return pa.types.is_boolean(field_type) or pa.types.is_integer(field_type) or pa.types.is_floating(field_type)
+
+
+def _promoted_type(written_type, chunk_type):
+    """Returns the type of a column that can store the values written so far and the values of a new chunk."""
+    if pa.types.is_null(chunk_type) or written_type == chunk_type:
+        return written_type
+    if pa.types.is_null(written_type):
+        return chunk_type
+    if _is_numeric_type(written_type) and _is_numeric_type(chunk_type):
+        if pa.types.is_floating(written_type) or pa.types.is_floating(chunk_type):
+            return pa.float64()
+        return pa.int64()
+    return pa.string()
+
+
+class FeaturesWriter(object):
+    """
+    Writes a features file in chunks (DataFrames or lists of rows) in the given storage format.
+    The schema of parquet / arrow files is determined by the first chunk and promoted if a later chunk needs
+    a wider type of a column (e.g., 64 bit integers, floats or values in a column that was empty so far) - the rows
+    written so far are then rewritten with the new schema. These files are written to a temporary file which
+    replaces the output when closed (the output may be memory mapped by a reader of the same file).
+    """
+
+    def __init__(self, file_path, sep=",", storage_format="csv"):
+        self.logger = logging.getLogger('pyccflex.common.storage.FeaturesWriter')
+        self.file_path = storage_file_path(file_path, storage_format)
+        self.sep = sep
+        self.storage_format = storage_format
+        self.file = None
+        self.writer = None
+        self.schema = None
+        # columns without any values written so far, their type is taken from the first chunk having values
+        self.null_columns = set()
+        self.no_chunks = 0
+
+    def __enter__(self):
+        if self.storage_format == "csv":
+            self.file = open(self.file_path, 'w', newline='', encoding="utf-8")
+        return self
+
+    def write(self, df):
+        if self.storage_format == "csv":
+            df.to_csv(self.file, sep=self.sep, index=False, encoding="utf-8", header=(self.no_chunks == 0),
+                      quoting=csv.QUOTE_NONNUMERIC)
+        else:
+            self._write_table(df)
+        self.no_chunks += 1
+        add_rows_out(len(df))
+
+    def write_rows(self, columns, rows):
+        """Writes a chunk given as a list of rows (lists of values in the order of columns)."""
+        if self.storage_format == "csv":
+            writer = csv.writer(self.file, delimiter=self.sep, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+            if self.no_chunks == 0:
+                writer.writerow(columns)
+            writer.writerows(rows)
+            self.no_chunks += 1
+            add_rows_out(len(rows))
+        else:
+            import pandas as pd
+            self.write(pd.DataFrame(rows, columns=columns))
+
+    def _write_table(self, df):
+        df = df.copy(deep=False)
+        df.columns = _unique_column_names(df.columns)
+        if self.schema is None:
+            _require_pyarrow(self.storage_format)
+            self.schema = _arrow_schema(df)
+            self.null_columns = set(x for i, x in enumerate(df.columns) if _is_empty_column(df.iloc[:, i]))
+            self._open_writer()
+        elif df.shape[0] == 0:
+            # the types of columns of an empty chunk are not known
+            return
+        chunk_schema = _arrow_schema(df, null_type=pa.null())
+        table = pa.Table.from_pandas(df, schema=chunk_schema, preserve_index=False)
+        schema = pa.schema([pa.field(field.name, chunk_field.type if field.name in self.null_columns and
+                                     not pa.types.is_null(chunk_field.type)
+                                     else _promoted_type(field.type, chunk_field.type))
+                            for field, chunk_field in zip(self.schema, chunk_schema)])
+        self.null_columns = set(x for x in self.null_columns if pa.types.is_null(chunk_schema.field(x).type))
+        if not schema.equals(self.schema):
+            self._promote(schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def _open_writer(self):
+        if self.storage_format == "parquet":
+            self.writer = pq.ParquetWriter(self._temporary_file_path(), self.schema)
+        else:
+            self.file = pa.OSFile(self._temporary_file_path(), 'wb')
+            self.writer = pa.ipc.new_file(self.file, self.schema)
+
+    def _close_writer(self):
+        self.writer.close()
+        if self.storage_format != "parquet":
+            self.file.close()
+            self.file = None
+
+    def _promote(self, schema):
+        """Rewrites the rows written so far with the new schema (the batches are cast one at a time)."""
+        self.logger.debug("Promoting the schema of {} to {}".format(self.file_path, schema))
+        written_file_path = self._temporary_file_path() + ".old"
+        self._close_writer()
+        os.replace(self._temporary_file_path(), written_file_path)
+        self.schema = schema
+        self._open_writer()
+        if self.storage_format == "parquet":
+            for batch in pq.ParquetFile(written_file_path).iter_batches():
+                self.writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+        else:
+            with pa.memory_map(written_file_path, 'r') as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    self.writer.write_table(pa.Table.from_batches([reader.get_batch(i)]).cast(schema))
+        os.remove(written_file_path)
+
+    def _temporary_file_path(self):
+        return self.file_path + ".tmp"
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.writer is not None and self.storage_format != "csv":
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+        if self.storage_format != "csv" and os.path.isfile(self._temporary_file_path()):
+            if exc_type is None:
+                os.replace(self._temporary_file_path(), self.file_path)
+            else:
+                os.remove(self._temporary_file_path())
+        return False
+
+
+def write_features(df, file_path, sep=",", storage_format="csv"):
+    """Writes a whole DataFrame to a features file in the given storage format and returns the path."""
+    with FeaturesWriter(file_path, sep=sep, storage_format=storage_format) as writer:
+        writer.write(df)
+    return writer.file_path
+
+
+def copy_features_file(from_file_path, to_file_path):
+    """Copies a features file (with the sidecar file for sparse files) keeping its format; returns the new path."""
+    from_file_path = existing_features_file_path(from_file_path)
+    to_file_path = os.path.splitext(to_file_path)[0] + os.path.splitext(from_file_path)[1]
+    shutil.copy(from_file_path, to_file_path)
+    if file_format_of(from_file_path) == "sparse":
+        shutil.copy(sparse_meta_file_path(from_file_path), sparse_meta_file_path(to_file_path))
+    return to_file_path
+
+
+def delete_features_file(file_path):
+    """Deletes a features file (with the sidecar file for sparse files); returns the deleted path."""
+    file_path = existing_features_file_path(file_path)
+    os.remove(file_path)
+    if file_format_of(file_path) == "sparse" and os.path.isfile(sparse_meta_file_path(file_path)):
+        os.remove(sparse_meta_file_path(file_path))
+    return file_path
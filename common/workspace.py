@@ -11,7 +11,9 @@ class WorkspaceHandler(object):
 
     def __init__(self, tmp_dir_path, output_dir_name="results",
                  processing_dir_name="processing",
-                 reporting_dir_name="reports"):
+                 reporting_dir_name="reports",
+                 cache_dir_name="cache",
+                 models_dir_name="models"):
         self.logger = logging.getLogger('pyccflex.common.configuration.TempStorageHandler')
         self.path = tmp_dir_path
         self.output_dir_name = output_dir_name
@@ -20,20 +22,40 @@ class WorkspaceHandler(object):
         self.processing_path = self.get_file_path(self.processing_dir_name)
         self.reports_dir_name = reporting_dir_name
         self.reports_path = self.get_file_path(self.reports_dir_name)
+        self.cache_dir_name = cache_dir_name
+        self.cache_path = self.get_file_path(self.cache_dir_name)
+        # trained models are kept in the cache folder so they can be reused after the workspace is erased
+        self.models_dir_name = models_dir_name
+        self.models_path = os.path.join(os.path.normpath(self.cache_path), self.models_dir_name)
 
     def create_workspace_dir(self):
-        os.makedirs(self.path)
-        self.logger.info("Creating storage folder {}".format(self.path))
+        # the folder may exist if it was erased keeping the cache
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+            self.logger.info("Creating storage folder {}".format(self.path))
         os.makedirs(self.results_path)
         self.logger.info("Creating results folder {}".format(self.results_path))
         os.makedirs(self.processing_path)
         self.logger.info("Creating results folder {}".format(self.processing_path))
         os.makedirs(self.reports_path)
         self.logger.info("Creating results folder {}".format(self.reports_path))
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+            self.logger.info("Creating cache folder {}".format(self.cache_path))
 
-    def remove_workspace_dir(self):
-        shutil.rmtree(self.path)
-        self.logger.info("Removing storage folder {}".format(self.path))
+    def remove_workspace_dir(self, keep_cache=False):
+        if keep_cache and os.path.exists(self.cache_path):
+            for name in os.listdir(self.path):
+                if name != self.cache_dir_name:
+                    path = self.get_file_path(name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+            self.logger.info("Removing storage folder {} (keeping the cache folder)".format(self.path))
+        else:
+            shutil.rmtree(self.path)
+            self.logger.info("Removing storage folder {}".format(self.path))
 
     def get_file_path(self, filename):
         return os.path.join(os.path.normpath(self.path), filename)
@@ -47,5 +69,16 @@ class WorkspaceHandler(object):
     def get_reports_file_path(self, filename):
         return os.path.join(os.path.normpath(self.reports_path), filename)
 
+    def get_cache_file_path(self, filename):
+        # workspaces created by older versions don't have the cache folder
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+        return os.path.join(os.path.normpath(self.cache_path), filename)
+
+    def get_models_dir_path(self):
+        if not os.path.exists(self.models_path):
+            os.makedirs(self.models_path)
+        return self.models_path
+
 
 
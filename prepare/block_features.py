@@ -0,0 +1,68 @@
+import logging
+
+import numpy as np
+
+module_logger = logging.getLogger('pyccflex.prepare.block_features')
+
+
+def file_names_of(ids):
+    """Returns the names of files of lines given as a Series of ids (<file name>:<line number>)."""
+    return ids.astype(str).str.split(":", n=1).str[0].to_numpy()
+
+
+class BlockFeatureTracker(object):
+    """
+    Computes the values of a block feature (see extract_block_features_from_features) for consecutive chunks of lines.
+    A line gets 1 if it starts a block, ends an open block or is inside of an open block (a block ends at the end
+    of its file); a line that starts and ends a block gets 1 without changing the state; a forbidden line gets 0
+    and is skipped. The state (the file of the last line and whether a block is open) is carried between chunks.
+
+    The values are computed with array operations: a line is inside of an open block if the last start or end marker
+    before it, in the same run of lines of a file, is a start marker (or there is no such marker and the block
+    was open when the run started).
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('pyccflex.prepare.block_features.BlockFeatureTracker')
+        self.last_file_name = None
+        self.inside = False
+
+    def values(self, file_names, start, end, forbidden=None):
+        """
+        Returns the values (an array of 0 / 1) for a chunk of lines given as arrays: the names of their files
+        and whether they start a block, end a block or can't be a part of a block.
+        """
+        file_names = np.asarray(file_names)
+        start = np.asarray(start, dtype=bool)
+        end = np.asarray(end, dtype=bool)
+        forbidden = np.zeros(len(file_names), dtype=bool) if forbidden is None else np.asarray(forbidden, dtype=bool)
+        values = np.zeros(len(file_names), dtype=np.int64)
+        start_end = start & end & ~forbidden
+        values[start_end] = 1
+
+        # only the remaining lines change the state, each of them is a start, an end or neither
+        lines = np.flatnonzero(~forbidden & ~start_end)
+        if len(lines) == 0:
+            return values
+        files = file_names[lines]
+        starts = start[lines]
+        ends = end[lines]
+        positions = np.arange(len(lines))
+
+        new_file = np.empty(len(lines), dtype=bool)
+        new_file[0] = files[0] != self.last_file_name
+        new_file[1:] = files[1:] != files[:-1]
+        # the first line of the run of lines of a file and whether the run continues the previous chunk
+        run_start = np.maximum.accumulate(np.where(new_file, positions, 0))
+        continued = np.cumsum(new_file) == 0
+        # the last marker before each line
+        last_marker = np.maximum.accumulate(np.where(starts | ends, positions, -1))
+        previous_marker = np.concatenate(([-1], last_marker[:-1]))
+
+        has_marker = previous_marker >= run_start
+        open_before = np.where(has_marker, starts[previous_marker], continued & self.inside)
+        values[lines] = starts | open_before
+
+        self.last_file_name = files[-1]
+        self.inside = bool(starts[-1] or (open_before[-1] and not ends[-1]))
+        return values
@@ -2,20 +2,45 @@ import abc
 import logging
 import os
 import csv
+import shutil
+import tempfile
 
 import re
-import hashlib
+import time
+
+from common.cache import ContentCache, content_hash
+from common.instrumentation import instrumentation_enabled, add_case_extraction
+from common.parallel import map_in_order, chunks_of
+from prepare.duplicates import DUPLICATES_HEADER, LineHashIndex, line_hash
 
 module_logger = logging.getLogger('pyccflex.prepare.case_extractors')
 
+_worker_extractor = None
+
+
+def _init_case_extraction_worker(extractor):
+    global _worker_extractor
+    _worker_extractor = extractor
+
+
+def _extract_cases_to_shard(shard):
+    return _worker_extractor.extract_cases_to_shard(shard)
+
 
 class BaseCaseExtractor(abc.ABC):
     """
     Base class for extracting cases / objects from code files. Intended for subclassing.
+    If workers > 1, files are processed by a pool of processes, each chunk of files is saved to a separate
+    shard file and the shards are merged in the order of file paths.
+    If the cache is used (see use_cache), the cases of files that haven't changed are taken from the cache.
+    If remove_global_duplicates is True, only the first occurrence of a case in all the files is saved (see
+    duplicate_key) and the number of occurrences of duplicated cases is saved to the duplicates_file_path (if given).
     """
 
     def __init__(self, code_location, output_file_path, decision_classes, sep=",",
-                 quotechar="\"", remove_duplicates=False, verbosity=100, max_line_length=1000):
+                 quotechar="\"", remove_duplicates=False, verbosity=100, max_line_length=1000,
+                 workers=1, files_per_chunk=100, max_chunks_in_flight=None, remove_global_duplicates=False,
+                 duplicates_file_path=None):
         self.logger = logging.getLogger('pyccflex.common.configuration.BaseCaseExtractor')
         self.code_location = code_location
         self.locations = code_location.get("locations", [])
@@ -27,23 +52,162 @@ class BaseCaseExtractor(abc.ABC):
         self.verbosity = verbosity
         self.remove_duplicates = remove_duplicates
         self.max_line_length = max_line_length
+        self.workers = workers
+        self.files_per_chunk = files_per_chunk
+        self.max_chunks_in_flight = max_chunks_in_flight
+        self.remove_global_duplicates = remove_global_duplicates
+        self.duplicates_file_path = duplicates_file_path
+        self.duplicates_index = None
+        self.no_rows = 0
+        self.no_duplicates = 0
+        self.cache = None
+        self.no_files = 0
+        self.no_bytes = 0
+
+    def use_cache(self, cache_file_path, scope, config=None):
+        """Turns on the cache of cases stored in the cache_file_path (e.g., in the cache folder of the workspace)."""
+        cache_config = {"extractor": type(self).__name__,
+                        "decision_classes": self.decision_classes,
+                        "remove_duplicates": self.remove_duplicates,
+                        "max_line_length": self.max_line_length}
+        cache_config.update(config if config is not None else {})
+        self.cache = ContentCache(cache_file_path, scope, cache_config)
+
+    def _writer(self, output_file):
+        return csv.writer(output_file, delimiter=self.sep, quotechar=self.quotechar, quoting=csv.QUOTE_NONNUMERIC)
 
     def extract(self):
+        start = time.perf_counter()
+        if self.remove_global_duplicates:
+            self.duplicates_index = LineHashIndex()
+            self.no_rows = 0
+            self.no_duplicates = 0
+        self._extract()
+        if self.duplicates_index is not None:
+            self.logger.info(">>> Removed {} duplicated cases, {} distinct cases left "
+                             "(the index takes {:.1f} MB)".format(self.no_duplicates, len(self.duplicates_index),
+                                                                  self.duplicates_index.memory_size() / 2 ** 20))
+            if self.duplicates_file_path is not None:
+                self._save_duplicates()
+        if self.cache is not None:
+            self.cache.finish()
+        if instrumentation_enabled():
+            seconds = time.perf_counter() - start
+            add_case_extraction(type(self).__name__, self.no_files, self.no_bytes, seconds)
+            if seconds > 0:
+                self.logger.info(">>> Extracted cases from {} files ({} bytes) in {:.2f}s: {:.1f} files/s, "
+                                 "{:.2f} MB/s".format(self.no_files, self.no_bytes, seconds, self.no_files / seconds,
+                                                      self.no_bytes / seconds / 2 ** 20))
+
+    def _extract(self):
+        files = set()
+        self._get_files_in_locations(self.locations, files)
+        # sorting makes the order of cases independent of the file system and the number of workers
+        files = sorted(files)
+        self.no_files = len(files)
+        if instrumentation_enabled():
+            self.no_bytes = sum(os.path.getsize(file_path) for file_path in files)
+
         with open(self.output_file_path, "w", newline='', encoding="utf-8") as output_file:
-            writer = csv.writer(output_file, delimiter=self.sep, quotechar=self.quotechar, quoting=csv.QUOTE_NONNUMERIC)
+            writer = self._writer(output_file)
 
             self._save_header(writer)
+            if self.duplicates_index is not None:
+                writer = _DeduplicatingWriter(writer, self)
 
-            files = set()
-            self._get_files_in_locations(self.locations, files)
-            no_files = len(files)
-            for i, file_path in enumerate(files, start=1):
-                if self.verbosity == 0:
-                    self.logger.info("Extracting file {}".format(file_path))
-                else:
-                    if i % self.verbosity == 0:
-                        self.logger.info("Extracting {} out of {} files: {}".format(i, no_files, file_path))
+            if self.workers <= 1:
+                for i, file_path in enumerate(files, start=1):
+                    self._log_progress(i, file_path)
+                    self.extract_cases_from_file(file_path, writer)
+                if self.cache is not None:
+                    self.cache.commit()
+                return
+
+            output_file.flush()
+            shards_dir = tempfile.mkdtemp(prefix="shards-", dir=os.path.dirname(os.path.abspath(self.output_file_path)))
+            try:
+                shards = [(os.path.join(shards_dir, "shard-{}.csv".format(i)), files_chunk, i * self.files_per_chunk)
+                          for i, files_chunk in enumerate(chunks_of(files, self.files_per_chunk))]
+                shard_paths = map_in_order(_extract_cases_to_shard, shards,
+                                           workers=self.workers, max_chunks_in_flight=self.max_chunks_in_flight,
+                                           initializer=_init_case_extraction_worker, initargs=(self,))
+                for shard_path in shard_paths:
+                    with open(shard_path, "r", newline='', encoding="utf-8") as shard_file:
+                        if self.duplicates_index is not None:
+                            self._copy_distinct_cases(shard_file, output_file)
+                        else:
+                            shutil.copyfileobj(shard_file, output_file)
+                    os.remove(shard_path)
+            finally:
+                shutil.rmtree(shards_dir, ignore_errors=True)
+
+    def extract_cases_to_shard(self, shard):
+        """Extracts cases from a chunk of files to a separate shard file (without header) and returns its path."""
+        shard_path, files_chunk, files_offset = shard
+        with open(shard_path, "w", newline='', encoding="utf-8") as shard_file:
+            writer = self._writer(shard_file)
+            for i, file_path in enumerate(files_chunk, start=files_offset + 1):
+                self._log_progress(i, file_path)
                 self.extract_cases_from_file(file_path, writer)
+        if self.cache is not None:
+            self.cache.commit()
+        return shard_path
+
+    def duplicate_key(self, row):
+        """
+        Returns the text identifying a case (row) when removing global duplicates or None if the case is always saved.
+        The row is either the saved row or its fields as read back from a csv file (strings).
+        """
+        return None
+
+    def is_distinct(self, row):
+        """Registers a case to be saved (if remove_global_duplicates is on); returns False if it is a duplicate."""
+        key = self.duplicate_key(row)
+        if key is not None and not self.duplicates_index.add(line_hash(key), self.no_rows):
+            self.no_duplicates += 1
+            return False
+        self.no_rows += 1
+        return True
+
+    def _copy_distinct_cases(self, shard_file, output_file):
+        """Copies the cases of a shard file that are not duplicates, keeping their text as written by the worker."""
+        record_lines = []
+
+        def lines():
+            for line in shard_file:
+                record_lines.append(line)
+                yield line
+
+        # the reader takes the lines of one record at a time, so record_lines are the lines of the current row
+        for row in csv.reader(lines(), delimiter=self.sep, quotechar=self.quotechar):
+            if self.is_distinct(row):
+                output_file.write("".join(record_lines))
+            del record_lines[:]
+
+    def _save_duplicates(self):
+        """Saves the ids of cases occurring more than once with the number of their occurrences."""
+        duplicated_rows = self.duplicates_index.duplicated_rows()
+        with open(self.output_file_path, "r", newline='', encoding="utf-8") as cases_file, \
+                open(self.duplicates_file_path, "w", newline='', encoding="utf-8") as duplicates_file:
+            reader = csv.reader(cases_file, delimiter=self.sep, quotechar=self.quotechar)
+            writer = self._writer(duplicates_file)
+            writer.writerow(DUPLICATES_HEADER)
+            next(reader)
+            rows = iter(enumerate(reader))
+            for duplicated_row, count in duplicated_rows:
+                for row_number, row in rows:
+                    if row_number == duplicated_row:
+                        writer.writerow([row[0], count])
+                        break
+        self.logger.info(">>> Saved the number of occurrences of {} duplicated cases to the file {}".format(
+            len(duplicated_rows), self.duplicates_file_path))
+
+    def _log_progress(self, i, file_path):
+        if self.verbosity == 0:
+            self.logger.info("Extracting file {}".format(file_path))
+        else:
+            if i % self.verbosity == 0:
+                self.logger.info("Extracting {} out of {} files: {}".format(i, self.no_files, file_path))
 
     def _matches_any(self, filename, include):
         for pattern in include:
@@ -62,18 +226,18 @@ class BaseCaseExtractor(abc.ABC):
 
             if os.path.isfile(path):
                 result.add(path)
-            else:
-                files = [f for f in os.listdir(path) if os.path.isfile(os.path.join(os.path.normpath(path), f))]
-                dirs = [f for f in os.listdir(path) if os.path.isdir(os.path.join(os.path.normpath(path), f))]
+                continue
 
-                for f in files:
-                    file_path = os.path.join(os.path.normpath(path), f)
-                    if self._matches_any(f, include) and not self._matches_any(f, exclude):
-                        result.add(file_path)
-
-                children_loc = [{"path": os.path.join(os.path.normpath(path), d),
-                                 "include": include, "exclude": exclude} for d in dirs]
-                self._get_files_in_locations(children_loc, result)
+            dirs_to_visit = [os.path.normpath(path)]
+            while len(dirs_to_visit) > 0:
+                dir_path = dirs_to_visit.pop()
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            if self._matches_any(entry.name, include) and not self._matches_any(entry.name, exclude):
+                                result.add(entry.path)
+                        elif entry.is_dir():
+                            dirs_to_visit.append(entry.path)
 
     def _save_header(self, writer):
         header_row = self.header()
@@ -95,48 +259,106 @@ class LinesCaseExtractor(BaseCaseExtractor):
     def header(self):
         return ["id", "line", "contents", "class_name", "class_value", "path"]
 
+    def _read_lines(self, contents):
+        """
+        Splits the contents of a file into pairs (number, line), lines keep the trailing new line
+        (universal new lines as in the text mode). If the line can't be decoded, None is yielded instead of the line.
+        """
+        contents = contents.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        try:
+            lines = contents.decode("utf-8").split("\n")
+        except UnicodeDecodeError:
+            lines = []
+            for line in contents.split(b"\n"):
+                try:
+                    lines.append(line.decode("utf-8"))
+                except UnicodeDecodeError:
+                    lines.append(None)
+        last = len(lines) - 1
+        for number, line in enumerate(lines, start=1):
+            if number - 1 == last:
+                # the text after the last new line (if any)
+                if line is None or len(line) > 0:
+                    yield number, line
+            else:
+                yield number, None if line is None else line + "\n"
+
+    def duplicate_key(self, row):
+        # the contents and the class of a line, empty lines are never removed
+        contents = row[2]
+        if len(contents.strip()) == 0:
+            return None
+        return "{}\0{}".format(row[4], contents)
+
+    def extract_lines(self, contents):
+        """Returns a list of [number, contents, class_name, class_value] for each line."""
+        completed_lines_hash = set()
+        labeled_classes = self.decision_classes.get("labeled", [])
+        default_class = self.decision_classes.get('default')
+        lines = []
+
+        for number, line in self._read_lines(contents):
+            if line is None:
+                self.logger.info("Skipping line {} because of wrong encoding".format(number))
+                continue
+            line = line if len(line) < self.max_line_length else line[:self.max_line_length]
+            if self.remove_duplicates and len(line.strip()) > 0:
+                hashValue = line_hash(line)
+                if hashValue not in completed_lines_hash:
+                    completed_lines_hash.add(hashValue)
+                else:
+                    self.logger.info("Skipping duplicated line {}: {}".format(number, line))
+                    continue
+
+            decision_class_name = None
+            decision_class_value = None
+            for c in labeled_classes:
+                if line.startswith(c['line_prefix']):
+                    decision_class_name = c['name']
+                    decision_class_value = c['value']
+                    line = line[len(c['line_prefix']):]
+                    break
+            if decision_class_name is None:
+                decision_class_name = default_class['name']
+                decision_class_value = default_class['value']
+
+            lines.append([number,
+                          line.replace("\n", "").replace('\0', ''),
+                          decision_class_name,
+                          decision_class_value])
+        return lines
+
     def extract_cases_from_file(self, file_path, writer):
         
         file_relative_path = os.path.relpath(file_path, self.baseline_dir)
-        completed_lines_hash = set()
 
-        with open(file_path, "r", encoding="utf-8") as input_file:
-            number = 0
-            while True:
-                number += 1
-                try:
-                    line = input_file.readline()
-                    if not line:
-                        break
-                    line = line if len(line) < self.max_line_length else line[:self.max_line_length]
-                    if self.remove_duplicates and len(line.strip()) > 0:
-                        hashValue = hashlib.md5(line.encode('utf-8')).hexdigest()
-                        if hashValue not in completed_lines_hash:
-                            completed_lines_hash.add(hashValue)
-                        else:
-                            self.logger.info("Skipping duplicated line {}: {}".format(number, line))
-                            continue
-
-                    decision_class_name = None
-                    decision_class_value = None
-                    for c in self.decision_classes.get("labeled", []):
-                        if line.startswith(c['line_prefix']):
-                            decision_class_name = c['name']
-                            decision_class_value = c['value']
-                            line = line[len(c['line_prefix']):]
-                            break
-                    if decision_class_name is None:
-                        default_class = self.decision_classes.get('default')
-                        decision_class_name = default_class['name']
-                        decision_class_value = default_class['value']
-
-                    row = ["{}:{}".format(file_relative_path, number),
-                           number,
-                           line.replace("\n", "").replace('\0', ''),
-                           decision_class_name,
-                           decision_class_value,
-                           file_path.replace("\n", "")]
-                    writer.writerow(row)
-
-                except Exception as e:
-                    self.logger.info("Skipping line {} because of wrong encoding".format(number))
+        with open(file_path, "rb") as input_file:
+            contents = input_file.read()
+
+        if self.cache is not None:
+            key = self.cache.key(content_hash(contents))
+            lines = self.cache.get(file_path, key)
+            if lines is None:
+                lines = self.extract_lines(contents)
+                self.cache.put(file_path, key, lines)
+        else:
+            lines = self.extract_lines(contents)
+
+        path = file_path.replace("\n", "")
+        writer.writerows([["{}:{}".format(file_relative_path, number), number, line, class_name, class_value, path]
+                          for number, line, class_name, class_value in lines])
+
+
+class _DeduplicatingWriter(object):
+    """Wraps a csv writer skipping the rows that are duplicates of already saved rows (see is_distinct)."""
+
+    def __init__(self, writer, extractor):
+        self.writer = writer
+        self.extractor = extractor
+
+    def writerow(self, row):
+        if self.extractor.is_distinct(row):
+            self.writer.writerow(row)
+
+    def writerows(self, rows):
+        self.writer.writerows([row for row in rows if self.extractor.is_distinct(row)])
@@ -0,0 +1,89 @@
+import array
+import logging
+
+module_logger = logging.getLogger('pyccflex.prepare.duplicates')
+
+DUPLICATES_HEADER = ["id", "duplicates"]
+
+_HASH_MASK = 2 ** 64 - 1
+_MAX_COUNT = 2 ** 32 - 1
+
+
+def line_hash(text):
+    """
+    Returns a 64-bit hash of a line (never 0, which marks empty slots of LineHashIndex). It is the built-in hash
+    of strings (SipHash), so it is fast but differs between processes - the hashes are compared only within a run.
+    """
+    return (hash(text) & _HASH_MASK) or 1
+
+
+class LineHashIndex(object):
+    """
+    A set of 64-bit hashes of lines with the number of occurrences of each line and the number of the row its first
+    occurrence was written to. It is an open addressing (linear probing) hash table kept in flat arrays - 16 bytes
+    per slot and the table is kept at most half full, so a million distinct lines take between 16 and 32 MB
+    regardless of the number of their duplicates. Lines are compared only by their hashes (a collision of 64-bit hashes
+    is unlikely even for billions of lines).
+    """
+
+    def __init__(self, capacity=2 ** 16):
+        self.logger = logging.getLogger('pyccflex.prepare.duplicates.LineHashIndex')
+        size = 1
+        while size < 2 * capacity:
+            size *= 2
+        self._allocate(size)
+        self.no_keys = 0
+
+    def _allocate(self, size):
+        self.mask = size - 1
+        self.keys = array.array('Q', bytes(8 * size))
+        self.counts = array.array('I', bytes(4 * size))
+        self.rows = array.array('I', bytes(4 * size))
+
+    def __len__(self):
+        return self.no_keys
+
+    def memory_size(self):
+        """Returns the number of bytes taken by the table."""
+        return sum(x.itemsize * len(x) for x in [self.keys, self.counts, self.rows])
+
+    def add(self, key, row):
+        """Adds a hash of a line written to the row; returns True if it is the first occurrence of the line."""
+        keys = self.keys
+        mask = self.mask
+        slot = key & mask
+        while True:
+            slot_key = keys[slot]
+            if slot_key == key:
+                counts = self.counts
+                if counts[slot] < _MAX_COUNT:
+                    counts[slot] += 1
+                return False
+            if slot_key == 0:
+                break
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        self.counts[slot] = 1
+        self.rows[slot] = row
+        self.no_keys += 1
+        if 2 * self.no_keys > len(keys):
+            self._grow()
+        return True
+
+    def _grow(self):
+        keys, counts, rows = self.keys, self.counts, self.rows
+        self._allocate(2 * len(keys))
+        mask = self.mask
+        for key, count, row in zip(keys, counts, rows):
+            if key == 0:
+                continue
+            slot = key & mask
+            while self.keys[slot] != 0:
+                slot = (slot + 1) & mask
+            self.keys[slot] = key
+            self.counts[slot] = count
+            self.rows[slot] = row
+
+    def duplicated_rows(self):
+        """Returns pairs (row, number of occurrences) of lines occurring more than once, ordered by rows."""
+        return sorted((row, count) for count, row in zip(self.counts, self.rows) if count > 1)
@@ -1,10 +1,25 @@
+import array
+import collections
+import itertools
 import logging
 import csv
 import re
 import sys
+import time
 
+import numpy as np
+import pandas as pd
+
+from common.cache import ContentCache, content_hash
+from common.instrumentation import instrumentation_enabled, add_rows_in, add_extractors_seconds
+from common.parallel import map_in_order, chunks_of
+from common.storage import FeaturesWriter
+from prepare.token_corpus import ngrams, ngram_strings
 from prepare.vocabularies import code_stop_words_tokenizer, token_signature
 
+# scipy is imported by the functions using it, the scripts importing the prepare package (e.g., lines2csv) don't
+# need it
+
 module_logger = logging.getLogger('pyccflex.prepare')
 
 max_int = sys.maxsize
@@ -18,13 +33,199 @@ while True:
         max_int = int(max_int/10)
 module_logger.debug(f"Setting csv field size to {max_int}")
 
+# the key of the index of a line in the lines file added to the rows read by the controllers
+LINE_INDEX_KEY = "_line_index"
+
+_worker_controller = None
+
+
+def _init_extraction_worker(controller):
+    global _worker_controller
+    _worker_controller = controller
+
+
+def _extract_chunk_in_worker(rows):
+    return _worker_controller.extract_chunk(rows), _pop_extractors_timings(_worker_controller)
+
+
+def _extract_groups_in_worker(groups):
+    return _worker_controller.extract_groups(groups), _pop_extractors_timings(_worker_controller)
+
+
+def _with_timings(controller, extracted_chunks):
+    """Merges the timings of extractors measured by workers into the controller and yields the extracted chunks."""
+    for extracted_chunk, (seconds, no_rows) in extracted_chunks:
+        controller.extractors_seconds.update(seconds)
+        controller.extractors_rows.update(no_rows)
+        yield extracted_chunk
+
+
+def _group_item(row):
+    # lines of a file are stored one after another, the path identifies the file
+    path = row.get('path', None)
+    return path if path is not None else str(row['id']).rsplit(":", 1)[0]
+
+
+def _groups_of(reader, max_line_length, cache, chunk_size):
+    """
+    Splits the lines into groups (files) and yields chunks of at least chunk_size lines (or the rest), each being
+    a list of [item, key, rows, values]; values are taken from the cache or None if they need to be extracted.
+    """
+    chunk = []
+    no_rows = 0
+    for item, rows in itertools.groupby(reader, key=_group_item):
+        rows = list(rows)
+        for row in rows:
+            row['contents'] = row['contents'] if len(row['contents']) < max_line_length \
+                else row['contents'][:max_line_length]
+        key = cache.key(content_hash("\n".join(row['contents'] for row in rows)))
+        chunk.append([item, key, rows, cache.get(item, key)])
+        no_rows += len(rows)
+        if no_rows >= chunk_size:
+            yield chunk
+            chunk = []
+            no_rows = 0
+    if len(chunk) > 0:
+        yield chunk
+
+
+def _extracted_groups(controller, reader):
+    """Yields pairs (rows, values) for groups of lines taking values from the cache of the controller if possible."""
+    chunks = _groups_of(reader, controller.max_line_length, controller.cache, controller.chunk_size)
+    extracted_chunks = map_in_order(_extract_groups_in_worker, chunks,
+                                    workers=controller.workers, max_chunks_in_flight=controller.max_chunks_in_flight,
+                                    initializer=_init_extraction_worker, initargs=(controller,))
+    for extracted_chunk in _with_timings(controller, extracted_chunks):
+        for item, key, rows, values, extracted in extracted_chunk:
+            if extracted:
+                controller.cache.put(item, key, values)
+            yield rows, values
+
+
+def _cache_config(controller, config):
+    cache_config = {"controller": type(controller).__name__,
+                    "extractors": [type(extractor).__name__ for extractor in controller.extractors],
+                    "feature_names": controller.value_names,
+                    "max_line_length": controller.max_line_length,
+                    "values_format": "sparse"}
+    cache_config.update(config if config is not None else {})
+    return cache_config
+
+
+def _zero_of(value):
+    try:
+        return type(value)(0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sparse_values(values):
+    """
+    Returns the values of features of lines (lists in the order of value_names) in a sparse form stored
+    in the cache: a pair (the zero of each column, a pair (indices, values) of the other values of each line).
+    A value is left out only if it is equal to the zero of its column and of the same type (e.g., 0 and 0.0
+    are written differently), so the values are restored exactly.
+    """
+    if len(values) == 0:
+        return [], []
+    zeros = [_zero_of(value) for value in values[0]]
+    lines = []
+    for line_values in values:
+        indices = [i for i, value in enumerate(line_values)
+                   if not (value == zeros[i] and type(value) is type(zeros[i]))]
+        lines.append((array.array('I', indices), [line_values[i] for i in indices]))
+    return zeros, lines
+
+
+def _dense_values(sparse_values):
+    """Restores the values of features of lines stored by _sparse_values."""
+    zeros, lines = sparse_values
+    values = []
+    for indices, line_values in lines:
+        dense = list(zeros)
+        for i, value in zip(indices, line_values):
+            dense[i] = value
+        values.append(dense)
+    return values
+
+
+def _numbered_rows(reader):
+    for i, row in enumerate(reader):
+        row[LINE_INDEX_KEY] = i
+        yield row
+        add_rows_in(1)
+
+
+def _timed_extraction(controller, extractor, extract, no_rows):
+    """Calls extract() measuring the time spent by the extractor (summed up by the class of the extractor)."""
+    start = time.perf_counter()
+    result = extract()
+    name = type(extractor).__name__
+    controller.extractors_seconds[name] += time.perf_counter() - start
+    controller.extractors_rows[name] += no_rows
+    return result
+
+
+def _pop_extractors_timings(controller):
+    """Returns the seconds spent and the lines processed by each class of extractors and resets them."""
+    timings = controller.extractors_seconds, controller.extractors_rows
+    controller.extractors_seconds = collections.Counter()
+    controller.extractors_rows = collections.Counter()
+    return timings
+
+
+def _report_extractors_timings(controller):
+    if not instrumentation_enabled():
+        return
+    add_extractors_seconds(controller.extractors_seconds, controller.extractors_rows)
+    for name, seconds in controller.extractors_seconds.most_common():
+        controller.logger.info(">>> Extractor {}: {:.2f}s ({} lines)".format(name, seconds,
+                                                                            controller.extractors_rows[name]))
+
+
+def _extract_batch(extractor, texts, rows):
+    """Calls extract_lines of extractors reading the lines by their indices (e.g., from a token corpus) or extract_batch."""
+    if hasattr(extractor, "extract_lines"):
+        return extractor.extract_lines(texts, [row[LINE_INDEX_KEY] for row in rows])
+    return extractor.extract_batch(texts)
+
+
+def _batch_rows(batch):
+    """Returns a lazy sequence of rows (lists of values) of the result of extract_batch."""
+    import scipy.sparse as sp
+    if sp.issparse(batch):
+        batch = batch.tocsr()
+        # rows are densified one at a time, a dense chunk of a large vocabulary may not fit in memory
+        return _SparseRows(batch)
+    return batch.to_numpy().tolist()
+
+
+class _SparseRows(object):
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __getitem__(self, i):
+        return self.matrix[i].toarray().tolist()[0]
+
+
+def _batch_matrix(batch):
+    import scipy.sparse as sp
+    return batch.tocsr() if sp.issparse(batch) else sp.csr_matrix(batch.to_numpy())
+
+
 class LineFeaturesExtractionController(object):
     """
     Reads a csv file with lines and manages features extraction for each line.
+    If workers > 1, the lines are split into chunks processed by a pool of processes and
+    the output is written in the original order of lines.
+    If the cache is used (see use_cache), the features of files which lines haven't changed are taken from the cache.
+    The output is stored in the given storage format (csv, parquet or arrow).
     """
 
     def __init__(self, extractors, input_file, output_path, sep=",", max_line_length=1000,
-                 add_decision_class=False, add_contents=False, verbosity=100000):
+                 add_decision_class=False, add_contents=False, verbosity=100000,
+                 workers=1, chunk_size=10 ** 3, max_chunks_in_flight=None, storage_format="csv"):
         self.logger = logging.getLogger('pyccflex.common.configuration.LineFeaturesExtractionController')
         self.extractors = extractors
         self.input_file = input_file
@@ -34,45 +235,251 @@ class LineFeaturesExtractionController(object):
         self.add_decision_class = add_decision_class
         self.add_contents = add_contents
         self.max_line_length = max_line_length
+        self.value_names = []
         for extractor in extractors:
-            self.feature_names.extend(extractor.feature_names)
+            self.value_names.extend(extractor.feature_names)
+        self.feature_names.extend(self.value_names)
         if add_decision_class:
             self.feature_names.append("class_name")
             self.feature_names.append("class_value")
         if add_contents:
             self.feature_names.append("contents")
         self.verbosity = verbosity
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_chunks_in_flight = max_chunks_in_flight
+        self.storage_format = storage_format
+        self.cache = None
+        self.extractors_seconds = collections.Counter()
+        self.extractors_rows = collections.Counter()
+
+    def use_cache(self, cache_file_path, scope, config=None):
+        """
+        Turns on the cache of features stored in the cache_file_path. The config shall describe everything
+        the features depend on apart from the extractors and lines (e.g., configuration of extractors, vocabulary).
+        """
+        self.cache = ContentCache(cache_file_path, scope, _cache_config(self, config))
+
+    def _truncate(self, text):
+        return text if len(text) < self.max_line_length else text[:self.max_line_length]
+
+    def extract_row(self, row):
+        features = {"id": row['id']}
+        row['contents'] = self._truncate(row['contents'])
+        if self.add_contents:
+            features["contents"] = row['contents']
+        for extractor in self.extractors:
+            extracted_features = extractor.extract(row['contents'])
+            features.update(extracted_features)
+        if self.add_decision_class:
+            features["class_name"] = row['class_name']
+            features["class_value"] = row['class_value']
+        return features
+
+    def extract_chunk(self, rows):
+        """
+        Extracts features for a chunk of rows. Extractors providing extract_batch compute the features
+        for the whole chunk at once (columnar), the remaining ones are called for each of the lines.
+        """
+        for row in rows:
+            row['contents'] = self._truncate(row['contents'])
+        texts = pd.Series([row['contents'] for row in rows], dtype=object)
+        # values are extracted by one extractor at a time, so the time spent by each of them can be measured
+        batch_values = {}
+        line_values = {}
+        for extractor in self.extractors:
+            if hasattr(extractor, "extract_batch"):
+                batch_values[id(extractor)] = _timed_extraction(
+                    self, extractor, lambda: _batch_rows(_extract_batch(extractor, texts, rows)), len(rows))
+            else:
+                line_values[id(extractor)] = _timed_extraction(
+                    self, extractor, lambda: [extractor.extract(row['contents']) for row in rows], len(rows))
+
+        result = []
+        for i, row in enumerate(rows):
+            features = {"id": row['id']}
+            if self.add_contents:
+                features["contents"] = row['contents']
+            for extractor in self.extractors:
+                if id(extractor) in batch_values:
+                    features.update(zip(extractor.feature_names, batch_values[id(extractor)][i]))
+                else:
+                    features.update(line_values[id(extractor)][i])
+            if self.add_decision_class:
+                features["class_name"] = row['class_name']
+                features["class_value"] = row['class_value']
+            result.append(features)
+        return result
+
+    def extract_groups(self, groups):
+        """
+        Extracts values of features (lists in the order of value_names, see _sparse_values) for groups that weren't
+        in the cache.
+        """
+        result = []
+        for item, key, rows, values in groups:
+            extracted = values is None
+            if extracted:
+                # the values are cached in a sparse form, most of them are zeros (e.g., bag of words)
+                values = _sparse_values([[features[name] for name in self.value_names]
+                                         for features in self.extract_chunk(rows)])
+            result.append((item, key, rows, values, extracted))
+        return result
+
+    def _extracted_rows_with_cache(self, reader):
+        for rows, values in _extracted_groups(self, reader):
+            for row, row_values in zip(rows, _dense_values(values)):
+                features = {"id": row['id']}
+                if self.add_contents:
+                    features["contents"] = row['contents']
+                features.update(zip(self.value_names, row_values))
+                if self.add_decision_class:
+                    features["class_name"] = row['class_name']
+                    features["class_value"] = row['class_value']
+                yield features
+
+    def _extracted_rows(self, reader):
+        if self.cache is not None:
+            for features in self._extracted_rows_with_cache(reader):
+                yield features
+            return
+        extracted_chunks = map_in_order(_extract_chunk_in_worker, chunks_of(reader, self.chunk_size),
+                                        workers=self.workers, max_chunks_in_flight=self.max_chunks_in_flight,
+                                        initializer=_init_extraction_worker, initargs=(self,))
+        for extracted_chunk in _with_timings(self, extracted_chunks):
+            for features in extracted_chunk:
+                yield features
 
     def extract(self):
         with open(self.input_file, 'rt', encoding="utf-8", errors="ignore") as in_file:
-            reader = csv.DictReader(in_file, delimiter=self.sep, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
-            with open(self.output_file, 'w', newline='', encoding="utf-8") as out_file:
-                writer = csv.DictWriter(out_file, fieldnames=self.feature_names,
-                                        delimiter=self.sep, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
-                writer.writeheader()
-                for i, row in enumerate(reader, start=1):
+            reader = _numbered_rows(csv.DictReader(in_file, delimiter=self.sep, quotechar='"',
+                                                   quoting=csv.QUOTE_NONNUMERIC))
+            with FeaturesWriter(self.output_file, sep=self.sep, storage_format=self.storage_format) as writer:
+                rows = []
+                for i, features in enumerate(self._extracted_rows(reader), start=1):
                     if self.verbosity == 0 or i % self.verbosity == 0:
-                        self.logger.info("Extracting features from {}".format(row['id']))
-                    features = {"id": row['id']}
-                    row['contents'] = row['contents'] if len(row['contents']) < self.max_line_length else row['contents'][:self.max_line_length]
-                    if self.add_contents:
-                        features["contents"] = row['contents']
-                    for extractor in self.extractors:
-                        #try:
-                        #    extracted_features = func_timeout(60, extractor.extract, args=(row['contents']))
-                        #except FunctionTimedOut:
-                        #    self.logger.debug( f"Extracting features from for and {row['contents']} exceeded 60s.")
-                        #    extracted_features = extractor.extract("")
-                        #except Exception as e:
-                            # Handle any exceptions that doit might raise here
-                        #    pass
-                        extracted_features = extractor.extract(row['contents'])
-                        features.update(extracted_features)
-                    if self.add_decision_class:
-                        features["class_name"] = row['class_name']
-                        features["class_value"] = row['class_value']
-                    writer.writerow(features)
+                        self.logger.info("Extracting features from {}".format(features['id']))
+                    rows.append([features[name] for name in self.feature_names])
+                    if len(rows) >= self.chunk_size:
+                        writer.write_rows(self.feature_names, rows)
+                        rows = []
+                if len(rows) > 0 or writer.no_chunks == 0:
+                    writer.write_rows(self.feature_names, rows)
+        if self.cache is not None:
+            self.cache.finish()
+        _report_extractors_timings(self)
+
+
+class SparseLineFeaturesExtractionController(object):
+    """
+    Reads a csv file with lines in chunks and extracts features for the whole chunk at once using
+    the extract_batch method of extractors. The features are stored in a sparse (.npz) features file.
+    If workers > 1, the chunks are processed by a pool of processes.
+    If the cache is used (see use_cache), the features of files which lines haven't changed are taken from the cache.
+    """
 
+    def __init__(self, extractors, input_file, output_path, sep=",", max_line_length=1000,
+                 add_decision_class=False, add_contents=False, chunk_size=10 ** 3,
+                 workers=1, max_chunks_in_flight=None):
+        self.logger = logging.getLogger('pyccflex.common.configuration.SparseLineFeaturesExtractionController')
+        self.extractors = extractors
+        self.input_file = input_file
+        self.output_file = output_path
+        self.sep = sep
+        self.max_line_length = max_line_length
+        self.add_decision_class = add_decision_class
+        self.add_contents = add_contents
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_chunks_in_flight = max_chunks_in_flight
+        self.feature_names = []
+        for extractor in extractors:
+            self.feature_names.extend(extractor.feature_names)
+        self.value_names = self.feature_names
+        self.meta_columns = ["id"]
+        if add_decision_class:
+            self.meta_columns.append("class_name")
+            self.meta_columns.append("class_value")
+        if add_contents:
+            self.meta_columns.append("contents")
+        self.cache = None
+        self.extractors_seconds = collections.Counter()
+        self.extractors_rows = collections.Counter()
+
+    def use_cache(self, cache_file_path, scope, config=None):
+        """Turns on the cache of features stored in the cache_file_path (see LineFeaturesExtractionController)."""
+        self.cache = ContentCache(cache_file_path, scope, _cache_config(self, config))
+
+    def extract_chunk(self, rows):
+        import scipy.sparse as sp
+        texts = [row['contents'] if len(row['contents']) < self.max_line_length
+                 else row['contents'][:self.max_line_length] for row in rows]
+        texts = pd.Series(texts, dtype=object)
+        matrices = [_timed_extraction(self, extractor, lambda: _batch_matrix(_extract_batch(extractor, texts, rows)),
+                                      len(rows)) for extractor in self.extractors]
+        matrix = matrices[0] if len(matrices) == 1 else sp.hstack(matrices, format='csr')
+
+        return matrix, self._meta_rows(rows, texts)
+
+    def _meta_rows(self, rows, texts):
+        meta_rows = []
+        for row, text in zip(rows, texts):
+            meta_row = [row['id']]
+            if self.add_decision_class:
+                meta_row.append(row['class_name'])
+                meta_row.append(row['class_value'])
+            if self.add_contents:
+                meta_row.append(text)
+            meta_rows.append(meta_row)
+        return meta_rows
+
+    def extract_groups(self, groups):
+        """Extracts sparse matrices of features for groups that weren't in the cache."""
+        result = []
+        for item, key, rows, values in groups:
+            extracted = values is None
+            if extracted:
+                values = self.extract_chunk(rows)[0]
+            result.append((item, key, rows, values, extracted))
+        return result
+
+    def _extracted_chunks(self, reader):
+        if self.cache is None:
+            return _with_timings(self, map_in_order(_extract_chunk_in_worker, chunks_of(reader, self.chunk_size),
+                                                    workers=self.workers,
+                                                    max_chunks_in_flight=self.max_chunks_in_flight,
+                                                    initializer=_init_extraction_worker, initargs=(self,)))
+        return self._extracted_chunks_with_cache(reader)
+
+    def _extracted_chunks_with_cache(self, reader):
+        import scipy.sparse as sp
+        matrices = []
+        meta_rows = []
+        for rows, matrix in _extracted_groups(self, reader):
+            matrices.append(matrix)
+            meta_rows.extend(self._meta_rows(rows, [row['contents'] for row in rows]))
+            if len(meta_rows) >= self.chunk_size:
+                yield sp.vstack(matrices, format='csr'), meta_rows
+                matrices = []
+                meta_rows = []
+        if len(meta_rows) > 0:
+            yield sp.vstack(matrices, format='csr'), meta_rows
+
+    def extract(self):
+        with open(self.input_file, 'rt', encoding="utf-8", errors="ignore") as in_file:
+            reader = _numbered_rows(csv.DictReader(in_file, delimiter=self.sep, quotechar='"',
+                                                   quoting=csv.QUOTE_NONNUMERIC))
+            from common.sparse_features import SparseFeaturesWriter
+            with SparseFeaturesWriter(self.output_file, self.feature_names, self.meta_columns,
+                                      sep=self.sep) as writer:
+                no_lines = 0
+                for matrix, meta_rows in self._extracted_chunks(reader):
+                    no_lines += len(meta_rows)
+                    self.logger.info("Extracted features from {} lines ({} in total)".format(len(meta_rows), no_lines))
+                    writer.write(matrix, meta_rows)
+        if self.cache is not None:
+            self.cache.finish()
+        _report_extractors_timings(self)
 
 
 class SubstringCountingFeatureExtraction(object):
@@ -101,9 +508,9 @@ class WholeWordCountingFeatureExtraction(object):
 
     def __init__(self, features_desc, max_line_length=150):
         self.logger = logging.getLogger('pyccflex.common.configuration.WholeWordCountingFeatureExtraction')
-        self.feature_desc = features_desc
+        self.feature_desc = [dict(f) for f in features_desc]
         self.max_line_length = max_line_length
-        for feature in features_desc:
+        for feature in self.feature_desc:
             feature['re'] = []
             for feature_string in feature['string']:
                 feature['re'].append(re.compile("(?<!\\w)" + feature_string + "(?!\\w)"))
@@ -127,9 +534,9 @@ class TokenizedWholeWordCountingFeatureExtraction(object):
 
     def __init__(self, features_desc, max_line_length=300):
         self.logger = logging.getLogger('pyccflex.common.configuration.WholeWordCountingFeatureExtraction')
-        self.feature_desc = features_desc
+        self.feature_desc = [dict(f) for f in features_desc]
         self.max_line_length = max_line_length
-        for feature in features_desc:
+        for feature in self.feature_desc:
             feature['re'] = []
             for feature_string in feature['string']:
                 feature['re'].append(re.compile("^"+feature_string+"$"))
@@ -155,9 +562,9 @@ class RegexpCountingFeatureExtraction(object):
 
     def __init__(self, features_desc, max_line_length=150):
         self.logger = logging.getLogger('pyccflex.common.configuration.RegexpCountingFeatureExtraction')
-        self.feature_desc = features_desc
+        self.feature_desc = [dict(f) for f in features_desc]
         self.max_line_length = max_line_length
-        for feature in features_desc:
+        for feature in self.feature_desc:
             feature['re'] = []
             for feature_string in feature['string']:
                 feature['re'].append(re.compile(feature_string))
@@ -173,6 +580,138 @@ class RegexpCountingFeatureExtraction(object):
                 features[feature['name']] += len(feature_re.findall(text))
         return features
 
+WORD_RE = re.compile("\\w+")
+
+
+def _is_literal_pattern(pattern):
+    return re.escape(pattern) == pattern
+
+
+class CompiledPatternFeatureExtraction(object):
+    """
+    Counts all the substring, whole-word, tokenized whole-word and regexp features (see manual_features.json)
+    in a single pass over a line instead of scanning the line once per feature string. The counts are the same
+    as returned by SubstringCountingFeatureExtraction, WholeWordCountingFeatureExtraction,
+    TokenizedWholeWordCountingFeatureExtraction and RegexpCountingFeatureExtraction.
+
+    Single-character substrings are counted with one character histogram, literal words are looked up in a
+    word -> feature index built from the words / tokens of the line. Multi-character substrings, non-literal
+    word patterns and regexps are counted per distinct pattern (a combined alternation would miss overlapping
+    matches of different patterns).
+    """
+
+    def __init__(self, string_features_desc=(), whole_word_features_desc=(), tokenized_whole_word_features_desc=(),
+                 regexp_features_desc=(), whole_word_max_line_length=150, tokenized_max_line_length=300,
+                 regexp_max_line_length=150, max_token_length=50):
+        self.logger = logging.getLogger('pyccflex.common.configuration.CompiledPatternFeatureExtraction')
+        self.whole_word_max_line_length = whole_word_max_line_length
+        self.tokenized_max_line_length = tokenized_max_line_length
+        self.regexp_max_line_length = regexp_max_line_length
+        self.max_token_length = max_token_length
+
+        self.slots = {}
+        self.chars = {}
+        self.substrings = []
+        self.words = {}
+        self.word_res = []
+        self.tokens = {}
+        self.token_res = []
+        self.regexps = []
+        self.features = []
+
+        for feature in string_features_desc:
+            self._add_feature(feature, "string")
+        for feature in whole_word_features_desc:
+            self._add_feature(feature, "word")
+        for feature in tokenized_whole_word_features_desc:
+            self._add_feature(feature, "token")
+        for feature in regexp_features_desc:
+            self._add_feature(feature, "regexp")
+
+        self.feature_names = [name for name, _ in self.features]
+
+    def _slot(self, kind, feature_string):
+        key = (kind, feature_string)
+        if key in self.slots:
+            return self.slots[key]
+        slot = len(self.slots)
+        self.slots[key] = slot
+
+        if kind == "string":
+            if len(feature_string) == 1:
+                self.chars[feature_string] = slot
+            else:
+                self.substrings.append((feature_string, slot))
+        elif kind == "word":
+            if _is_literal_pattern(feature_string) and WORD_RE.fullmatch(feature_string):
+                self.words[feature_string] = slot
+            else:
+                self.word_res.append((re.compile("(?<!\\w)" + feature_string + "(?!\\w)"), slot))
+        elif kind == "token":
+            if _is_literal_pattern(feature_string):
+                # tokens are truncated, so they never match a literal longer than max_token_length
+                if len(feature_string) <= self.max_token_length:
+                    self.tokens[feature_string] = slot
+            else:
+                self.token_res.append((re.compile("^" + feature_string + "$"), slot))
+        elif kind == "regexp":
+            self.regexps.append((re.compile(feature_string), slot))
+        return slot
+
+    def _add_feature(self, feature, kind):
+        slots = tuple(self._slot(kind, feature_string) for feature_string in feature['string'])
+        self.features.append((feature['name'], slots))
+
+    def count(self, text):
+        """Returns a list of counts for all distinct patterns (slots)."""
+        values = [0] * len(self.slots)
+
+        if self.chars:
+            histogram = collections.Counter(text)
+            for char, slot in self.chars.items():
+                values[slot] = histogram[char]
+        for substring, slot in self.substrings:
+            values[slot] = text.count(substring)
+
+        if self.words or self.word_res:
+            short_text = text[:self.whole_word_max_line_length]
+            if self.words:
+                for word in WORD_RE.findall(short_text):
+                    slot = self.words.get(word)
+                    if slot is not None:
+                        values[slot] += 1
+            for word_re, slot in self.word_res:
+                values[slot] = len(word_re.findall(short_text))
+
+        if self.tokens or self.token_res:
+            tokens = [token[:self.max_token_length]
+                      for token in code_stop_words_tokenizer(text[:self.tokenized_max_line_length])]
+            if self.tokens:
+                for token in tokens:
+                    slot = self.tokens.get(token)
+                    if slot is not None:
+                        values[slot] += 1
+            for token_re, slot in self.token_res:
+                values[slot] = sum(1 for token in tokens if token_re.match(token) is not None)
+
+        if self.regexps:
+            short_text = text[:self.regexp_max_line_length]
+            for regexp, slot in self.regexps:
+                values[slot] = len(regexp.findall(short_text))
+
+        return values
+
+    def extract(self, text):
+        values = self.count(text)
+        features = {}
+        for name, slots in self.features:
+            if len(slots) == 1:
+                features[name] = values[slots[0]]
+            else:
+                features[name] = sum(values[slot] for slot in slots)
+        return features
+
+
 class CommentFeatureExtraction(object):
     """
        Extracts number of comments in the text
@@ -186,6 +725,11 @@ class CommentFeatureExtraction(object):
         feature = text.count("//") + text.count("/*") + text.count("*/")
         return {'comment': feature}
 
+    def extract_batch(self, texts):
+        # Series.str.count goes through the regex engine, plain str.count is faster for literals
+        return pd.DataFrame({'comment': texts.map(lambda text: text.count("//") + text.count("/*") +
+                                                               text.count("*/")).astype(int)})
+
 class WholeLineCommentFeatureExtraction(object):
     """
        Extracts number of comments in the text
@@ -194,12 +738,15 @@ class WholeLineCommentFeatureExtraction(object):
     def __init__(self):
         self.logger = logging.getLogger('pyccflex.common.configuration.CommentFeatureExtraction')
         self.feature_names = ['whole_line_comment']
+        self.pattern = re.compile("^(?:\\s)*//.*$")
 
     def extract(self, text):
-        pattern = re.compile("^(\\s)*//.*$")
-        feature = 0 if pattern.search(text) is None else 1
+        feature = 0 if self.pattern.search(text) is None else 1
         return {'whole_line_comment': feature}
 
+    def extract_batch(self, texts):
+        return pd.DataFrame({'whole_line_comment': texts.str.contains(self.pattern.pattern, regex=True).astype(int)})
+
 class PythonWholeLineCommentFeatureExtraction(object):
     """
        Extracts number of comments in the text
@@ -208,12 +755,15 @@ class PythonWholeLineCommentFeatureExtraction(object):
     def __init__(self):
         self.logger = logging.getLogger('pyccflex.common.configuration.PythonCommentFeatureExtraction')
         self.feature_names = ['whole_line_comment']
+        self.pattern = re.compile("^(?:\\s)*#.*$")
 
     def extract(self, text):
-        pattern = re.compile("^(\\s)*#.*$")
-        feature = 0 if pattern.search(text) is None else 1
+        feature = 0 if self.pattern.search(text) is None else 1
         return {'whole_line_comment': feature}
 
+    def extract_batch(self, texts):
+        return pd.DataFrame({'whole_line_comment': texts.str.contains(self.pattern.pattern, regex=True).astype(int)})
+
 		
 class BlankLineFeatureExtraction(object):
     """
@@ -223,12 +773,15 @@ class BlankLineFeatureExtraction(object):
     def __init__(self):
         self.logger = logging.getLogger('pyccflex.common.configuration.BlankLineFeatureExtraction')
         self.feature_names = ['blank_line']
+        self.pattern = re.compile("^(?:\\s)*$")
 
     def extract(self, text):
-        pattern = re.compile("^(\\s)*$")
-        feature = 0 if pattern.search(text) is None else 1
+        feature = 0 if self.pattern.search(text) is None else 1
         return {'blank_line': feature}
 
+    def extract_batch(self, texts):
+        return pd.DataFrame({'blank_line': texts.str.match(self.pattern.pattern).astype(int)})
+
 class WordCountFeatureExtraction(object):
     """
        Extracts number of words in the text
@@ -241,6 +794,9 @@ class WordCountFeatureExtraction(object):
     def extract(self, text):
         return {'no_words': len(text.split())}
 
+    def extract_batch(self, texts):
+        return pd.DataFrame({'no_words': texts.map(lambda text: len(text.split())).astype(int)})
+
 
 class CharCountFeatureExtraction(object):
     """
@@ -254,6 +810,9 @@ class CharCountFeatureExtraction(object):
     def extract(self, text):
         return {'no_chars': len(text)}
 
+    def extract_batch(self, texts):
+        return pd.DataFrame({'no_chars': texts.str.len().astype(int)})
+
 
 class CountVectorizerBasedFeatureExtraction(object):
     """
@@ -270,3 +829,125 @@ class CountVectorizerBasedFeatureExtraction(object):
     def extract(self, text):
         features = self.count_vect.transform([text]).todense().tolist()[0]
         return dict(zip(self.feature_names, features))
+
+    def extract_batch(self, texts):
+        """Transforms a series of texts at once and returns a sparse (CSR) matrix."""
+        return self.count_vect.transform(texts)
+
+
+class TokenCorpusBasedFeatureExtraction(CountVectorizerBasedFeatureExtraction):
+    """
+    Extracts the same features as CountVectorizerBasedFeatureExtraction, but the n-grams of lines are built
+    from the ids of tokens stored in a token corpus (see prepare.token_corpus) instead of tokenizing the lines.
+    The mapping (TokenMapping) maps tokens of the corpus to the tokens used by the tokenizer of the count_vect.
+    Lines truncated by the controller (max_line_length) are tokenized using the count_vect.
+    """
+
+    def __init__(self, count_vect, separator, to_replace, corpus, mapping, max_line_length):
+        super(TokenCorpusBasedFeatureExtraction, self).__init__(count_vect, separator, to_replace)
+        self.logger = logging.getLogger('pyccflex.common.configuration.TokenCorpusBasedFeatureExtraction')
+        self.corpus = corpus
+        self.mapping = mapping
+        self.max_line_length = max_line_length
+
+    def extract_lines(self, texts, positions):
+        """Returns a sparse (CSR) matrix of counts of n-grams for the lines at the given positions in the lines file."""
+        import scipy.sparse as sp
+        min_ngrams, max_ngrams = self.count_vect.ngram_range
+        truncated = np.array([len(text) >= self.max_line_length for text in texts], dtype=bool)
+        ids, lengths = self.mapping.map(*self.corpus.lines(positions))
+        rows = []
+        columns = []
+        for n in range(min_ngrams, max_ngrams + 1):
+            grams, lines = ngrams(ids, lengths, n)
+            strings, inverse = ngram_strings(grams, self.mapping.tokens)
+            gram_columns = np.array([self.count_vect.vocabulary_.get(x, -1) for x in strings], dtype=np.int64)[inverse]
+            found = (gram_columns >= 0) & ~truncated[lines]
+            rows.append(lines[found])
+            columns.append(gram_columns[found])
+        rows = np.concatenate(rows)
+        matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, np.concatenate(columns))),
+                               shape=(len(texts), len(self.feature_names)))
+        if truncated.any():
+            truncated_rows = np.flatnonzero(truncated)
+            selector = sp.csr_matrix((np.ones(len(truncated_rows), dtype=np.int64),
+                                      (truncated_rows, np.arange(len(truncated_rows)))),
+                                     shape=(len(texts), len(truncated_rows)))
+            matrix = matrix + selector @ self.count_vect.transform(list(texts.iloc[truncated_rows]))
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        return matrix
+
+
+# the names of manual features extractors (see predefined_manual_features) counting the patterns
+# defined in the manual features configuration
+PATTERN_EXTRACTORS_NAMES = ["PatternSubstringExctractor", "PatternWordExtractor", "PatternWordTokenizedExtractor",
+                            "RegexpCountingFeatureExtraction"]
+
+
+def manual_features_extractors(extractors_to_use, manual_features_config, legacy_pattern_extractors=False):
+    """
+    Returns the manual features extractors of the given names (see predefined_manual_features) configured with
+    the patterns of the manual features configuration. The pattern extractors are combined into a single
+    CompiledPatternFeatureExtraction unless legacy_pattern_extractors is True.
+    """
+    manual_string_counting_features = manual_features_config.get('manual_string_counting_features', [])
+    manual_whole_word_counting_features = manual_features_config.get('manual_whole_word_counting_features', [])
+    regexp_counting_features = manual_features_config.get('regexp_counting_features', [])
+
+    extractors = []
+    if legacy_pattern_extractors:
+        if "PatternSubstringExctractor" in extractors_to_use:
+            extractors.append(SubstringCountingFeatureExtraction(manual_string_counting_features))
+            module_logger.info(">>> Using {}".format("PatternSubstringExctractor"))
+
+        if "PatternWordExtractor" in extractors_to_use:
+            extractors.append(WholeWordCountingFeatureExtraction(manual_whole_word_counting_features))
+            module_logger.info(">>> Using {}".format("PatternWordExtractor"))
+
+        if "PatternWordTokenizedExtractor" in extractors_to_use:
+            extractors.append(TokenizedWholeWordCountingFeatureExtraction(manual_whole_word_counting_features))
+            module_logger.info(">>> Using {}".format("PatternWordTokenizedExtractor"))
+
+        if "RegexpCountingFeatureExtraction" in extractors_to_use:
+            extractors.append(RegexpCountingFeatureExtraction(regexp_counting_features))
+            module_logger.info(">>> Using {}".format("RegexpCountingFeatureExtraction"))
+    else:
+        pattern_extractors = [x for x in PATTERN_EXTRACTORS_NAMES if x in extractors_to_use]
+        if len(pattern_extractors) > 0:
+            extractors.append(CompiledPatternFeatureExtraction(
+                string_features_desc=manual_string_counting_features
+                if "PatternSubstringExctractor" in extractors_to_use else [],
+                whole_word_features_desc=manual_whole_word_counting_features
+                if "PatternWordExtractor" in extractors_to_use else [],
+                tokenized_whole_word_features_desc=manual_whole_word_counting_features
+                if "PatternWordTokenizedExtractor" in extractors_to_use else [],
+                regexp_features_desc=regexp_counting_features
+                if "RegexpCountingFeatureExtraction" in extractors_to_use else []))
+            module_logger.info(">>> Using {} (compiled)".format(", ".join(pattern_extractors)))
+
+    if "CommentStringExtractor" in extractors_to_use:
+        extractors.append(CommentFeatureExtraction())
+        module_logger.info(">>> Using {}".format("CommentStringExtractor"))
+
+    if "WholeLineCommentFeatureExtraction" in extractors_to_use:
+        extractors.append(WholeLineCommentFeatureExtraction())
+        module_logger.info(">>> Using {}".format("WholeLineCommentFeatureExtraction"))
+
+    if "PythonWholeLineCommentFeatureExtraction" in extractors_to_use:
+        extractors.append(PythonWholeLineCommentFeatureExtraction())
+        module_logger.info(">>> Using {}".format("PythonWholeLineCommentFeatureExtraction"))
+
+    if "NoWordsExtractor" in extractors_to_use:
+        extractors.append(WordCountFeatureExtraction())
+        module_logger.info(">>> Using {}".format("NoWordsExtractor"))
+
+    if "NoCharsExtractor" in extractors_to_use:
+        extractors.append(CharCountFeatureExtraction())
+        module_logger.info(">>> Using {}".format("NoCharsExtractor"))
+
+    if "BlankLineFeatureExtraction" in extractors_to_use:
+        extractors.append(BlankLineFeatureExtraction())
+        module_logger.info(">>> Using {}".format("BlankLineFeatureExtraction"))
+
+    return extractors
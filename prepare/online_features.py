@@ -0,0 +1,163 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from prepare.block_features import BlockFeatureTracker
+from prepare.feature_extractors import _batch_matrix
+
+module_logger = logging.getLogger('pyccflex.prepare.online_features')
+
+CONTEXT_COLUMN_RE = re.compile(r"^(.*)_(prev|next)([0-9]+)$")
+
+
+def mangle_duplicated_names(names):
+    """Renames duplicated names the same way as pandas does when reading a csv file (name, name.1, name.2, ...)."""
+    result = []
+    counts = {}
+    for name in names:
+        if name in counts:
+            counts[name] += 1
+            result.append("{}.{}".format(name, counts[name]))
+        else:
+            counts[name] = 0
+            result.append(name)
+    return result
+
+
+def referenced_features(block_feature):
+    """Returns the names of features a block feature is computed from."""
+    return block_feature['feature_start'] + block_feature['feature_end'] + block_feature.get('forbidding_features', [])
+
+
+class OnlineFeaturesBuilder(object):
+    """
+    Computes features of lines in memory, the same way as they are computed by the scripts preparing features files:
+    the features of extractors (bag_of_words, predefined_manual_features) merged in the order of extractors
+    (merge_inputs), block features (extract_block_features_from_features) and the features of preceding and
+    proceeding lines of the same file (add_seq_context). Only the columns asked for (e.g., used by a model) are built.
+
+    Block features are described by dictionaries with the keys: name, feature_start, feature_end and
+    (optionally) forbidding_features, the same as the arguments of extract_block_features_from_features.
+    They are computed in the order they are given, so a block feature can refer to the block features before it
+    (e.g., code blocks can't be inside of comment blocks), like when the scripts are run one after another.
+    """
+
+    def __init__(self, extractors, block_features=(), prev_cases=0, next_cases=0, max_line_length=1000):
+        self.logger = logging.getLogger('pyccflex.prepare.online_features.OnlineFeaturesBuilder')
+        self.extractors = extractors
+        self.block_features = [dict(x) for x in block_features]
+        self.prev_cases = prev_cases
+        self.next_cases = next_cases
+        self.max_line_length = max_line_length
+
+        names = []
+        for extractor in extractors:
+            names.extend(extractor.feature_names)
+        self.extractors_feature_names = mangle_duplicated_names(names)
+        self.feature_names = self.extractors_feature_names + [x['name'] for x in self.block_features]
+        self.feature_index = dict((name, i) for i, name in enumerate(self.feature_names))
+        for i, block_feature in enumerate(self.block_features):
+            # the features known before the block feature: of extractors and the preceding block features
+            known = len(self.extractors_feature_names) + i
+            unknown = [x for x in referenced_features(block_feature)
+                       if x not in self.feature_index or self.feature_index[x] >= known]
+            if len(unknown) > 0:
+                raise Exception("The block feature {} refers to unknown features or block features defined after "
+                                "it: {}".format(block_feature['name'], ", ".join(unknown)))
+
+    def source_of(self, column):
+        """
+        Returns a pair (index of a feature, shift of lines) the column is computed from or None for an unknown column.
+        The columns with context are named <feature>_prev<i> and <feature>_next<i> (see add_seq_context).
+        """
+        match = CONTEXT_COLUMN_RE.match(column)
+        if match is not None and match.group(1) in self.feature_index:
+            shift = int(match.group(3))
+            limit = self.prev_cases if match.group(2) == "prev" else self.next_cases
+            if 1 <= shift <= limit:
+                return self.feature_index[match.group(1)], -shift if match.group(2) == "prev" else shift
+        if column in self.feature_index:
+            return self.feature_index[column], 0
+        return None
+
+    def missing_columns(self, columns):
+        return [x for x in columns if self.source_of(x) is None]
+
+    def _truncate(self, text):
+        return text if len(text) < self.max_line_length else text[:self.max_line_length]
+
+    def _extractors_matrix(self, texts, needed):
+        """Returns a CSR matrix of features of extractors (only the columns of extractors having needed features)."""
+        needed_mask = np.zeros(len(self.feature_names), dtype=bool)
+        needed_mask[list(needed)] = True
+        blocks = []
+        offset = 0
+        for extractor in self.extractors:
+            no_features = len(extractor.feature_names)
+            if needed_mask[offset:offset + no_features].any():
+                if hasattr(extractor, "extract_batch"):
+                    blocks.append(_batch_matrix(extractor.extract_batch(texts)))
+                else:
+                    rows = [extractor.extract(text) for text in texts]
+                    blocks.append(sp.csr_matrix(np.array([[row[name] for name in extractor.feature_names]
+                                                          for row in rows], dtype=np.float64)
+                                                .reshape(len(texts), no_features)))
+            else:
+                blocks.append(sp.csr_matrix((len(texts), no_features), dtype=np.float64))
+            offset += no_features
+        if len(blocks) == 0:
+            return sp.csr_matrix((len(texts), 0), dtype=np.float64)
+        return sp.hstack(blocks, format='csr')
+
+    def _any_positive(self, matrix, names):
+        if len(names) == 0:
+            return np.zeros(matrix.shape[0], dtype=bool)
+        columns = [self.feature_index[x] for x in names]
+        return np.asarray(matrix[:, columns].sum(axis=1)).ravel() > 0
+
+    def features(self, texts, file_names, columns):
+        """
+        Returns a DataFrame of the given columns for the lines (texts) of files (file_names, the same length);
+        the context of a line is limited to the lines of the same file.
+        """
+        texts = pd.Series([self._truncate(text) for text in texts], dtype=object)
+        file_names = np.asarray(file_names)
+        no_lines = len(texts)
+        sources = [self.source_of(x) for x in columns]
+        unknown = [x for x, source in zip(columns, sources) if source is None]
+        if len(unknown) > 0:
+            raise Exception("Unknown features: {}".format(", ".join(unknown[:5])))
+
+        needed = set(index for index, shift in sources)
+        # block features refer only to the features before them, so the needed ones are found in one pass backwards
+        for block_feature in reversed(self.block_features):
+            if self.feature_index[block_feature['name']] in needed:
+                needed.update(self.feature_index[x] for x in referenced_features(block_feature))
+        matrix = self._extractors_matrix(texts, needed)
+
+        # the column of each block feature is added before the next block features (which may refer to it)
+        for block_feature in self.block_features:
+            if self.feature_index[block_feature['name']] in needed:
+                values = BlockFeatureTracker().values(
+                    file_names, self._any_positive(matrix, block_feature['feature_start']),
+                    self._any_positive(matrix, block_feature['feature_end']),
+                    self._any_positive(matrix, block_feature.get('forbidding_features', [])))
+            else:
+                values = np.zeros(no_lines, dtype=np.int64)
+            matrix = sp.hstack([matrix, sp.csr_matrix(values.astype(np.float64).reshape(no_lines, 1))],
+                               format='csr')
+
+        result = np.zeros((no_lines, len(columns)))
+        rows = np.arange(no_lines)
+        for shift in sorted(set(shift for index, shift in sources)):
+            positions = [i for i, (index, column_shift) in enumerate(sources) if column_shift == shift]
+            values = matrix[:, [sources[i][0] for i in positions]].toarray()
+            neighbours = rows + shift
+            inside = (neighbours >= 0) & (neighbours < no_lines)
+            neighbours = np.where(inside, neighbours, rows)
+            same_file = inside & (file_names[neighbours] == file_names)
+            result[:, positions] = np.where(same_file[:, None], values[neighbours], 0)
+        return pd.DataFrame(result, columns=columns)
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+from common.cache import file_hash
+from common.parallel import map_in_order
+from prepare.vocabularies import code_stop_words_tokenizer, token_signature
+
+module_logger = logging.getLogger('pyccflex.prepare.token_corpus')
+
+TOKEN_IDS_SUFFIX = "-token-ids.npy"
+LINE_OFFSETS_SUFFIX = "-line-offsets.npy"
+FILE_IDS_SUFFIX = "-file-ids.npy"
+DICTIONARY_SUFFIX = "-tokens.json"
+
+
+def token_corpus_name(lines_file_path):
+    """Returns the prefix of names of the token corpus files built for a lines file (e.g., train-lines)."""
+    name = os.path.basename(lines_file_path)
+    return name[:-len(".csv")] if name.endswith(".csv") else name
+
+
+def token_corpus_file_paths(prefix):
+    return [prefix + suffix for suffix in (TOKEN_IDS_SUFFIX, LINE_OFFSETS_SUFFIX, FILE_IDS_SUFFIX, DICTIONARY_SUFFIX)]
+
+
+_worker_tokenizer = None
+
+
+def _init_tokenization_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _tokenize_in_worker(chunk):
+    """
+    Tokenizes a chunk of lines (a pair of lists - paths and contents). Returns the paths, the tokens of the chunk
+    in the order of their first occurrence, the ids of tokens (positions in the list of tokens of the chunk)
+    and the number of tokens in each of the lines.
+    """
+    paths, contents = chunk
+    chunk_tokens = {}
+    ids = []
+    lengths = []
+    for text in contents:
+        tokens = _worker_tokenizer(text)
+        ids.extend(chunk_tokens.setdefault(token, len(chunk_tokens)) for token in tokens)
+        lengths.append(len(tokens))
+    return paths, list(chunk_tokens), np.array(ids, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
+class TokenCorpusBuilder(object):
+    """
+    Tokenizes a lines file once and stores it as a token corpus - the ids of tokens of all lines (int32),
+    the offsets of lines in the array of ids, the ids of files the lines belong to and the dictionary of tokens
+    (ids are assigned in the order of the first occurrence of tokens). The arrays are stored as .npy files,
+    so they can be memory mapped by the stages reading the corpus (see TokenCorpus).
+    If workers > 1, the chunks of lines are tokenized by a pool of processes.
+    """
+
+    def __init__(self, lines_file_path, output_prefix, separator, chunk_size=10 ** 5, workers=1,
+                 max_chunks_in_flight=None):
+        self.logger = logging.getLogger('pyccflex.prepare.token_corpus.TokenCorpusBuilder')
+        self.lines_file_path = lines_file_path
+        self.output_prefix = output_prefix
+        self.separator = separator
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_chunks_in_flight = max_chunks_in_flight
+
+    def _chunks(self, na_lines):
+        # contents are read as they are (the same as the feature extractors read them), lines which pandas would
+        # read as missing values are recorded so the stages reading lines with pandas can skip their tokens
+        lines_chunks = pd.read_csv(self.lines_file_path, sep=self.separator, encoding="utf-8",
+                                   usecols=["path", "contents"], dtype={"path": str, "contents": str},
+                                   keep_default_na=False, chunksize=self.chunk_size)
+        no_lines = 0
+        for lines_chunk in lines_chunks:
+            contents = list(lines_chunk.contents)
+            na_lines.extend(no_lines + i for i, text in enumerate(contents) if text in STR_NA_VALUES)
+            no_lines += len(contents)
+            yield list(lines_chunk.path), contents
+
+    def build(self):
+        token_ids_path, line_offsets_path, file_ids_path, dictionary_path = \
+            token_corpus_file_paths(self.output_prefix)
+        source_hash = file_hash(self.lines_file_path)
+        raw_path = token_ids_path + ".raw"
+
+        tokens = {}
+        files = {}
+        lengths = []
+        file_ids = []
+        na_lines = []
+        no_tokens = 0
+        tokenized_chunks = map_in_order(_tokenize_in_worker, self._chunks(na_lines), workers=self.workers,
+                                        max_chunks_in_flight=self.max_chunks_in_flight,
+                                        initializer=_init_tokenization_worker,
+                                        initargs=(code_stop_words_tokenizer,))
+        with open(raw_path, 'wb') as raw_file:
+            for paths, chunk_tokens, ids, chunk_lengths in tokenized_chunks:
+                mapping = np.array([tokens.setdefault(token, len(tokens)) for token in chunk_tokens], dtype=np.int32)
+                if len(ids) > 0:
+                    mapping[ids].tofile(raw_file)
+                lengths.append(chunk_lengths)
+                file_ids.append(np.array([files.setdefault(path, len(files)) for path in paths], dtype=np.int32))
+                no_tokens += len(ids)
+                self.logger.info("Tokenized {} lines ({} tokens in total)".format(
+                    sum(len(x) for x in lengths), no_tokens))
+
+        lengths = np.concatenate(lengths) if len(lengths) > 0 else np.zeros(0, dtype=np.int64)
+        line_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=line_offsets[1:])
+        token_ids = np.lib.format.open_memmap(token_ids_path + ".tmp", mode='w+', dtype=np.int32, shape=(no_tokens,))
+        if no_tokens > 0:
+            token_ids[:] = np.memmap(raw_path, dtype=np.int32, mode='r')
+        token_ids.flush()
+        del token_ids
+        os.replace(token_ids_path + ".tmp", token_ids_path)
+        os.remove(raw_path)
+        np.save(line_offsets_path, line_offsets)
+        np.save(file_ids_path, np.concatenate(file_ids) if len(file_ids) > 0 else np.zeros(0, dtype=np.int32))
+
+        # the dictionary is saved as the last one, the corpus is used only if its source hash matches the lines file
+        with open(dictionary_path + ".tmp", 'w', encoding="utf-8") as f:
+            json.dump({"source_hash": source_hash, "tokenizer": code_stop_words_tokenizer.__name__,
+                       "no_lines": len(lengths), "no_files": len(files), "na_lines": na_lines,
+                       "tokens": list(tokens)}, f)
+        os.replace(dictionary_path + ".tmp", dictionary_path)
+        self.logger.info("Saved {} tokens ({} distinct) of {} lines to {}".format(
+            no_tokens, len(tokens), len(lengths), token_ids_path))
+
+
+class TokenCorpus(object):
+    """
+    A token corpus built by TokenCorpusBuilder; the arrays are memory mapped (read only).
+    When pickled (e.g., sent to worker processes), only the prefix of files is stored and the arrays are mapped again.
+    """
+
+    def __init__(self, prefix):
+        self.logger = logging.getLogger('pyccflex.prepare.token_corpus.TokenCorpus')
+        self.prefix = prefix
+        token_ids_path, line_offsets_path, file_ids_path, dictionary_path = token_corpus_file_paths(prefix)
+        with open(dictionary_path, 'r', encoding="utf-8") as f:
+            dictionary = json.load(f)
+        self.source_hash = dictionary["source_hash"]
+        self.tokenizer = dictionary["tokenizer"]
+        self.no_files = dictionary["no_files"]
+        self.na_lines = np.array(dictionary["na_lines"], dtype=np.int64)
+        self.tokens = dictionary["tokens"]
+        self.token_ids = np.load(token_ids_path, mmap_mode='r')
+        self.line_offsets = np.load(line_offsets_path, mmap_mode='r')
+        self.file_ids = np.load(file_ids_path, mmap_mode='r')
+
+    def __getstate__(self):
+        return {"prefix": self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state["prefix"])
+
+    @property
+    def no_lines(self):
+        return len(self.line_offsets) - 1
+
+    def all_lines(self, skip_na_lines=False):
+        """
+        Returns the ids of tokens of all lines and the number of tokens of each line. If skip_na_lines is True,
+        lines read as missing values by pandas (e.g., NULL) have no tokens - as in the stages reading lines with pandas.
+        """
+        lengths = np.diff(self.line_offsets)
+        if not skip_na_lines or len(self.na_lines) == 0:
+            return self.token_ids, lengths
+        kept_lines = np.ones(len(lengths), dtype=bool)
+        kept_lines[self.na_lines] = False
+        return self.token_ids[np.repeat(kept_lines, lengths)], np.where(kept_lines, lengths, 0)
+
+    def lines(self, positions):
+        """Returns the ids of tokens of the lines at the given positions (concatenated) and their numbers of tokens."""
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.line_offsets[positions]
+        lengths = self.line_offsets[positions + 1] - starts
+        if len(positions) > 0 and np.all(np.diff(positions) == 1):
+            # consecutive lines - a single slice of the memory mapped array
+            return np.asarray(self.token_ids[starts[0]:starts[0] + lengths.sum()]), lengths
+        return self.token_ids[_ranges(starts, lengths)], lengths
+
+
+def load_token_corpus(prefix, lines_file_path):
+    """Returns the token corpus with the given prefix if it exists and was built for the lines file, None otherwise."""
+    if not all(os.path.isfile(x) for x in token_corpus_file_paths(prefix)):
+        return None
+    corpus = TokenCorpus(prefix)
+    if corpus.tokenizer != code_stop_words_tokenizer.__name__ or corpus.source_hash != file_hash(lines_file_path):
+        module_logger.warning("The token corpus {} is out of date, run tokenize_lines to rebuild it".format(prefix))
+        return None
+    module_logger.info("Using the token corpus {}".format(prefix))
+    return corpus
+
+
+def _ranges(starts, lengths):
+    """Returns the concatenation of ranges [start, start + length) for the given starts and lengths."""
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.arange(total, dtype=np.int64) + np.repeat(starts - (ends - lengths), lengths)
+
+
+class TokenMapping(object):
+    """
+    Maps the tokens of a corpus to the tokens of a base vocabulary - tokens outside of the vocabulary are replaced
+    with their signatures or skipped (the same as the tokenizers used by vocabulary_extractor and bag_of_words).
+    """
+
+    def __init__(self, corpus_tokens, vocab_tokens, token_signature_for_missing):
+        self.tokens = []
+        mapped_ids = {}
+        self.mapping = np.full(len(corpus_tokens), -1, dtype=np.int64)
+        for i, token in enumerate(corpus_tokens):
+            if token in vocab_tokens:
+                mapped = token
+            elif token_signature_for_missing:
+                mapped = token_signature(token)
+            else:
+                continue
+            if mapped not in mapped_ids:
+                mapped_ids[mapped] = len(self.tokens)
+                self.tokens.append(mapped)
+            self.mapping[i] = mapped_ids[mapped]
+
+    def map(self, ids, lengths):
+        """Maps ids of corpus tokens of lines; returns the mapped ids and the new numbers of tokens of the lines."""
+        mapped = self.mapping[ids]
+        kept = mapped >= 0
+        if np.all(kept):
+            return mapped, lengths
+        line_of_token = np.repeat(np.arange(len(lengths)), lengths)
+        return mapped[kept], np.bincount(line_of_token[kept], minlength=len(lengths))
+
+
+def ngrams(ids, lengths, n):
+    """
+    Returns n-grams of tokens (not crossing the boundaries of lines) as rows of an array of ids
+    and the indices of lines the n-grams come from.
+    """
+    line_of_token = np.repeat(np.arange(len(lengths)), lengths)
+    position_in_line = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    starts = np.flatnonzero(position_in_line <= lengths[line_of_token] - n)
+    grams = np.stack([ids[starts + k] for k in range(n)], axis=1) if n > 0 else np.zeros((0, 0), dtype=np.int64)
+    return grams, line_of_token[starts]
+
+
+def ngram_strings(grams, tokens):
+    """Returns unique n-grams as strings (tokens joined with spaces as done by CountVectorizer) and the inverse index."""
+    if len(grams) == 0:
+        return [], np.zeros(0, dtype=np.int64)
+    if len(tokens) ** grams.shape[1] < 2 ** 63:
+        # n-grams encoded as single integers are sorted much faster than rows of an array
+        keys = np.zeros(len(grams), dtype=np.int64)
+        for k in range(grams.shape[1]):
+            keys = keys * len(tokens) + grams[:, k]
+        _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        unique_grams = grams[index]
+    else:
+        unique_grams, inverse = np.unique(grams, axis=0, return_inverse=True)
+    return [" ".join(tokens[i] for i in gram) for gram in unique_grams], inverse.reshape(-1)
+
+
+def ngram_vocabulary(ids, lengths, tokens, min_ngrams, max_ngrams):
+    """Returns the sorted list of n-grams (as strings) present in the lines - the same as CountVectorizer.fit."""
+    result = set()
+    for n in range(min_ngrams, max_ngrams + 1):
+        strings, _ = ngram_strings(ngrams(ids, lengths, n)[0], tokens)
+        result.update(strings)
+    return sorted(result)
@@ -1,13 +1,27 @@
+import numpy as np
 import pandas as pd
 import collections
+import functools
+import logging
 import re
 import string
 
+from common.parallel import map_in_order
 
+module_logger = logging.getLogger('pyccflex.prepare.vocabularies')
+
+
+TOKEN_SIGNATURE_CACHE_SIZE = 2 ** 16
+
+_SIGNATURE_TRANSLATION = str.maketrans(string.ascii_letters + string.digits,
+                                       'a' * len(string.ascii_uppercase) + 'A' * len(string.ascii_uppercase) +
+                                       '0' * len(string.digits))
+
+
+@functools.lru_cache(maxsize=TOKEN_SIGNATURE_CACHE_SIZE)
 def token_signature(t):
-    trans_upper = str.maketrans(string.ascii_letters+string.digits,
-                                'a'*len(string.ascii_uppercase)+'A'*len(string.ascii_uppercase)+'0'*len(string.digits))
-    res = t.translate(trans_upper)
+    """Returns the signature of a token (the shape of its characters); the most recent signatures are memoized."""
+    res = t.translate(_SIGNATURE_TRANSLATION)
     res = re.sub(r'(.)\1{1,}', r'\1', res)
     a = "a" in res
     A = "A" in res
@@ -60,42 +74,157 @@ def code_stop_words_tokenizer(s):
     return split_s
 
 
+class VocabularyTokenizer(object):
+    """
+    Tokenizes a line keeping only the tokens of the (base) vocabulary; the remaining tokens are skipped
+    or replaced by their signatures if token_signature_for_missing is True.
+    """
+
+    def __init__(self, vocab_tokens, token_signature_for_missing=False, tokenizer=code_stop_words_tokenizer):
+        self.vocab_tokens = set(vocab_tokens)
+        self.token_signature_for_missing = token_signature_for_missing
+        self.tokenizer = tokenizer
+
+    def __call__(self, s):
+        result = []
+        for token in self.tokenizer(s):
+            if token in self.vocab_tokens:
+                result.append(token)
+            elif self.token_signature_for_missing:
+                result.append(token_signature(token))
+        return result
+
+
+_worker_tokenizer = None
+
+
+def _init_tokenization_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _count_tokens_in_worker(chunk):
+    """
+    Tokenizes a chunk of lines (a pair of lists - paths and contents) and returns a list of [path, counter] pairs,
+    one for each run of consecutive lines of the same file.
+    """
+    paths, contents = chunk
+    runs = []
+    for path, text in zip(paths, contents):
+        if len(runs) == 0 or runs[-1][0] != path:
+            runs.append([path, collections.Counter()])
+        runs[-1][1].update(_worker_tokenizer(text))
+    return runs
+
+
+class _FileNotGroupedError(Exception):
+    pass
+
+
 class VocabularyExtractor(object):
-    def __init__(self, lines_file_path, separator, tokenizer=code_stop_words_tokenizer):
+    """
+    Builds a vocabulary of tokens with their number of occurrences and the number (and percentage) of files
+    they are present in. The lines file is read in chunks (tokenized by a pool of processes if workers > 1)
+    in a single pass - lines of a file are stored one after another so only the tokens of the current file are kept.
+    If a token corpus of the lines file is given (see prepare.token_corpus), the tokens are counted using its ids.
+    """
+
+    def __init__(self, lines_file_path, separator, tokenizer=code_stop_words_tokenizer, chunk_size=10 ** 5,
+                 workers=1, max_chunks_in_flight=None, corpus=None):
+        self.logger = logging.getLogger('pyccflex.prepare.vocabularies.VocabularyExtractor')
         self.lines_file_path = lines_file_path
         self.vocab = None
         self.separator = separator
         self.tokenizer = tokenizer
-
-    def extract(self):
-        lines_data = pd.read_csv(self.lines_file_path, sep=self.separator, encoding="utf-8")
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_chunks_in_flight = max_chunks_in_flight
+        self.corpus = corpus
+
+    def _read_lines(self, chunksize=None):
+        return pd.read_csv(self.lines_file_path, sep=self.separator, encoding="utf-8", usecols=["path", "contents"],
+                           dtype={"contents": str}, chunksize=chunksize)
+
+    def _chunks(self):
+        for lines_chunk in self._read_lines(chunksize=self.chunk_size):
+            yield list(lines_chunk.path), list(lines_chunk.contents.fillna(""))
+
+    def _file_counters(self):
+        """Yields pairs (path, counter of tokens) for each file in the order of files in the lines file."""
+        runs = map_in_order(_count_tokens_in_worker, self._chunks(), workers=self.workers,
+                            max_chunks_in_flight=self.max_chunks_in_flight,
+                            initializer=_init_tokenization_worker, initargs=(self.tokenizer,))
+        done_files = set()
+        current_path = None
+        current_counter = None
+        for chunk_runs in runs:
+            for path, counter in chunk_runs:
+                if path == current_path:
+                    current_counter.update(counter)
+                    continue
+                if current_path is not None:
+                    done_files.add(current_path)
+                    yield current_path, current_counter
+                if path in done_files:
+                    raise _FileNotGroupedError(path)
+                current_path, current_counter = path, counter
+        if current_path is not None:
+            yield current_path, current_counter
+
+    def _file_counters_in_memory(self):
+        lines_data = self._read_lines()
         lines_data.contents = lines_data.contents.fillna("")
+        for path, contents in lines_data.groupby("path", sort=False).contents:
+            file_counter = collections.Counter()
+            for text in contents:
+                file_counter.update(self.tokenizer(text))
+            yield path, file_counter
 
+    def _count(self, file_counters):
         global_counter = collections.Counter()
-        file_counters = []
-        files = lines_data.path.unique()
-        no_files = len(files)
-
-        for file_path in files:
-            file_df = lines_data[lines_data['path'] == file_path]
-            file_contents = list(file_df.contents)
-            tokenized_file_contents = [self.tokenizer(x) for x in file_contents]
-
-            file_counter = collections.Counter()
-            list(map(lambda x: file_counter.update(x), tokenized_file_contents))
-            file_counters.append(file_counter)
+        files_counter = collections.Counter()
+        no_files = 0
+        for path, file_counter in file_counters:
             global_counter.update(file_counter)
+            files_counter.update(file_counter.keys())
+            no_files += 1
+        return global_counter, files_counter, no_files
+
+    def _extract_from_corpus(self):
+        ids, lengths = self.corpus.all_lines(skip_na_lines=True)
+        ids = np.asarray(ids, dtype=np.int64)
+        no_tokens = len(self.corpus.tokens)
+        file_of_token = np.repeat(np.asarray(self.corpus.file_ids, dtype=np.int64), lengths)
+        # tokens in the order of their first occurrence, the same as in the counters
+        present, first_occurrence = np.unique(ids, return_index=True)
+        present = present[np.argsort(first_occurrence, kind='stable')]
+        counts = np.bincount(ids, minlength=no_tokens)
+        count_files = np.bincount(np.unique(file_of_token * no_tokens + ids) % no_tokens, minlength=no_tokens)
+        self.vocab = pd.DataFrame({"token": [self.corpus.tokens[i] for i in present],
+                                   "count": counts[present],
+                                   "count_files": count_files[present],
+                                   "perc_files": count_files[present] / self.corpus.no_files},
+                                  columns=["token", "count", "count_files", "perc_files"]).sort_values(
+            by=['count'], ascending=False)
 
-        rows = []
-        for entry in global_counter.items():
-            token, global_count = entry
-            row = [token, global_count]
-            in_files = 0
-            for counter in file_counters:
-                in_files += 1 if counter[token] > 0 else 0
-            row.append(in_files)
-            row.append(in_files / no_files)
-            rows.append(row)
-
-        self.vocab = pd.DataFrame(
-            rows, columns=["token", "count", "count_files", "perc_files"]).sort_values(by=['count'], ascending=False)
+    def extract(self):
+        if self.corpus is not None and self.tokenizer is code_stop_words_tokenizer:
+            if np.all(np.diff(self.corpus.file_ids) >= 0):
+                self._extract_from_corpus()
+                return
+            self.logger.warning("Lines of files are not stored one after another, the token corpus is not used")
+        try:
+            global_counter, files_counter, no_files = self._count(self._file_counters())
+        except _FileNotGroupedError as e:
+            self.logger.warning("Lines of the file {} are not stored one after another, "
+                                "loading all the lines to group them by files".format(e))
+            global_counter, files_counter, no_files = self._count(self._file_counters_in_memory())
+
+        tokens = list(global_counter.keys())
+        count_files = [files_counter[token] for token in tokens]
+        self.vocab = pd.DataFrame({"token": tokens,
+                                   "count": [global_counter[token] for token in tokens],
+                                   "count_files": count_files,
+                                   "perc_files": [x / no_files for x in count_files]},
+                                  columns=["token", "count", "count_files", "perc_files"]).sort_values(
+            by=['count'], ascending=False)
@@ -77,6 +77,10 @@ $LINES && lines2csv "${TRAIN_LOCATION}" $REMOVE_DUPLICATE_PARAM \
 
 # === Feature exctraction for training set ===
 
+$FEATURES  && tokenize_lines "${TRAIN_LOCATION}-lines.csv" \
+	--locations_config $LOCATIONS_CONFIG \
+	--files_format_config $FILES_FORMAT_CONFIG
+
 $FEATURES  && vocabulary_extractor "${TRAIN_LOCATION}-lines.csv"  "cpp-vocabulary.csv" \
 	--skip_generating_base_vocabulary \
 	--top_words_threshold 200 \
@@ -235,6 +239,10 @@ $FEATURES  && predefined_manual_features "$CLASSIFY_LOCATION" \
 	--manual_features_config $MANUAL_FEATURES_CONFIG
 
 # Bag of words
+$FEATURES && tokenize_lines "${CLASSIFY_LOCATION}-lines.csv" \
+	--locations_config $LOCATIONS_CONFIG \
+	--files_format_config $FILES_FORMAT_CONFIG
+
 $FEATURES && bag_of_words "${CLASSIFY_LOCATION}" "cpp-vocabulary.csv" \
 	--min_ngrams $MIN_NGRAM --max_ngrams $MAX_NGRAM \
 	--token_signature_for_missing \
@@ -7,14 +7,18 @@ setup(name='pyccflex',
       author='',
       author_email='',
       license='Apache-2.0',
-      packages=['common', 'prepare'],
+      packages=['ccflex', 'common', 'prepare'],
       install_requires=[
           'pandas',
           'numpy',
+          'scipy',
           'scikit-learn',
           'modAL',
           'ggplot'
       ],
+      extras_require={
+          'columnar': ['pyarrow']
+      },
       scripts=[
           'bin/create_workspace',
           'bin/lines2csv',
@@ -38,5 +42,10 @@ setup(name='pyccflex',
           'bin/delete_processing_file',
           'bin/lines_oracle',
           'bin/evaluate_accuracy',
-          'bin/sample_lines'],
+          'bin/sample_lines',
+          'bin/convert_features',
+          'bin/tokenize_lines',
+          'bin/run_pipeline',
+          'bin/classify_server',
+          'bin/ccflex'],
       zip_safe=False)